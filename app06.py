@@ -1,22 +1,24 @@
 # -*- coding: utf-8 -*-
-from crewai import Crew, Process
-from trip_components import TripAgents, TripTasks
-from trip_utils import capture_output
+import functools
 import os
 import streamlit as st
-import time
-import markdown2
-from reportlab.lib.pagesizes import A4
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle
-from reportlab.lib import colors
-from reportlab.lib.units import cm
-import shutil
-from datetime import datetime
-
-# Diretório de saída
-OUTPUT_DIR = os.path.join(os.getcwd(), "viagem")
-os.makedirs(OUTPUT_DIR, exist_ok=True)
+from dotenv import load_dotenv
+
+@st.cache_resource(show_spinner=False)
+def load_environment():
+    """Lê o .env uma vez por processo, antes dos módulos que leem a configuração"""
+    load_dotenv()
+
+load_environment()
+
+# Só módulos leves a cada execução do script: crewai (trip_crew), reportlab (trip_pdf)
+# e altair são importados na primeira vez que forem usados
+from trip_jobs import ACTIVE_STATES, CANCELLED, DONE, FAILED, JobManager, QueueFullError
+from trip_markdown import load_markdown
+from trip_ratelimit import limiter_metrics
+from trip_store import get_trip_store
+from trip_tracing import TRACE_FILE, aggregate, prometheus_text, read_jsonl, waterfall
+from trip_workspace import WORKSPACES_DIR, Workspace, draft_file, list_workspaces, read_bytes
 
 # Arquivos a gerar
 files = {
@@ -26,165 +28,100 @@ files = {
     "relatorio_logistica.md": "relatorio_logistica.pdf"
 }
 
+# Abas de relatórios, na ordem exibida
+report_tabs = [
+    ("🗺️ Roteiro de Viagem", "roteiro_viagem.md"),
+    ("📖 Guia de Comunicação", "guia_comunicacao.md"),
+    ("📍 Relatório Cidade", "relatorio_local.md"),
+    ("✈️ Relatório Logística", "relatorio_logistica.md"),
+]
+
 # Configurações Streamlit
 st.set_page_config(page_title="Planejamento de Viagens", page_icon="🌍")
 st.title("🌍 Planejamento de Viagens")
 
-# --------------------- CLASSE DE EXECUÇÃO DA VIAGEM ---------------------
-class TripCrew:
-    def __init__(self, from_city, destination_city, date_from, date_to, interests):
-        self.from_city = from_city
-        self.destination_city = destination_city
-        self.date_from = date_from
-        self.date_to = date_to
-        self.interests = interests
-
-    def run(self):
-        agents = TripAgents()
-        tasks = TripTasks()
-
-        city_info_agent = agents.city_info_agent()
-        logistics_expert_agent = agents.logistics_expert_agent()
-        itinerary_planner_agent = agents.itinerary_planner_agent()
-        language_guide_agent = agents.language_guide_agent()
-
-        city_info = tasks.city_info_task(
-            city_info_agent,
-            self.from_city,
-            self.destination_city,
-            self.interests,
-            self.date_from,
-            self.date_to
-        )
-
-        plan_logistics = tasks.plan_logistics_task(
-            [city_info],
-            logistics_expert_agent,
-            self.destination_city,
-            self.interests,
-            self.date_from,
-            self.date_to
-        )
-
-        build_itinerary = tasks.build_itinerary_task(
-            [city_info, plan_logistics],
-            itinerary_planner_agent,
-            self.destination_city,
-            self.interests,
-            self.date_from,
-            self.date_to
-        )
-
-        language_guide = tasks.language_guide_task(
-            [build_itinerary],
-            language_guide_agent,
-            self.destination_city
-        )
-
-        crew = Crew(
-            agents=[city_info_agent, logistics_expert_agent, itinerary_planner_agent, language_guide_agent],
-            tasks=[city_info, plan_logistics, build_itinerary, language_guide],
-            process=Process.sequential,
-            full_output=True,
-            max_rpm=15,
-            verbose=False
-        )
-
-        return crew.kickoff()
-
-# --------------------- FUNÇÕES AUXILIARES ---------------------
-def load_markdown(file_path):
-    """Carrega o markdown de um arquivo"""
-    try:
-        with open(file_path, 'r', encoding='utf-8') as f:
-            content = f.read().replace("```markdown", "").replace("```", "")
-            return content
-    except Exception as e:
-        print(f"Erro ao carregar arquivo: {str(e)}")
-        return None
-
-def convert_md_to_pdf(file_md, file_pdf, title="Guia de Viagem"):
-    # Carrega markdown
-    text_md = load_markdown(file_md)
-    if text_md is None:
-        return
-
-    # Cria documento
-    doc = SimpleDocTemplate(file_pdf, pagesize=A4,
-                            rightMargin=2*cm, leftMargin=2*cm,
-                            topMargin=2*cm, bottomMargin=2*cm)
-
-    elements = []
-
-    # Estilos customizados
-    styles = getSampleStyleSheet()
-    styles.add(ParagraphStyle(name='CustomTitle', fontSize=20, leading=24, spaceAfter=16, textColor=colors.HexColor('#004080')))
-    styles.add(ParagraphStyle(name='CustomHeading2', fontSize=16, leading=20, spaceAfter=12, textColor=colors.HexColor('#004080')))
-    styles.add(ParagraphStyle(name='CustomBodyText', fontSize=12, leading=16, spaceAfter=8))
-    styles.add(ParagraphStyle(name='CustomBullet', fontSize=12, leading=16, leftIndent=20, bulletIndent=10))
-    styles.add(ParagraphStyle(name='CustomBox', fontSize=12, leading=16, backColor=colors.HexColor('#e6f0ff'), borderPadding=6, spaceAfter=10))
-
-    # Adiciona título principal
-    elements.append(Paragraph(title, styles['CustomTitle']))
-    elements.append(Spacer(1,12))
-
-    # Quebra o markdown em linhas
-    lines = text_md.split('\n')
-    buffer_lines = []
-
-    for line in lines:
-        line = line.strip()
-        if not line:
-            if buffer_lines:
-                elements.append(Paragraph(' '.join(buffer_lines), styles['CustomBodyText']))
-                buffer_lines = []
-            elements.append(Spacer(1,6))
-            continue
-        if line.startswith('###'):
-            if buffer_lines:
-                elements.append(Paragraph(' '.join(buffer_lines), styles['CustomBodyText']))
-                buffer_lines = []
-            elements.append(Paragraph(line[3:].strip(), styles['CustomHeading2']))
-        elif line.startswith('##'):
-            if buffer_lines:
-                elements.append(Paragraph(' '.join(buffer_lines), styles['CustomBodyText']))
-                buffer_lines = []
-            elements.append(Paragraph(line[2:].strip(), styles['CustomHeading2']))
-        elif line.startswith('#'):
-            if buffer_lines:
-                elements.append(Paragraph(' '.join(buffer_lines), styles['CustomBodyText']))
-                buffer_lines = []
-            elements.append(Paragraph(line[1:].strip(), styles['CustomTitle']))
-        elif line.startswith('- '):
-            if buffer_lines:
-                elements.append(Paragraph(' '.join(buffer_lines), styles['CustomBodyText']))
-                buffer_lines = []
-            elements.append(Paragraph(line[2:].strip(), styles['CustomBullet'], bulletText='•'))
-        else:
-            buffer_lines.append(line)
-
-    # Adiciona qualquer buffer restante
-    if buffer_lines:
-        elements.append(Paragraph(' '.join(buffer_lines), styles['CustomBodyText']))
-
-    # Exemplo de tabela estilizada
-    table_data = [['Item', 'Detalhes', 'Custo Estimado']]
-    table_style = TableStyle([
-        ('BACKGROUND', (0,0), (-1,0), colors.HexColor('#004080')),
-        ('TEXTCOLOR',(0,0),(-1,0),colors.white),
-        ('ALIGN',(0,0),(-1,-1),'LEFT'),
-        ('FONTNAME', (0,0), (-1,0), 'Helvetica-Bold'),
-        ('FONTSIZE', (0,0), (-1,0), 12),
-        ('BOTTOMPADDING', (0,0), (-1,0), 6),
-        ('BACKGROUND',(0,1),(-1,-1),colors.HexColor('#e6f0ff')),
-        ('GRID', (0,0), (-1,-1), 0.5, colors.grey),
-    ])
-    table = Table(table_data, style=table_style, hAlign='LEFT')
-    elements.append(Spacer(1,12))
-    elements.append(table)
-
-    # Gera PDF
-    doc.build(elements)
+# --------------------- FILA DE GERAÇÕES ---------------------
+@st.cache_resource
+def get_job_manager():
+    """Fila de gerações em segundo plano, compartilhada por todas as sessões"""
+    return JobManager()
+
+job_manager = get_job_manager()
+trip_store = get_trip_store()
+
+def open_history_trip(trip_id):
+    """Exibe uma viagem do histórico no lugar da geração atual"""
+    from trip_crew import restore_trip
+
+    workspace = restore_trip(trip_id, files, trip_store)
+    st.session_state["history_workspace"] = workspace.id
+    st.session_state.pop("job_id", None)
+    if "job" in st.query_params:
+        del st.query_params["job"]
+
+@st.cache_data(max_entries=64, show_spinner=False)
+def read_report(path, mtime):
+    """Markdown de um relatório, lido de novo só quando o arquivo muda (``mtime`` faz parte da chave)"""
+    return load_markdown(path)
+
+def show_reports(run_dir, ready=None):
+    """Abas com os relatórios; com ``ready``, só os prontos são exibidos e os demais mostram o rascunho"""
+    tabs = st.tabs([label for label, _ in report_tabs])
+    for tab, (_, md_file) in zip(tabs, report_tabs):
+        with tab:
+            draft_path = os.path.join(run_dir, draft_file(md_file))
+            if ready is None or md_file in ready:
+                md_path = os.path.join(run_dir, md_file)
+                st.markdown(read_report(md_path, os.path.getmtime(md_path)))
+            elif os.path.exists(draft_path):
+                st.caption("✍️ Escrevendo...")
+                with open(draft_path, "r", encoding="utf-8", errors="replace") as f:
+                    st.markdown(f.read())
+            else:
+                st.info("⏳ Esta parte do roteiro ainda está sendo preparada...")
+
+@st.cache_data(max_entries=16, show_spinner=False)
+def trace_summary(trace_path, mtime):
+    """Totais por tipo de span, linhas da cascata e métricas Prometheus de um trace"""
+    spans = read_jsonl(trace_path)
+    totals = aggregate(spans)
+    by_kind = {}
+    for (kind, _), values in totals.items():
+        row = by_kind.setdefault(kind, {"tipo": kind, "spans": 0, "segundos": 0.0, "tokens": 0, "cache": 0, "retentativas": 0})
+        row["spans"] += values["count"]
+        row["segundos"] += values["seconds"]
+        row["tokens"] += values["tokens"]
+        row["cache"] += values["cache_hits"]
+        row["retentativas"] += values["retries"]
+    rows = [dict(row, segundos=round(row["segundos"], 1)) for row in by_kind.values()]
+    return rows, waterfall(spans), prometheus_text(totals)
+
+def show_trace(trace_path):
+    """Resumo de desempenho de uma geração: totais por tipo de span e cascata no tempo"""
+    import altair as alt
+
+    by_kind, rows, metrics = trace_summary(trace_path, os.path.getmtime(trace_path))
+    st.dataframe(by_kind, hide_index=True)
+
+    chart = alt.Chart(alt.Data(values=rows)).mark_bar().encode(
+        x=alt.X("start:Q", title="segundos"),
+        x2="end:Q",
+        y=alt.Y("label:N", sort=None, title=None),
+        color=alt.Color("kind:N", title="tipo"),
+        tooltip=["label:N", "kind:N", "seconds:Q", "error:N"],
+    ).properties(height=max(200, 16 * len(rows)))
+    st.altair_chart(chart, use_container_width=True)
+
+    st.download_button("⬇️ Métricas (Prometheus)", metrics, file_name="trip_metrics.prom", mime="text/plain")
+    st.download_button("⬇️ Spans (JSON lines)", functools.partial(read_bytes, trace_path), file_name=TRACE_FILE, mime="application/jsonl")
+
+# --------------------- HISTÓRICO DE VIAGENS ---------------------
+with st.sidebar:
+    st.subheader("🕘 Viagens anteriores")
+    for trip in trip_store.recent(limit=20):
+        label = f"{trip['destination_city']} · {trip['date_from']} → {trip['date_to']}"
+        if st.button(label, key=f"trip_{trip['id']}", help=trip["interests"], use_container_width=True):
+            open_history_trip(trip["id"])
 
 # --------------------- FORMULÁRIO STREAMLIT ---------------------
 with st.form("trip_form"):
@@ -197,6 +134,7 @@ with st.form("trip_form"):
     with col2:
         date_to = st.date_input("Data de retorno:")
     interests = st.text_area("Interesses e preferências:", placeholder="Ex: viagem romântica, museus, gastronomia local...")
+    regenerate = st.checkbox("Gerar um novo roteiro mesmo que já exista no histórico")
     submitted = st.form_submit_button("Gerar roteiro")
 
 # --------------------- EXECUÇÃO DO ROTEIRO ---------------------
@@ -207,60 +145,136 @@ if submitted:
     if not (from_city and destination_city and date_from and date_to and interests):
         st.warning("Por favor, preencha todos os campos do formulário")
     else:
-        with st.status("Montando seu roteiro... Isso pode levar alguns instantes...") as status:
-            try:
-                process_container = st.container(height=300, border=True)
-                output_container = process_container.container()
-
-                with capture_output(output_container) as container_content:
-                    trip_crew = TripCrew(from_city, destination_city, date_from_str, date_to_str, interests)
-                    result = trip_crew.run()
-                    status.update(label="✅ Roteiro gerado com sucesso!", state="complete", expanded=False)
-            except Exception as e:
-                status.update(label="Ocorreu um erro", state="error")
-                st.error(f"Erro: {str(e)}")
-                st.stop()
-
-        # Converter markdowns para PDF
-        for md_file, pdf_file in files.items():
-            convert_md_to_pdf(md_file, os.path.join(OUTPUT_DIR, pdf_file))
+        from trip_crew import generate_trip, trip_inputs
 
+        inputs = trip_inputs(from_city, destination_city, date_from_str, date_to_str, interests)
+        previous = None if regenerate else trip_store.find_identical(inputs)
+        if previous is not None:
+            open_history_trip(previous["id"])
+            st.info("Este roteiro já foi gerado antes e foi recuperado do histórico")
+        else:
+            try:
+                job_id = job_manager.submit(generate_trip, dict(inputs, files=files, use_history=not regenerate))
+                # Guardar o job na URL permite reabrir a geração após recarregar a página
+                st.session_state["job_id"] = job_id
+                st.session_state.pop("history_workspace", None)
+                st.query_params["job"] = job_id
+            except QueueFullError as e:
+                st.warning(str(e))
+
+# --------------------- ACOMPANHAMENTO DA GERAÇÃO ---------------------
+@st.fragment(run_every=2)
+def show_job_progress(job_id):
+    """Atualiza o log e os relatórios já prontos até a geração terminar"""
+    job = job_manager.status(job_id)
+    if job["status"] not in ACTIVE_STATES:
+        st.rerun()
+
+    label = "Aguardando na fila..." if job["status"] == "queued" else "Montando seu roteiro... Isso pode levar alguns instantes..."
+    with st.status(label, expanded=True):
+        process_container = st.container(height=300, border=True)
+        process_container.text(job_manager.log_tail(job_id))
+    if st.button("Cancelar geração"):
+        job_manager.cancel(job_id)
+
+    # Cada aba é preenchida assim que sua tarefa termina
+    progress = job["progress"] or {}
+    if progress.get("workspace"):
+        show_reports(os.path.join(WORKSPACES_DIR, progress["workspace"]), ready=progress["reports"])
+        if progress["pdfs"]:
+            st.caption("📄 PDFs prontos: " + ", ".join(files[md_file] for md_file in progress["pdfs"]))
+
+job_id = st.session_state.get("job_id") or st.query_params.get("job")
+job = job_manager.status(job_id) if job_id else None
+
+if job and job["status"] in ACTIVE_STATES:
+    show_job_progress(job_id)
+elif job and job["status"] == DONE:
+    st.success("✅ Roteiro gerado com sucesso!")
+    report = job["result"]["report"]
+    if report:
+        st.caption(
+            f"⏱️ Caminho crítico: {' → '.join(report['critical_path'])} "
+            f"({report['wall_seconds']:.0f}s no total, {report['serial_seconds']:.0f}s se fosse sequencial)"
+        )
+    pdf_times = [
+        f"{md_file} (sem mudanças)" if pdf["skipped"] else f"{md_file} ({pdf['seconds']:.1f}s)"
+        for md_file, pdf in (job["result"].get("pdfs") or {}).items()
+    ]
+    if pdf_times:
+        st.caption("📄 PDFs: " + ", ".join(pdf_times))
+    for md_file, error in (job["result"].get("pdf_errors") or {}).items():
+        st.warning(f"Não foi possível gerar o PDF de {md_file}: {error}")
+    if st.session_state.get("notified_job") != job_id:
+        st.session_state["notified_job"] = job_id
         st.toast("Arquivos PDFs salvos no diretório", icon="✅")
-
-        # Mover os MDs para pasta
-        for src_file in files.keys():
-            if os.path.exists(src_file):
-                shutil.move(src_file, os.path.join(OUTPUT_DIR, src_file))
+elif job and job["status"] == FAILED:
+    st.error(f"Erro: {job['error']}")
+elif job and job["status"] == CANCELLED:
+    st.warning("Geração cancelada")
+elif job:
+    st.warning("A geração foi interrompida antes de terminar. Por favor, tente novamente.")
 
 # --------------------- EXIBIÇÃO DE RELATÓRIOS ---------------------
-files_md = [md for md in files if os.path.exists(os.path.join(OUTPUT_DIR, md))]
+# Cada geração tem sua própria pasta: a escolhida no histórico, a do job desta sessão ou a mais recente
+# (durante uma geração, os relatórios aparecem no acompanhamento acima)
+if st.session_state.get("history_workspace"):
+    run_dir = os.path.join(WORKSPACES_DIR, st.session_state["history_workspace"])
+elif job and job["status"] == DONE:
+    run_dir = os.path.join(WORKSPACES_DIR, job["result"]["workspace"])
+elif job and job["status"] in ACTIVE_STATES:
+    run_dir = None
+else:
+    workspaces = list_workspaces()
+    run_dir = workspaces[0].path if workspaces else None
+
+files_md = [md for md in files if run_dir and os.path.exists(os.path.join(run_dir, md))]
 if len(files_md) == len(files):
-    if not submitted:
+    if st.session_state.get("history_workspace"):
+        st.info("Exibindo viagem do histórico")
+    elif not (job and job["status"] == DONE):
         st.info("Exibindo relatórios da geração anterior")
-    tab1, tab2, tab3, tab4 = st.tabs(["🗺️ Roteiro de Viagem", "📖 Guia de Comunicação", "📍 Relatório Cidade", "✈️ Relatório Logística"])
-    with tab1:
-        st.markdown(load_markdown(os.path.join(OUTPUT_DIR, "roteiro_viagem.md")))
-    with tab2:
-        st.markdown(load_markdown(os.path.join(OUTPUT_DIR, "guia_comunicacao.md")))
-    with tab3:
-        st.markdown(load_markdown(os.path.join(OUTPUT_DIR, "relatorio_local.md")))
-    with tab4:
-        st.markdown(load_markdown(os.path.join(OUTPUT_DIR, "relatorio_logistica.md")))
+    show_reports(run_dir)
+
+# --------------------- DESEMPENHO DA GERAÇÃO ---------------------
+trace_path = os.path.join(run_dir, TRACE_FILE) if run_dir else None
+if trace_path and os.path.exists(trace_path):
+    with st.sidebar:
+        with st.expander("⏱️ Desempenho da geração"):
+            show_trace(trace_path)
+
+# Filas dos limites de taxa deste processo (compartilhados por todas as sessões e jobs)
+limiters = limiter_metrics()
+if limiters:
+    with st.sidebar:
+        with st.expander("🚦 Limites de taxa"):
+            st.dataframe(list(limiters.values()), hide_index=True)
 
 # --------------------- LINKS DE DOWNLOAD E ABERTURA ---------------------
+def bundle_bytes(run_dir, pdf_files):
+    """Zip com todos os PDFs da geração, montado em disco só no clique"""
+    return read_bytes(Workspace(run_dir).bundle(pdf_files))
+
 st.subheader("📂 Seus PDFs gerados")
-for md_file, pdf_file in files.items():
-    pdf_path = os.path.join(OUTPUT_DIR, pdf_file)
-    if os.path.exists(pdf_path):
-        with open(pdf_path, "rb") as f:
-            pdf_bytes = f.read()
-            st.download_button(
-                label=f"⬇️ Baixar {pdf_file}",
-                data=pdf_bytes,
-                file_name=pdf_file,
-                mime="application/pdf"
-            )
-        st.markdown(f"[📄 Abrir {pdf_file}](viagem/{pdf_file})", unsafe_allow_html=True)
+# Os bytes só são lidos quando o botão é clicado (e ficam num cache curto, compartilhado pelas sessões)
+pdf_files = [pdf_file for pdf_file in files.values() if run_dir and os.path.exists(os.path.join(run_dir, pdf_file))]
+for pdf_file in pdf_files:
+    pdf_path = os.path.join(run_dir, pdf_file)
+    st.download_button(
+        label=f"⬇️ Baixar {pdf_file}",
+        data=functools.partial(read_bytes, pdf_path),
+        file_name=pdf_file,
+        mime="application/pdf"
+    )
+    pdf_link = os.path.relpath(pdf_path).replace(os.sep, "/")
+    st.markdown(f"[📄 Abrir {pdf_file}]({pdf_link})", unsafe_allow_html=True)
+if len(pdf_files) == len(files):
+    st.download_button(
+        label="🗜️ Baixar todos os PDFs (.zip)",
+        data=functools.partial(bundle_bytes, run_dir, tuple(pdf_files)),
+        file_name=f"roteiro_{os.path.basename(run_dir)}.zip",
+        mime="application/zip"
+    )
 
 
 
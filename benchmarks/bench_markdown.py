@@ -0,0 +1,89 @@
+"""Benchmark do compilador markdown -> flowables em relatórios grandes.
+
+Gera roteiros sintéticos de tamanho crescente e mede o tempo de compilação
+(e, com --pdf, o de geração do PDF completo). Se o compilador escala
+linearmente, o custo por KB fica estável entre os tamanhos.
+
+    python benchmarks/bench_markdown.py --sizes 10 40 160 640 --pdf
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.units import cm
+
+from trip_markdown import compile_markdown
+from trip_pdf import convert_md_to_pdf, get_stylesheet
+
+
+DAY = """## Dia {day}: Centro histórico e gastronomia
+
+Manhã com **visita guiada** ao centro histórico, seguida de almoço em um *bistrô local*.
+Mais detalhes em [guia oficial](https://example.com/dia-{day}).
+
+1. Café da manhã no hotel
+2. Caminhada até a praça principal
+3. Museu de arte (`ingresso antecipado`)
+
+- Transporte: metrô linha 2
+  - Alternativa: táxi por aplicativo
+- Clima previsto: 18°C, sol entre nuvens
+
+| Item | Detalhes | Custo Estimado |
+|------|----------|----------------|
+| Museu | Entrada inteira | R$ 80 |
+| Almoço | Menu executivo | R$ 120 |
+| Transporte | Bilhete diário | R$ 35 |
+
+> Dica: reserve restaurantes com antecedência aos fins de semana.
+
+"""
+
+
+def make_report(days):
+    return "```markdown\n# Roteiro de Viagem\n\n" + "".join(DAY.format(day=d) for d in range(1, days + 1)) + "```"
+
+
+def best_of(fn, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 40, 160, 640], help="dias por relatório")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--pdf", action="store_true", help="mede também a geração do PDF")
+    args = parser.parse_args()
+
+    styles = get_stylesheet()
+    width = A4[0] - 4 * cm
+    print(f"{'dias':>6} {'KB':>8} {'compilar (ms)':>14} {'µs/KB':>8}" + (f" {'PDF (ms)':>10} {'µs/KB':>8}" if args.pdf else ""))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for days in args.sizes:
+            text = make_report(days)
+            kb = len(text.encode("utf-8")) / 1024
+            compile_time = best_of(lambda: compile_markdown(text, styles, width), args.repeat)
+            line = f"{days:>6} {kb:>8.0f} {compile_time * 1000:>14.1f} {compile_time * 1e6 / kb:>8.1f}"
+
+            if args.pdf:
+                file_md = os.path.join(tmp, "roteiro.md")
+                with open(file_md, "w", encoding="utf-8") as f:
+                    f.write(text)
+                pdf_time = best_of(lambda: convert_md_to_pdf(file_md, os.path.join(tmp, "roteiro.pdf")), args.repeat)
+                line += f" {pdf_time * 1000:>10.1f} {pdf_time * 1e6 / kb:>8.1f}"
+            print(line)
+
+
+if __name__ == "__main__":
+    main()
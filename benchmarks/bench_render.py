@@ -0,0 +1,77 @@
+"""Compara os backends de PDF (reportlab e WeasyPrint) nos mesmos relatórios.
+
+Para cada backend e relatório mede a latência (melhor de N), o pico de
+memória Python (tracemalloc) e o tamanho do PDF gerado. Use relatórios reais
+de uma geração (--files viagem/<id>/*.md) ou os sintéticos (--days).
+
+    python benchmarks/bench_render.py --files viagem/*/roteiro_viagem.md
+    TRIP_PDF_BACKENDS="roteiro_viagem.md=weasyprint" streamlit run app06.py
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_markdown import make_report
+from trip_pdf import RENDERERS, load_markdown
+
+
+def measure(renderer, text_md, file_pdf, repeat):
+    renderer.render(text_md, file_pdf, "Guia de Viagem")  # aquece estilos/CSS em cache
+
+    latency = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        renderer.render(text_md, file_pdf, "Guia de Viagem")
+        latency = min(latency, time.perf_counter() - start)
+
+    tracemalloc.start()
+    try:
+        renderer.render(text_md, file_pdf, "Guia de Viagem")
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return latency, peak, os.path.getsize(file_pdf)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--files", nargs="*", default=[], help="markdowns de relatórios reais")
+    parser.add_argument("--days", type=int, nargs="*", default=[5, 30], help="tamanhos dos roteiros sintéticos")
+    parser.add_argument("--backends", nargs="+", default=list(RENDERERS))
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    samples = [(os.path.basename(path), load_markdown(path)) for path in args.files]
+    samples += [(f"sintetico_{days}d.md", make_report(days)) for days in (args.days if not args.files else [])]
+
+    renderers = []
+    for name in args.backends:
+        renderer = RENDERERS.get(name)
+        if renderer is None or not renderer.available():
+            print(f"# backend '{name}' indisponível, ignorado")
+            continue
+        renderers.append(renderer)
+
+    print(f"{'relatório':<28} {'backend':<11} {'ms':>9} {'pico (KB)':>10} {'PDF (KB)':>9}")
+    tmp = tempfile.mkdtemp()
+    try:
+        for label, text_md in samples:
+            results = []
+            for renderer in renderers:
+                latency, peak, size = measure(renderer, text_md, os.path.join(tmp, "out.pdf"), args.repeat)
+                results.append((latency, renderer.name))
+                print(f"{label:<28} {renderer.name:<11} {latency * 1000:>9.1f} {peak / 1024:>10.0f} {size / 1024:>9.1f}")
+            if len(results) > 1:
+                print(f"{'':<28} mais rápido: {min(results)[1]}")
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
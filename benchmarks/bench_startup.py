@@ -0,0 +1,112 @@
+"""Mede o custo de abrir o app e de cada nova execução do script do Streamlit.
+
+Em um processo novo (para os imports contarem de verdade) roda o app06.py
+com o AppTest do Streamlit: a primeira execução paga os imports e os caches;
+as seguintes são o que cada clique ou atualização da página custa. A pasta
+de gerações é temporária e recebe relatórios sintéticos, para que a exibição
+dos relatórios também seja medida. Também mostra quanto custa importar cada
+módulo pesado em um processo limpo.
+
+    python benchmarks/bench_startup.py --reruns 20
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCH_DIR)
+
+# Módulos que o app só importa quando precisa
+HEAVY_MODULES = ["trip_crew", "trip_pdf", "altair", "crewai", "reportlab", "reportlab.platypus"]
+
+
+def import_seconds(module):
+    """Tempo de ``import module`` em um interpretador limpo."""
+    code = f"import time; start = time.perf_counter(); import {module}; print(time.perf_counter() - start)"
+    output = subprocess.run([sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True, check=True)
+    return float(output.stdout.strip().splitlines()[-1])
+
+
+def seed_workspace(workspaces_dir, days):
+    """Cria uma geração com os quatro relatórios sintéticos."""
+    sys.path[:0] = [ROOT, BENCH_DIR]
+    from fakes import fake_report
+    from trip_workspace import Workspace
+
+    workspace = Workspace.for_inputs({"destination_city": "Lisboa", "days": days}, root=workspaces_dir)
+    for md_file in ("roteiro_viagem.md", "guia_comunicacao.md", "relatorio_local.md", "relatorio_logistica.md"):
+        workspace.write_text(md_file, fake_report(md_file, days))
+
+
+def measure_app(reruns):
+    """Roda no processo filho: primeira execução e execuções seguintes do app."""
+    from streamlit.testing.v1 import AppTest
+
+    start = time.perf_counter()
+    app = AppTest.from_file(os.path.join(ROOT, "app06.py"), default_timeout=120)
+    app.run()
+    first = time.perf_counter() - start
+    if app.exception:
+        raise RuntimeError(app.exception[0].message)
+
+    times = []
+    for _ in range(reruns):
+        start = time.perf_counter()
+        app.run()
+        times.append(time.perf_counter() - start)
+    return {
+        "first_run_seconds": first,
+        "rerun_median_ms": statistics.median(times) * 1000,
+        "rerun_max_ms": max(times) * 1000,
+        "heavy_modules_loaded": sorted(m for m in HEAVY_MODULES if m in sys.modules),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--reruns", type=int, default=20)
+    parser.add_argument("--report-days", type=int, default=14, help="tamanho dos relatórios exibidos")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(measure_app(args.reruns)))
+        return
+
+    work_dir = tempfile.mkdtemp(prefix="trip-startup-")
+    env = dict(
+        os.environ,
+        TRIP_CACHE_DIR=os.path.join(work_dir, "cache"),
+        TRIP_WORKSPACES_DIR=os.path.join(work_dir, "viagem"),
+    )
+    try:
+        seed_workspace(env["TRIP_WORKSPACES_DIR"], args.report_days)
+        output = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--child", "--reruns", str(args.reruns)],
+            cwd=ROOT, env=env, capture_output=True, text=True,
+        )
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    if output.returncode != 0:
+        sys.exit(output.stderr)
+    result = json.loads(output.stdout.strip().splitlines()[-1])
+
+    print(f"{'primeira execução':<28} {result['first_run_seconds']:>9.2f} s")
+    print(f"{'nova execução (mediana)':<28} {result['rerun_median_ms']:>9.1f} ms")
+    print(f"{'nova execução (máximo)':<28} {result['rerun_max_ms']:>9.1f} ms")
+    print(f"módulos pesados carregados pelo app: {', '.join(result['heavy_modules_loaded']) or 'nenhum'}")
+    # Abrir o app e exibir relatórios prontos não pode importar o reportlab (nem o resto)
+    assert not result["heavy_modules_loaded"], f"o app importou {result['heavy_modules_loaded']} ao abrir"
+    print("\nimport em processo limpo:")
+    for module in HEAVY_MODULES:
+        print(f"  {module:<26} {import_seconds(module):>9.2f} s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,233 @@
+"""Benchmark offline de ponta a ponta, com LLM e pesquisa falsos.
+
+Mede a latência da crew (total e por tarefa), as chamadas de ferramentas e
+do LLM, a vazão de geração de PDFs, o custo da captura do log e o pico de
+memória (RSS). Nada acessa a rede nem gasta cota. Os resultados podem ser
+salvos como linha de base em JSON e comparados depois:
+
+    python benchmarks/bench_suite.py --runs 3 --save benchmarks/baseline.json
+    python benchmarks/bench_suite.py --runs 3 --compare benchmarks/baseline.json
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from collections import Counter
+from io import StringIO
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# Configuração determinística: sem caches, memo, hedge nem limites de taxa; rastreamento ligado
+OFFLINE_ENV = {
+    "TRIP_SEARCH_CACHE": "0",
+    "TRIP_LLM_CACHE": "0",
+    "TRIP_TASK_MEMO": "0",
+    "TRIP_SEARCH_HEDGE": "0",
+    "TRIP_LLM_MAX_RPM": "0",
+    "TRIP_SEARCH_MAX_RPM": "0",
+    "TRIP_STREAM_TOKENS": "0",
+    "TRIP_TRACING": "1",
+    "TAVILY_API_KEY": "offline",
+}
+
+# Métricas em que maior é melhor; contagens só precisam ser iguais
+HIGHER_IS_BETTER = ("_per_second",)
+EXACT = ("tool_calls.", "llm_calls", "search_calls")
+
+
+def bench_crew(args, log_dir):
+    """Roda a crew completa com o LLM roteirizado e a pesquisa falsa."""
+    # Imports aqui: o pool de PDFs (spawn) reimporta este módulo nos processos filhos
+    import trip_tools
+    from fakes import FakeTavilyClient, ScriptedLLM
+    from trip_crew import TripCrew
+    from trip_tracing import trace_run
+    from trip_utils import LogFileOutput, redirect_output
+
+    samples = []
+    # A primeira execução (warm-up) paga imports e inicializações do crewai e é descartada
+    for run in range(args.runs + 1):
+        llm = ScriptedLLM(model="offline/scripted-react", latency=args.llm_latency, report_days=args.report_days)
+        client = FakeTavilyClient(latency=args.search_latency)
+        trip_tools.get_tavily_client = lambda: client
+        crew = TripCrew("São Paulo", "Lisboa", "1 de maio de 2025", "8 de maio de 2025", "museus, gastronomia", llm=llm)
+
+        with redirect_output(LogFileOutput(os.path.join(log_dir, f"crew_{run}.log"))):
+            with trace_run("benchmark") as trace:
+                start = time.perf_counter()
+                crew.run()
+                wall = time.perf_counter() - start
+
+        if run == 0:
+            continue
+        spans = trace.to_dicts()
+        samples.append({
+            "crew_seconds": wall,
+            "tasks": {s["name"]: s["duration"] for s in spans if s["kind"] == "task"},
+            "tools": Counter(s["name"] for s in spans if s["kind"] == "tool"),
+            "llm_calls": llm.calls,
+            "search_calls": client.calls,
+        })
+
+    metrics = {"crew_seconds": statistics.median(s["crew_seconds"] for s in samples)}
+    for name in samples[0]["tasks"]:
+        metrics[f"task_seconds.{name}"] = statistics.median(s["tasks"][name] for s in samples)
+    for name, calls in sorted(samples[-1]["tools"].items()):
+        metrics[f"tool_calls.{name}"] = calls
+    metrics["llm_calls"] = samples[-1]["llm_calls"]
+    metrics["search_calls"] = samples[-1]["search_calls"]
+    return metrics
+
+
+def bench_pdf(args, work_dir):
+    """Gera ``--pdf-docs`` relatórios de uma vez e mede a vazão (o pool já aquecido)."""
+    from fakes import fake_report
+    from trip_pdf import build_pdfs, get_pdf_pool
+
+    files = {}
+    size = 0
+    for i in range(args.pdf_docs):
+        md_file = f"relatorio_{i}.md"
+        text = fake_report(f"Relatório {i}", args.report_days)
+        with open(os.path.join(work_dir, md_file), "w", encoding="utf-8") as f:
+            f.write(text)
+        files[md_file] = f"relatorio_{i}.pdf"
+        size += len(text.encode("utf-8"))
+
+    build_pdfs(work_dir, files, force=True)  # aquece o pool de processos e os estilos
+    times = []
+    for _ in range(args.runs):
+        start = time.perf_counter()
+        build_pdfs(work_dir, files, force=True)
+        times.append(time.perf_counter() - start)
+    seconds = statistics.median(times)
+
+    # Os processos do pool só entram no RSS dos filhos depois de encerrados
+    pool = get_pdf_pool()
+    if pool is not None:
+        pool.shutdown(wait=True)
+    return {
+        "pdf_batch_seconds": seconds,
+        "pdf_docs_per_second": len(files) / seconds,
+        "pdf_kb_per_second": size / 1024 / seconds,
+    }
+
+
+def bench_capture(args, log_dir):
+    """Custo por linha da captura do log (limpeza, deduplicação e disco) contra um StringIO."""
+    from trip_utils import LogFileOutput
+
+    lines = [f"\x1b[95m# Agent:\x1b[00m passo {i} da tarefa, pesquisando o destino\n" for i in range(args.capture_lines)]
+
+    start = time.perf_counter()
+    plain = StringIO()
+    for line in lines:
+        plain.write(line)
+    baseline = (time.perf_counter() - start) / len(lines)
+
+    output = LogFileOutput(os.path.join(log_dir, "capture.log"))
+    start = time.perf_counter()
+    for line in lines:
+        output.write(line)
+    output.close()
+    captured = (time.perf_counter() - start) / len(lines)
+    return {
+        "capture_us_per_line": captured * 1e6,
+        "capture_overhead_us_per_line": (captured - baseline) * 1e6,
+    }
+
+
+def peak_rss():
+    # ru_maxrss vem em KB no Linux e em bytes no macOS
+    scale = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return {
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale,
+        "peak_rss_children_mb": resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / scale,
+    }
+
+
+def compare(baseline, current, threshold):
+    """Imprime as diferenças para a linha de base; retorna as métricas que pioraram."""
+    regressions = []
+    print(f"\n{'métrica':<40} {'base':>12} {'atual':>12} {'Δ%':>8}")
+    for name, value in current.items():
+        base = baseline.get(name)
+        if base is None:
+            print(f"{name:<40} {'-':>12} {value:>12.4g} {'novo':>8}")
+            continue
+        delta = (value - base) / base * 100 if base else 0.0
+        if name.startswith(EXACT):
+            worse = value != base
+        elif name.endswith(HIGHER_IS_BETTER):
+            worse = delta < -threshold
+        else:
+            worse = delta > threshold
+        if worse:
+            regressions.append(name)
+        print(f"{name:<40} {base:>12.4g} {value:>12.4g} {delta:>+7.1f}%{'  ← piorou' if worse else ''}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--llm-latency", type=float, default=0.05, help="segundos por chamada ao LLM falso")
+    parser.add_argument("--search-latency", type=float, default=0.1, help="segundos por pesquisa falsa")
+    parser.add_argument("--report-days", type=int, default=7, help="tamanho dos relatórios gerados")
+    parser.add_argument("--pdf-docs", type=int, default=8)
+    parser.add_argument("--capture-lines", type=int, default=20000)
+    parser.add_argument("--save", help="grava os resultados como linha de base (JSON)")
+    parser.add_argument("--compare", help="compara com uma linha de base salva")
+    parser.add_argument("--threshold", type=float, default=10.0, help="piora tolerada, em %%")
+    args = parser.parse_args()
+
+    for name, value in OFFLINE_ENV.items():
+        os.environ[name] = value
+    work_dir = tempfile.mkdtemp(prefix="trip-bench-")
+    os.environ["TRIP_CACHE_DIR"] = os.path.join(work_dir, "cache")
+
+    try:
+        metrics = {}
+        metrics.update(bench_crew(args, work_dir))
+        metrics.update(bench_pdf(args, work_dir))
+        metrics.update(bench_capture(args, work_dir))
+        metrics.update(peak_rss())
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    result = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "args": vars(args),
+        },
+        "metrics": metrics,
+    }
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(baseline["metrics"], metrics, args.threshold)
+    else:
+        regressions = []
+        print(json.dumps(metrics, indent=2, ensure_ascii=False))
+
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2, ensure_ascii=False)
+
+    if regressions:
+        print(f"\n{len(regressions)} métrica(s) piorou(aram) mais de {args.threshold:.0f}%: {', '.join(regressions)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""Substitutos determinísticos do LLM e das pesquisas para os benchmarks offline.
+
+``ScriptedLLM`` responde no formato ReAct do crewai: em cada tarefa chama as
+ferramentas do roteiro (só as que o agente tem) e depois entrega um relatório
+markdown de tamanho fixo. ``FakeTavilyClient`` devolve resultados estáveis
+depois de uma latência configurável. Nada aqui acessa a rede.
+"""
+import json
+import re
+import time
+import unicodedata
+
+from crewai.llms.base_llm import BaseLLM
+
+# Ferramentas chamadas por tarefa, na ordem (as que o agente não tem são puladas)
+DEFAULT_SCRIPT = [
+    ("Consultar pesquisas anteriores", {"query": "clima e segurança no destino"}),
+    ("Pesquisa na internet em lote", {"queries": ["clima no destino", "eventos no destino", "segurança no destino"]}),
+    ("Pesquisa na internet", {"query": "principais atrações do destino"}),
+    ("Faça um cálculo", {"operation": "7*350+2*120"}),
+]
+
+REPORT_DAY = """## Dia {day}
+
+Manhã com **visita guiada** e almoço em um *bistrô local* ([guia](https://example.com/{day})).
+
+- Transporte: metrô
+- Custo estimado: R$ {cost}
+
+| Item | Custo |
+|------|-------|
+| Museu | R$ 80 |
+| Almoço | R$ 120 |
+
+"""
+
+
+def tool_key(name):
+    """Nome da ferramenta sem acentos, caixa e pontuação (o crewai lista "pesquisa_na_internet")."""
+    name = unicodedata.normalize("NFKD", name).encode("ascii", "ignore").decode()
+    return re.sub(r"\W+", "_", name.lower()).strip("_")
+
+
+def fake_report(role, days):
+    return f"# {role}\n\n" + "".join(REPORT_DAY.format(day=d, cost=100 + d) for d in range(1, days + 1))
+
+
+class ScriptedLLM(BaseLLM):
+    """LLM falso que reproduz turnos ReAct com chamadas de ferramentas."""
+
+    latency: float = 0.0
+    report_days: int = 7
+    script: list = DEFAULT_SCRIPT
+    calls: int = 0
+
+    def call(self, messages, tools=None, callbacks=None, available_functions=None,
+             from_task=None, from_agent=None, response_model=None, **kwargs):
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        text = messages if isinstance(messages, str) else "\n".join(str(m.get("content", "")) for m in messages)
+        listed = {tool_key(name): name.strip() for name in re.findall(r"^Tool Name: (.+)$", text, re.MULTILINE)}
+        available = [(listed[tool_key(name)], args) for name, args in self.script if tool_key(name) in listed]
+        # Cada turno de ferramenta anterior volta como mensagem do assistente com "Action:"
+        turn = 0 if isinstance(messages, str) else sum(
+            1 for m in messages if m.get("role") == "assistant" and "Action:" in str(m.get("content", ""))
+        )
+        if turn < len(available):
+            name, args = available[turn]
+            return (
+                f"Thought: Preciso usar a ferramenta {name}.\n"
+                f"Action: {name}\n"
+                f"Action Input: {json.dumps(args, ensure_ascii=False)}"
+            )
+        role = getattr(from_agent, "role", "Relatório")
+        return f"Thought: Já tenho o que preciso.\nFinal Answer: {fake_report(role, self.report_days)}"
+
+    def supports_function_calling(self):
+        return False
+
+    def supports_stop_words(self):
+        return True
+
+    def get_context_window_size(self):
+        return 1_000_000
+
+
+class FakeTavilyClient:
+    """Cliente Tavily falso: resultados determinísticos após ``latency`` segundos."""
+
+    def __init__(self, latency=0.05, results=4):
+        self.latency = latency
+        self.results = results
+        self.calls = 0
+
+    def invoke(self, query):
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        slug = re.sub(r"\W+", "-", str(query).lower()).strip("-")
+        return {
+            "query": query,
+            "results": [
+                {
+                    "title": f"{query} ({i})",
+                    "url": f"https://example.com/{slug}/{i}",
+                    "content": f"Resultado {i} sobre {query}. " * 5,
+                    "score": 1.0 - i / 10,
+                }
+                for i in range(self.results)
+            ],
+        }
@@ -0,0 +1,10 @@
+import os
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# Caches e bancos dos testes numa pasta temporária, nunca no cache real do app
+os.environ["TRIP_CACHE_DIR"] = tempfile.mkdtemp(prefix="trip-tests-")
+os.environ.setdefault("TRIP_WORKSPACES_DIR", os.path.join(os.environ["TRIP_CACHE_DIR"], "viagem"))
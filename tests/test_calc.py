@@ -0,0 +1,67 @@
+import pytest
+
+from trip_calc import MAX_DAYS, CalculationError, aggregate_costs, evaluate
+
+
+@pytest.mark.parametrize("expression, expected", [
+    ("2 + 3 * 4", 14),
+    ("(120 + 80) / 2", 100),
+    ("2 ** 10", 1024),
+    ("-5 % 3", 1),
+    ("sum([150, 80.5, 45])", 275.5),
+    ("max((3, 9, 4))", 9),
+    ("min(3, 9)", 3),
+    ("round(sqrt(2) * 100, 1)", 141.4),
+    ("ceil(pi)", 4),
+])
+def test_evaluate_arithmetic(expression, expected):
+    assert evaluate(expression) == pytest.approx(expected)
+
+
+@pytest.mark.parametrize("expression", [
+    "[0] * 10**9",
+    "[1, 2]",
+    "-[1]",
+    "abs([1])",
+    "sum([[1], [2]])",
+    "9 ** 9 ** 9",
+    "2 ** 5000",
+    "__import__('os')",
+    "'a' * 3",
+    "True + 1",
+    "sum(x for x in range(3))",
+    "round(2.5, ndigits=1)",
+    "1 +",
+    "1 / 0",
+    "(-8) ** 0.5",
+    "max([])",
+    "1" * 600,
+])
+def test_evaluate_rejects(expression):
+    with pytest.raises(CalculationError):
+        evaluate(expression)
+
+
+def test_aggregate_costs_converts_and_totals_per_day():
+    result = aggregate_costs(
+        [
+            {"item": "hotel", "unit_cost": 100, "currency": "EUR", "days": 3},
+            {"item": "metrô", "unit_cost": 10, "quantity": 2, "days": [1, 3]},
+        ],
+        currency="BRL",
+        rates={"EUR": 6.0},
+    )
+    assert result["total"] == pytest.approx(1840)
+    assert result["per_day"] == {"1": 620.0, "2": 600.0, "3": 620.0}
+    assert result["per_item"] == {"hotel": 1800.0, "metrô": 40.0}
+
+
+@pytest.mark.parametrize("item", [
+    {"item": "hotel", "unit_cost": 100, "days": 3 * 10**6},
+    {"item": "hotel", "unit_cost": 100, "days": list(range(1, MAX_DAYS + 2))},
+    {"item": "museu", "unit_cost": 20, "day": 10**9},
+    {"item": "museu", "unit_cost": 20, "days": [0, 1]},
+])
+def test_aggregate_costs_limits_days(item):
+    with pytest.raises(CalculationError):
+        aggregate_costs([item])
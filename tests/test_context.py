@@ -0,0 +1,54 @@
+from trip_context import compact_context, compact_report, estimate_tokens, fact_score
+
+REPORT = """# Roteiro em Lisboa
+
+## Dia 1
+
+Lisboa é uma cidade encantadora com muita história e gente simpática por toda parte.
+Visite o Museu Nacional do Azulejo às 10h; o ingresso custa 8 euros.
+A vista é bonita e vale a pena levar uma câmera para registrar tudo com calma.
+
+| Item | Custo |
+|---|---|
+| Hotel no bairro Chiado | R$ 600 |
+| Conversa sobre a vida | - |
+
+## Dia 2
+
+- Passeio pelo Castelo de São Jorge de manhã, ingresso R$ 90
+- Descansar e aproveitar o dia com tranquilidade
+"""
+
+
+def test_report_within_budget_is_unchanged():
+    assert compact_report(REPORT, estimate_tokens(REPORT)) == REPORT
+
+
+def test_fact_score_counts_categories():
+    assert fact_score("Museu às 10h, ingresso R$ 20, no bairro Chiado") == 4
+    assert fact_score("Uma cidade encantadora") == 0
+
+
+def test_compaction_keeps_facts_within_budget():
+    budget = 90
+    compacted = compact_report(REPORT, budget)
+    assert estimate_tokens(compacted) <= budget
+    assert "Museu Nacional do Azulejo" in compacted
+    assert "Castelo de São Jorge" in compacted
+    assert "gente simpática" not in compacted
+    # A linha de tabela mantida leva o cabeçalho junto, e a ordem original é preservada
+    assert "| Item | Custo |\n|---|---|\n| Hotel no bairro Chiado | R$ 600 |" in compacted
+    assert compacted.index("## Dia 1") < compacted.index("Museu") < compacted.index("## Dia 2")
+
+
+def test_headings_without_content_are_dropped():
+    compacted = compact_report("# A\n\n## Vazio\n\nTexto sem fatos nenhum aqui para manter.\n\n## Cheio\n\n- Museu R$ 10", 14)
+    assert "## Vazio" not in compacted
+    assert "## Cheio" in compacted
+
+
+def test_compact_context_shares_the_budget():
+    short = "Resumo curto."
+    outputs = compact_context([REPORT, short], budget=100)
+    assert outputs[1] == short
+    assert sum(estimate_tokens(output) for output in outputs) <= 100
@@ -0,0 +1,45 @@
+from trip_evidence import EvidenceStore, evidence_run, record_evidence, search_evidence, terms
+from trip_tools import SearchTools
+
+RESULTS = [
+    {"url": "https://a.pt/clima", "title": "Clima em Lisboa", "content": "Lisboa tem verão quente e seco, inverno chuvoso e ameno."},
+    {"url": "https://b.pt/metro", "title": "Metrô de Lisboa", "content": "O metrô de Lisboa tem quatro linhas e o bilhete custa 1,80 euros."},
+    {"url": "https://c.pt/pasteis", "title": "Pastéis de Belém", "content": "Em Lisboa, os pastéis de Belém são vendidos desde 1837."},
+]
+
+
+def test_terms_normalizes_and_drops_stopwords():
+    assert terms("O Metrô de São Paulo é ÓTIMO") == ["metro", "sao", "paulo", "otimo"]
+
+
+def test_duplicates_are_indexed_once():
+    store = EvidenceStore()
+    assert store.add("clima", RESULTS) == 3
+    mirror = dict(RESULTS[0], url="https://espelho.pt/clima")
+    assert store.add("tempo", [dict(RESULTS[1], url="https://b.pt/metro/#linhas"), mirror]) == 0
+    assert len(store) == 3
+    assert store.documents[0]["queries"] == ["clima", "tempo"]
+
+
+def test_relevant_document_ranks_first():
+    store = EvidenceStore()
+    store.add("lisboa", RESULTS)
+    (score, document), = store.search("preço do bilhete de metrô em Lisboa")
+    assert document["url"] == "https://b.pt/metro"
+    assert score > 0
+
+
+def test_destination_name_alone_is_not_a_match():
+    store = EvidenceStore()
+    store.add("lisboa", RESULTS)
+    assert store.search("vistos e documentos para entrar em Lisboa") == []
+    assert store.search("Lisboa", min_coverage=0.5)
+
+
+def test_search_previous_tool_uses_the_run_store():
+    assert "0 resultados guardados" in SearchTools.search_previous.run(query="metrô Lisboa")
+    with evidence_run():
+        record_evidence("lisboa", {"results": RESULTS})
+        assert "https://b.pt/metro" in str(SearchTools.search_previous.run(query="linhas do metrô"))
+        assert "Nada encontrado" in SearchTools.search_previous.run(query="vistos para Lisboa")
+        assert search_evidence("clima")["indexed"] == 3
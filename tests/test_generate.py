@@ -0,0 +1,104 @@
+import threading
+
+from crewai.tasks.task_output import TaskOutput
+
+import trip_crew
+from test_llm import StubProvider
+from trip_cache import MemoryCache
+from trip_crew import TripCrew, generate_trip
+from trip_llm import CachedLLM, CompletionCache
+from trip_ratelimit import TokenBucket
+from trip_store import TripStore
+
+FILES = {md_file: md_file[:-3] + ".pdf" for md_file in TripCrew.REPORT_FILES.values()}
+
+
+class FakeJob:
+    def __init__(self):
+        self.progress = {}
+        self.cancel_event = threading.Event()
+
+    def report_progress(self, **fields):
+        self.progress.update(fields)
+
+    def append_progress(self, key, item):
+        self.progress[key] = self.progress.get(key, []) + [item]
+
+
+class FakeCrew(TripCrew):
+    """Writes a fixed report per task instead of calling the agents."""
+
+    def run(self):
+        outputs = {}
+        for name in self.TASK_NAMES:
+            outputs[name] = f"# {name}"
+            if name in self.REPORT_FILES:
+                self.workspace.write_text(self.REPORT_FILES[name], outputs[name])
+            self.on_task_done(name, outputs[name])
+        self.report = {"critical_path": list(self.TASK_NAMES)}
+        return outputs
+
+
+def test_failed_pdf_does_not_fail_the_trip(monkeypatch, tmp_path):
+    def fake_build_pdfs(directory, files):
+        (md_file, pdf_file), = files.items()
+        if md_file == "roteiro_viagem.md":
+            raise RuntimeError("fonte corrompida")
+        return {md_file: {"pdf": str(tmp_path / pdf_file), "seconds": 0.1, "skipped": False}}
+
+    store = TripStore(str(tmp_path / "trips.sqlite"))
+    monkeypatch.setattr(trip_crew, "TripCrew", FakeCrew)
+    monkeypatch.setattr(trip_crew, "build_pdfs", fake_build_pdfs)
+    monkeypatch.setattr(trip_crew, "get_trip_store", lambda: store)
+
+    job = FakeJob()
+    result = generate_trip(job, "São Paulo", "Lisboa", "1 de maio", "8 de maio", "museus", FILES, use_history=False)
+
+    assert set(result["pdf_errors"]) == {"roteiro_viagem.md"}
+    assert "fonte corrompida" in result["pdf_errors"]["roteiro_viagem.md"]
+    assert set(result["pdfs"]) == set(FILES) - {"roteiro_viagem.md"}
+    assert job.progress["pdf_errors"] == ["roteiro_viagem.md"]
+    assert sorted(job.progress["reports"]) == sorted(FILES)
+
+    reports = store.reports(result["trip_id"])
+    assert set(reports) == set(FILES)
+    assert reports["roteiro_viagem.md"] == ("# build_itinerary", None)
+
+
+class LLMCrew(TripCrew):
+    """Each task makes one call to a cached stub LLM, with an in-memory task memo."""
+
+    llm_client = None
+    task_memo = None
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, llm=self.llm_client, memo=self.task_memo, **kwargs)
+
+    def run_task(self, task):
+        raw = task.agent.llm.call([{"role": "user", "content": task.description}])
+        task.output = TaskOutput(description=task.description, raw=raw, agent=task.agent.role)
+        return None
+
+
+def test_regenerate_calls_the_llm_again(monkeypatch, tmp_path):
+    inner = StubProvider(model="stub")
+    LLMCrew.llm_client = CachedLLM("stub", completion_cache=CompletionCache(MemoryCache()),
+                                   rate_limiter=TokenBucket("test", per_minute=6000), llm=inner)
+    LLMCrew.task_memo = MemoryCache()
+    store = TripStore(str(tmp_path / "trips.sqlite"))
+    monkeypatch.setattr(trip_crew, "TripCrew", LLMCrew)
+    monkeypatch.setattr(trip_crew, "build_pdfs", lambda directory, files: {})
+    monkeypatch.setattr(trip_crew, "get_trip_store", lambda: store)
+    args = ("São Paulo", "Lisboa", "1 de maio", "8 de maio", "museus", FILES)
+
+    first = generate_trip(FakeJob(), *args)
+    assert inner.calls == len(TripCrew.TASK_NAMES)
+    assert generate_trip(FakeJob(), *args)["from_history"]
+
+    # A memória de tarefas e o cache de completions têm tudo, mas não são lidos
+    regenerated = generate_trip(FakeJob(), *args, use_history=False)
+    assert regenerated["from_history"] is False
+    assert inner.calls == 2 * len(TripCrew.TASK_NAMES)
+    assert sorted(regenerated["executed"]) == sorted(TripCrew.TASK_NAMES)
+    reports = store.reports(regenerated["trip_id"])
+    assert reports["guia_comunicacao.md"][0] != store.reports(first["trip_id"])["guia_comunicacao.md"][0]
@@ -0,0 +1,113 @@
+import time
+
+import pytest
+
+from trip_hedge import HedgedSearch, SearchProvider
+
+
+def provider(name, delay=0.0, result=None, error=None, timeout=5.0):
+    calls = []
+
+    def search(query):
+        calls.append(query)
+        time.sleep(delay)
+        if error is not None:
+            raise error
+        return result if result is not None else {"results": [{"url": f"https://{name}"}]}
+
+    fake = SearchProvider(name, search, timeout=timeout)
+    fake.calls = calls
+    return fake
+
+
+def has_results(response):
+    return bool(response.get("results"))
+
+
+def test_primary_answers_before_hedge_delay():
+    primary, backup = provider("primary"), provider("backup")
+    name, _ = HedgedSearch([primary, backup], hedge_delay=0.5, is_good=has_results).search("lisboa")
+    assert name == "primary"
+    assert backup.calls == []
+
+
+def test_slow_primary_is_hedged():
+    primary, backup = provider("primary", delay=1.0), provider("backup")
+    start = time.monotonic()
+    name, _ = HedgedSearch([primary, backup], hedge_delay=0.05, is_good=has_results).search("lisboa")
+    assert name == "backup"
+    assert time.monotonic() - start < 0.8
+
+
+def test_failed_or_empty_primary_falls_back_without_waiting():
+    for primary in (provider("primary", error=RuntimeError("429")), provider("primary", result={"results": []})):
+        start = time.monotonic()
+        name, _ = HedgedSearch([primary, provider("backup")], hedge_delay=2.0, is_good=has_results).search("q")
+        assert name == "backup"
+        assert time.monotonic() - start < 1.0
+
+
+def test_every_provider_failing_raises_the_last_error():
+    hedged = HedgedSearch([provider("a", error=RuntimeError("a")), provider("b", error=RuntimeError("b"))], hedge_delay=0)
+    with pytest.raises(RuntimeError):
+        hedged.search("q")
+
+
+def test_adaptive_delay_follows_primary_latency():
+    hedged = HedgedSearch([provider("a")], initial_delay=2.0, min_delay=0.01, min_samples=3)
+    assert hedged.current_delay() == 2.0
+    for _ in range(3):
+        hedged.search("q")
+    assert hedged.current_delay() < 0.5
+
+
+class SlowLimiter:
+    """TokenBucket stand-in whose token takes ``wait`` seconds to arrive."""
+
+    def __init__(self, wait):
+        self.wait = wait
+
+    def acquire(self):
+        time.sleep(self.wait)
+        return self.wait
+
+    def penalize(self, retry_after=None):
+        pass
+
+    def reward(self):
+        pass
+
+
+def test_losing_call_latency_is_sampled():
+    primary, backup = provider("primary", delay=0.3), provider("backup")
+    hedged = HedgedSearch([primary, backup], hedge_delay=0.05, is_good=has_results)
+    assert hedged.search("q")[0] == "backup"
+    time.sleep(0.4)
+    assert hedged.latency["primary"].samples[0] >= 0.3
+
+
+def test_rate_limit_wait_counts_neither_as_latency_nor_timeout():
+    primary = provider("primary", delay=0.05, timeout=0.3)
+    primary.limiter = SlowLimiter(0.5)
+    backup = provider("backup")
+    hedged = HedgedSearch([primary, backup], hedge_delay=0.2, is_good=has_results)
+    assert hedged.search("q")[0] == "primary"
+    assert backup.calls == []
+    assert hedged.latency["primary"].samples[0] < 0.2
+
+
+def test_cache_hits_skip_the_hedge(monkeypatch):
+    import trip_tools
+
+    fetched = []
+    monkeypatch.setattr(trip_tools, "SEARCH_HEDGE_ENABLED", True)
+    monkeypatch.setitem(trip_tools.SEARCH_PROVIDERS, "tavily",
+                        (lambda q: fetched.append(q) or {"results": [{"url": "https://t"}]}, "test", {}))
+    hedged = HedgedSearch([SearchProvider("tavily", trip_tools.SEARCH_PROVIDERS["tavily"][0])], is_good=has_results)
+    monkeypatch.setattr(trip_tools, "_hedged_search", hedged)
+
+    query = f"museus {time.time()}"
+    assert trip_tools.hedged_search(query)[0] == "tavily"
+    assert trip_tools.hedged_search(query)[0] == "tavily"
+    assert fetched == [query]
+    assert len(hedged.latency["tavily"].samples) == 1
@@ -0,0 +1,50 @@
+import subprocess
+import sys
+import threading
+
+from trip_jobs import DONE, INTERRUPTED, QUEUED, RUNNING, JobManager, JobStore
+
+
+def test_only_jobs_of_exited_processes_are_interrupted(tmp_path):
+    store = JobStore(str(tmp_path / "jobs.sqlite"))
+    dead = subprocess.run([sys.executable, "-c", "import os; print(os.getpid())"], capture_output=True, text=True)
+    store.create("orfao", {}, None)
+    store.update("orfao", status=RUNNING, owner_pid=int(dead.stdout))
+    store.create("vivo", {}, None)
+    store.update("vivo", status=RUNNING)
+    store.create("antigo", {}, None)
+    store.update("antigo", owner_pid=None)
+
+    JobManager(jobs_dir=str(tmp_path))
+
+    assert store.get("orfao")["status"] == INTERRUPTED
+    assert store.get("vivo")["status"] == RUNNING
+    assert store.get("antigo")["status"] == INTERRUPTED
+
+
+def test_identical_pending_job_is_reused(tmp_path):
+    release = threading.Event()
+
+    def work(job, destination):
+        release.wait(5)
+        return destination
+
+    manager = JobManager(jobs_dir=str(tmp_path), max_workers=1, max_pending=2)
+    ids = []
+    threads = [
+        threading.Thread(target=lambda: ids.append(manager.submit(work, {"destination": "Lisboa"})))
+        for _ in range(8)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    other = manager.submit(work, {"destination": "Porto"})
+
+    assert len(set(ids)) == 1
+    assert other != ids[0]
+    assert manager.status(other)["status"] == QUEUED
+    release.set()
+    manager._executor.shutdown(wait=True)
+    assert manager.status(ids[0])["status"] == DONE
+    assert manager.status(ids[0])["result"] == "Lisboa"
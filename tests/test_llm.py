@@ -0,0 +1,110 @@
+import uuid
+from types import SimpleNamespace
+
+import pytest
+from crewai import LLM, Agent, Crew, Task
+from crewai.llms.base_llm import BaseLLM
+from crewai.tools import tool
+
+import trip_components
+from trip_cache import MemoryCache
+from trip_llm import CachedLLM, CompletionCache
+from trip_ratelimit import TokenBucket
+
+
+class StubProvider(BaseLLM):
+    """Stands in for crewai's native Gemini client; counts the calls that reach it."""
+
+    calls: int = 0
+
+    def call(self, messages, tools=None, callbacks=None, available_functions=None,
+             from_task=None, from_agent=None, response_model=None):
+        self.calls += 1
+        return f"resposta {self.calls}"
+
+
+@pytest.fixture
+def stub_gemini(monkeypatch):
+    monkeypatch.setattr(LLM, "_get_native_provider", classmethod(lambda cls, provider: StubProvider))
+    monkeypatch.setattr(trip_components, "_llm", None)
+
+
+def test_completion_cache_hits_and_temperature_bypass():
+    cache = CompletionCache(MemoryCache(max_entries=10), max_temperature=0.5)
+    calls = []
+
+    def call():
+        calls.append(1)
+        return "ok"
+
+    messages = [{"role": "user", "content": "oi"}]
+    assert cache.get_or_call("m", messages, call, temperature=0.2) == "ok"
+    assert cache.get_or_call("m", messages, call, temperature=0.2) == "ok"
+    assert len(calls) == 1
+    cache.get_or_call("m", messages, call, temperature=0.9)
+    assert len(calls) == 2
+    assert (cache.hits, cache.misses, cache.bypasses) == (1, 1, 1)
+
+
+def test_get_llm_wraps_the_native_client_and_caches_completions(stub_gemini):
+    llm = trip_components.get_llm()
+    assert isinstance(llm, CachedLLM)
+    assert isinstance(llm.llm, StubProvider)
+    assert llm.completion_cache is not None
+    assert trip_components.get_llm() is llm
+
+    messages = [{"role": "user", "content": f"roteiro {uuid.uuid4()}"}]
+    first = llm.call(messages)
+    second = llm.call(messages)
+    assert first == second == "resposta 1"
+    assert llm.llm.calls == 1
+
+
+def test_tool_executing_calls_are_not_cached(stub_gemini):
+    llm = trip_components.get_llm()
+    messages = [{"role": "user", "content": f"calcule {uuid.uuid4()}"}]
+    llm.call(messages, available_functions={"calc": lambda: 1})
+    llm.call(messages, available_functions={"calc": lambda: 1})
+    assert llm.llm.calls == 2
+
+
+class ToolCallingProvider(BaseLLM):
+    """Native function-calling stub: asks for the tool once, then answers with its result."""
+
+    calls: int = 0
+
+    def supports_function_calling(self):
+        return True
+
+    def call(self, messages, tools=None, callbacks=None, available_functions=None,
+             from_task=None, from_agent=None, response_model=None):
+        self.calls += 1
+        results = [m["content"] for m in messages if isinstance(m, dict) and m.get("role") == "tool"]
+        if results:
+            return f"Total: {results[-1]}"
+        # Mesmo formato do cliente Gemini do crewai (partes com function_call)
+        return [SimpleNamespace(function_call=SimpleNamespace(name="somar", args={"a": 2, "b": 3}))]
+
+
+def test_native_tool_calls_are_cached_and_replayed():
+    @tool("somar")
+    def somar(a: int, b: int) -> int:
+        """Soma dois números."""
+        return a + b
+
+    inner = ToolCallingProvider(model="stub")
+    cache = CompletionCache(MemoryCache(max_entries=100))
+    llm = CachedLLM("stub", completion_cache=cache, rate_limiter=TokenBucket("test", per_minute=6000), llm=inner)
+    assert llm.supports_function_calling()
+
+    def run():
+        agent = Agent(role="Calculista", goal="Somar", backstory="Soma números.", llm=llm, tools=[somar], max_iter=3)
+        task = Task(description=f"Some 2 e 3 ({marker})", expected_output="O total", agent=agent)
+        return Crew(agents=[agent], tasks=[task]).kickoff().raw
+
+    marker = uuid.uuid4()
+    assert run() == "Total: 5"
+    assert (inner.calls, cache.hits, cache.misses) == (2, 0, 2)
+    assert run() == "Total: 5"
+    assert inner.calls == 2
+    assert cache.hits == 2
@@ -0,0 +1,33 @@
+import os
+import time
+
+from trip_utils import LogFileOutput, gc_logs
+
+
+def test_log_file_output_cleans_and_deduplicates(tmp_path):
+    path = tmp_path / "job.log"
+    output = LogFileOutput(str(path), dedup_entries=2)
+    output.write("\x1b[95m# Agent:\x1b[00m pesquisa\nLiteLLM.Info: ruído\n# Agent: pes")
+    output.write("quisa\noutra\nterceira\n# Agent: pesquisa")
+    output.close()
+    # A primeira linha saiu da memória da deduplicação (2 entradas) e volta a ser gravada
+    assert path.read_text(encoding="utf-8").splitlines() == [
+        "# Agent: pesquisa",
+        "outra",
+        "terceira",
+        "# Agent: pesquisa",
+    ]
+
+
+def test_gc_logs_removes_only_old_logs(tmp_path):
+    old = tmp_path / "antigo.log"
+    recent = tmp_path / "recente.log"
+    other = tmp_path / "jobs.sqlite"
+    for path in (old, recent, other):
+        path.write_text("x")
+    ten_days_ago = time.time() - 10 * 86400
+    os.utime(old, (ten_days_ago, ten_days_ago))
+    os.utime(other, (ten_days_ago, ten_days_ago))
+
+    assert gc_logs(str(tmp_path), max_age_days=7) == [str(old)]
+    assert sorted(os.listdir(tmp_path)) == ["jobs.sqlite", "recente.log"]
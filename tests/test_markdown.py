@@ -0,0 +1,49 @@
+from reportlab.platypus import Paragraph, Table
+
+from trip_markdown import compile_markdown, format_inline, tokenize
+from trip_pdf import get_stylesheet
+
+
+def test_tokenize_blocks():
+    text = "# Título\n\nTexto de\nduas linhas\n- item\n  - sub\n1. primeiro\n| A | B |\n|---|---|\n| 1 | 2 |\n```\ncódigo *cru*\n```\n---"
+    assert list(tokenize(text)) == [
+        ("heading", 1, "Título"),
+        ("blank",),
+        ("paragraph", "Texto de duas linhas"),
+        ("bullet", 0, "item"),
+        ("bullet", 1, "sub"),
+        ("ordered", 0, "1", "primeiro"),
+        ("table", [["A", "B"], ["1", "2"]]),
+        ("code", "", "código *cru*"),
+        ("rule",),
+    ]
+
+
+def test_bold_italic_is_nested():
+    assert format_inline("***muito***") == "<b><i>muito</i></b>"
+    assert format_inline("___muito___") == "<b><i>muito</i></b>"
+
+
+def test_crossing_markers_are_nested():
+    assert format_inline("*a **b* c**") == "<i>a <b>b</b></i><b> c</b>"
+    assert format_inline("**a *b** c*") == "<b>a <i>b</i></b><i> c</i>"
+
+
+def test_inline_escapes_and_ignores_plain_asterisks():
+    assert format_inline("2 * 3 < 4 & snake_case") == "2 * 3 &lt; 4 &amp; snake_case"
+    assert format_inline("**R$ 50** no `bilhete`") == '<b>R$ 50</b> no <font face="Courier">bilhete</font>'
+
+
+def test_every_block_compiles():
+    styles = get_stylesheet()
+    text = "# ***Lisboa***\n\n*a **b* c**\n\n| **A** | *B |\n|---|---|\n| 1 | 2 |\n\n- **item *x** y*"
+    elements = compile_markdown(text, styles, 400)
+    assert any(isinstance(element, Table) for element in elements)
+    assert sum(isinstance(element, Paragraph) for element in elements) == 3
+
+
+def test_invalid_markup_falls_back_to_plain_text():
+    styles = get_stylesheet()
+    elements = compile_markdown('Veja [o site](http://x"y) **hoje**', styles, 400)
+    paragraph = [element for element in elements if isinstance(element, Paragraph)][0]
+    assert "o site" in paragraph.getPlainText()
@@ -0,0 +1,34 @@
+import os
+
+import pytest
+
+import trip_pdf
+from trip_pdf import build_pdfs, read_manifest, render_pdf
+
+
+@pytest.fixture(autouse=True)
+def no_pool(monkeypatch):
+    monkeypatch.setattr(trip_pdf, "PDF_WORKERS", 1)
+
+
+def test_unreadable_markdown_does_not_install_a_pdf(tmp_path):
+    file_md = tmp_path / "roteiro.md"
+    file_md.write_bytes(b"# Roteiro \xff\xfe")
+    file_pdf = tmp_path / "roteiro.pdf"
+
+    with pytest.raises(OSError):
+        render_pdf(str(file_md), str(file_pdf))
+    assert not file_pdf.exists()
+    assert os.listdir(tmp_path) == ["roteiro.md"]
+
+
+def test_failed_document_is_left_out_of_the_manifest(tmp_path):
+    (tmp_path / "roteiro.md").write_text("# Roteiro\n\nDia 1", encoding="utf-8")
+    (tmp_path / "custos.md").write_bytes(b"# Custos \xff\xfe")
+    files = {"roteiro.md": "roteiro.pdf", "custos.md": "custos.pdf"}
+
+    with pytest.raises(OSError):
+        build_pdfs(str(tmp_path), files)
+    assert (tmp_path / "roteiro.pdf").exists()
+    assert not (tmp_path / "custos.pdf").exists()
+    assert set(read_manifest(str(tmp_path))) == {"roteiro.pdf"}
@@ -0,0 +1,105 @@
+import threading
+import time
+
+from trip_ratelimit import BATCH, INTERACTIVE, WAITER_TTL, SqliteBucketState, TokenBucket
+
+
+class RateLimited(Exception):
+    status_code = 429
+
+
+def acquire_in_thread(bucket, priority, order):
+    def run():
+        bucket.acquire(priority)
+        order.append(priority)
+
+    thread = threading.Thread(target=run)
+    thread.start()
+    return thread
+
+
+def test_burst_then_refill_rate():
+    bucket = TokenBucket("test", per_minute=600, burst=2)
+    assert bucket.acquire() < 0.05
+    assert bucket.acquire() < 0.05
+    waited = bucket.acquire()
+    assert 0.05 < waited < 0.3
+    assert bucket.metrics()["acquired"] == 3
+
+
+def test_interactive_goes_before_batch_in_one_process():
+    bucket = TokenBucket("test", per_minute=120, burst=1)
+    bucket.acquire()
+    order = []
+    batch = acquire_in_thread(bucket, BATCH, order)
+    time.sleep(0.05)
+    interactive = acquire_in_thread(bucket, INTERACTIVE, order)
+    batch.join(5)
+    interactive.join(5)
+    assert order == [INTERACTIVE, BATCH]
+
+
+def test_interactive_goes_before_batch_across_processes(tmp_path):
+    # Dois estados no mesmo arquivo fazem o papel do app e de um processo de lote
+    path = str(tmp_path / "ratelimit.sqlite")
+    app = TokenBucket("llm", per_minute=120, burst=1, state=SqliteBucketState(path, "llm", 1))
+    batch_worker = TokenBucket("llm", per_minute=120, burst=1, state=SqliteBucketState(path, "llm", 1))
+    batch_worker.acquire(BATCH)
+    order = []
+    batch = acquire_in_thread(batch_worker, BATCH, order)
+    time.sleep(0.1)
+    interactive = acquire_in_thread(app, INTERACTIVE, order)
+    batch.join(5)
+    interactive.join(5)
+    assert order == [INTERACTIVE, BATCH]
+
+
+def test_stale_waiter_does_not_block_batch(tmp_path):
+    state = SqliteBucketState(str(tmp_path / "ratelimit.sqlite"), "llm", 1)
+    state._conn.execute(
+        "INSERT INTO waiters VALUES (?, ?, ?, ?)", ("llm", "gone", INTERACTIVE, time.time() - WAITER_TTL - 1)
+    )
+    assert state.take(2.0, 1, BATCH, "batch") == 0
+
+
+def test_call_retries_rate_limit_errors():
+    bucket = TokenBucket("test", per_minute=600, burst=5)
+    attempts = []
+
+    def flaky():
+        attempts.append(1)
+        if len(attempts) == 1:
+            raise RateLimited("429 Too Many Requests, retry-after 0.1")
+        return "ok"
+
+    assert bucket.call(flaky, retries=2) == "ok"
+    assert len(attempts) == 2
+    assert bucket.throttled == 1
+
+
+def test_rate_limit_errors_by_status_or_type():
+    from trip_ratelimit import is_rate_limit_error
+
+    class RateLimitError(Exception):
+        pass
+
+    class Response:
+        status_code = 429
+
+    class HTTPError(Exception):
+        response = Response()
+
+    wrapped = RuntimeError("falha na tarefa")
+    wrapped.__cause__ = RateLimited("quota")
+    assert is_rate_limit_error(RateLimited("x"))
+    assert is_rate_limit_error(RateLimitError("x"))
+    assert is_rate_limit_error(HTTPError("x"))
+    assert is_rate_limit_error(wrapped)
+    # Um "429" qualquer na mensagem (um preço, um id) não é limite de taxa
+    assert not is_rate_limit_error(ValueError("Hotel por R$ 429 a diária"))
+
+
+def test_penalize_caps_retry_after():
+    bucket = TokenBucket("test", per_minute=600, max_backoff=0.2)
+    bucket.penalize(retry_after=3600)
+    assert bucket.acquire() < 0.5
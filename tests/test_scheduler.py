@@ -0,0 +1,77 @@
+import threading
+import time
+
+import pytest
+
+from trip_crew import TripCrew
+from trip_scheduler import TaskScheduler, split_phases, task_dependencies, topological_order
+
+from test_llm import StubProvider
+
+
+def sleeper(durations, running=None):
+    """Job that sleeps for each task's duration and records the peak concurrency."""
+    lock = threading.Lock()
+    state = {"now": 0, "peak": 0}
+
+    def job(name):
+        with lock:
+            state["now"] += 1
+            state["peak"] = max(state["peak"], state["now"])
+        time.sleep(durations[name])
+        with lock:
+            state["now"] -= 1
+        return name.upper()
+
+    job.state = state
+    return job
+
+
+def test_independent_tasks_run_concurrently():
+    deps = {"a": [], "b": [], "c": ["a", "b"]}
+    job = sleeper({"a": 0.3, "b": 0.3, "c": 0.05})
+    scheduler = TaskScheduler(deps, max_concurrency=2)
+    start = time.perf_counter()
+    assert scheduler.run(job) == {"a": "A", "b": "B", "c": "C"}
+    assert time.perf_counter() - start < 0.55
+    assert job.state["peak"] == 2
+    assert scheduler.timings["c"][0] >= max(scheduler.timings["a"][1], scheduler.timings["b"][1])
+
+
+def test_max_concurrency_is_respected():
+    deps = {name: [] for name in "abcd"}
+    job = sleeper({name: 0.1 for name in deps})
+    TaskScheduler(deps, max_concurrency=2).run(job)
+    assert job.state["peak"] == 2
+
+
+def test_critical_path_follows_slowest_chain():
+    deps = {"a": [], "b": [], "c": ["a", "b"]}
+    scheduler = TaskScheduler(deps, max_concurrency=2)
+    scheduler.run(sleeper({"a": 0.05, "b": 0.25, "c": 0.05}))
+    report = scheduler.report()
+    assert report["critical_path"] == ["b", "c"]
+    assert report["wall_seconds"] < report["serial_seconds"]
+
+
+def test_cycles_and_unknown_tasks_are_rejected():
+    with pytest.raises(ValueError, match="circular"):
+        topological_order({"a": ["b"], "b": ["a"]})
+    with pytest.raises(ValueError, match="desconhecida"):
+        topological_order({"a": ["x"]})
+
+
+def test_split_phases_waits_for_all_research():
+    deps = {"a": [], "b": ["a"], "c": ["b"]}
+    split = split_phases(deps, {"a": "research", "b": "research"})
+    assert split == {"a": [], "b": [], "c": ["b", "a"]}
+
+
+def test_crew_graph_has_parallel_research_by_default():
+    _, tasks = TripCrew("São Paulo", "Lisboa", "1 de maio", "8 de maio", "museus",
+                        llm=StubProvider(model="stub")).build()
+    deps = task_dependencies(dict(zip(TripCrew.TASK_NAMES, tasks)))
+    roots = [name for name, upstream in deps.items() if not upstream]
+    assert set(roots) == {"city_info", "language_research"}
+    assert set(deps["language_guide"]) == {"build_itinerary", "language_research"}
+    assert set(TripCrew.REPORT_FILES) < set(TripCrew.TASK_NAMES)
@@ -0,0 +1,38 @@
+import trip_tools
+from trip_tools import batch_search, get_duckduckgo_client
+
+
+def fake_search(query):
+    return {"results": [{"url": f"https://{query}.pt", "title": query, "content": query, "score": 0.5}]}
+
+
+def test_batch_search_reports_skipped_queries(monkeypatch):
+    monkeypatch.setattr(trip_tools, "SEARCH_BATCH_MAX_QUERIES", 2)
+    result = batch_search("clima\nmetro\nmetro\nmuseus; praias", search=fake_search)
+    assert result["queries"] == ["clima", "metro"]
+    assert result["skipped"] == ["museus", "praias"]
+    assert "Limite de 2 consultas" in result["note"]
+    assert [r["title"] for r in result["results"]] == ["clima", "metro"]
+
+
+def test_batch_search_within_limit_has_no_note():
+    result = batch_search(["clima", "metro"], search=fake_search)
+    assert "skipped" not in result and "note" not in result
+
+
+def test_duckduckgo_client_is_shared(monkeypatch):
+    created = []
+
+    class Wrapper:
+        def __init__(self):
+            created.append(self)
+
+        def results(self, query, max_results):
+            return [{"title": query, "link": f"https://{query}.pt", "snippet": query}]
+
+    monkeypatch.setattr(trip_tools, "DuckDuckGoSearchAPIWrapper", Wrapper)
+    monkeypatch.setattr(trip_tools, "_duckduckgo_client", None)
+    assert get_duckduckgo_client() is get_duckduckgo_client()
+    assert trip_tools.fetch_duckduckgo("clima")["results"][0]["url"] == "https://clima.pt"
+    trip_tools.fetch_duckduckgo("metro")
+    assert len(created) == 1
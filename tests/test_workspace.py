@@ -0,0 +1,58 @@
+import os
+import subprocess
+import sys
+
+import trip_crew
+from trip_store import TripStore
+from trip_workspace import ACTIVE_MARKER, MANIFEST, Workspace, gc_workspaces
+
+INPUTS = {"from_city": "São Paulo", "destination_city": "Lisboa", "date_from": "1 de maio",
+          "date_to": "8 de maio", "interests": "museus"}
+
+
+def test_concurrent_claims_get_separate_workspaces(tmp_path):
+    with Workspace.claim(INPUTS, root=str(tmp_path)) as first:
+        with Workspace.claim(INPUTS, root=str(tmp_path)) as second:
+            assert first.path != second.path
+            assert second.id == f"{first.id}-2"
+            assert second.exists(MANIFEST)
+        # A segunda execução terminou sem tirar a proteção da primeira
+        assert first.in_use()
+        assert not second.in_use()
+    assert not first.in_use()
+    with Workspace.claim(INPUTS, root=str(tmp_path)) as again:
+        assert again.path == first.path
+
+
+def test_gc_keeps_workspaces_in_use(tmp_path):
+    with Workspace.claim(INPUTS, root=str(tmp_path)) as live:
+        live.write_text("relatorio.md", "x" * 4096)
+        with Workspace.claim(dict(INPUTS, interests="praias"), root=str(tmp_path)) as done:
+            done.write_text("relatorio.md", "x" * 4096)
+        assert gc_workspaces(root=str(tmp_path), quota_mb=0) == [done.id]
+        assert os.path.isdir(live.path)
+
+
+def test_marker_of_a_dead_process_is_reclaimed(tmp_path):
+    with Workspace.claim(INPUTS, root=str(tmp_path)) as workspace:
+        path = workspace.path
+    dead = subprocess.run([sys.executable, "-c", "import os; print(os.getpid())"], capture_output=True, text=True)
+    with open(os.path.join(path, ACTIVE_MARKER), "w") as f:
+        f.write(dead.stdout.strip())
+    assert not Workspace(path).in_use()
+    with Workspace.claim(INPUTS, root=str(tmp_path)) as workspace:
+        assert workspace.path == path
+
+
+def test_restore_does_not_overwrite_a_live_workspace(monkeypatch, tmp_path):
+    # As pastas de geração padrão ficam na pasta temporária dos testes (conftest)
+    monkeypatch.setattr(trip_crew, "build_pdfs", lambda directory, files: {})
+    store = TripStore(str(tmp_path / "trips.sqlite"))
+    trip_id = store.add(INPUTS, {"roteiro_viagem.md": "# Antigo"})
+
+    with Workspace.claim(INPUTS) as live:
+        live.write_text("roteiro_viagem.md", "# Em andamento")
+        restored = trip_crew.restore_trip(trip_id, {}, store)
+        assert restored.path != live.path
+        assert live.read_text("roteiro_viagem.md") == "# Em andamento"
+        assert restored.read_text("roteiro_viagem.md") == "# Antigo"
@@ -0,0 +1,207 @@
+"""Planejamento de viagens em lote, sem a interface do Streamlit.
+
+Lê as viagens de um arquivo JSONL ou CSV (colunas from_city, destination_city,
+date_from, date_to, interests e, opcionalmente, id), roda várias ao mesmo tempo
+em processos separados e grava cada uma na sua pasta de geração. Os processos
+dividem com o app os limites de taxa (SQLite em TRIP_RATE_LIMIT_DB, por padrão
+no TRIP_CACHE_DIR) e os caches em disco; enquanto um pedido do app espera por
+um balde, os processos de lote não pegam fichas dele. As viagens concluídas ficam
+num checkpoint: rodar o mesmo comando de novo continua de onde parou.
+
+    python trip_batch.py destinos.jsonl --workers 4
+"""
+import argparse
+import csv
+import json
+import multiprocessing
+import os
+import sqlite3
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from trip_cache import CACHE_DIR, make_key
+from trip_utils import gc_logs
+
+# Viagens processadas ao mesmo tempo
+BATCH_WORKERS = int(os.getenv("TRIP_BATCH_WORKERS", 2))
+
+FIELDS = ("from_city", "destination_city", "date_from", "date_to", "interests")
+
+DONE = "done"
+FAILED = "failed"
+
+
+def read_trips(path):
+    """Reads trip requests from a JSONL or CSV file; returns ``[(key, inputs)]``.
+
+    The key is the item's ``id`` column when present, otherwise the hash of
+    its inputs, so the same trip listed twice runs once.
+    """
+    with open(path, "r", encoding="utf-8-sig", newline="") as f:
+        if path.lower().endswith(".csv"):
+            rows = list(csv.DictReader(f))
+        else:
+            rows = [json.loads(line) for line in f if line.strip()]
+
+    trips = {}
+    for number, row in enumerate(rows, start=1):
+        missing = [field for field in FIELDS if not str(row.get(field) or "").strip()]
+        if missing:
+            raise ValueError(f"{path}, item {number}: faltam os campos {', '.join(missing)}")
+        inputs = {field: str(row[field]).strip() for field in FIELDS}
+        key = str(row.get("id") or "").strip() or make_key("batch", inputs)[:16]
+        trips.setdefault(key, inputs)
+    return list(trips.items())
+
+
+class Checkpoint:
+    """SQLite record of finished batch items, so an interrupted batch can resume."""
+
+    def __init__(self, path):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS items (
+                key TEXT PRIMARY KEY,
+                status TEXT NOT NULL,
+                inputs TEXT NOT NULL,
+                workspace TEXT,
+                trip_id INTEGER,
+                error TEXT,
+                seconds REAL,
+                finished_at REAL
+            )"""
+        )
+        self._conn.commit()
+
+    def done_keys(self):
+        return {key for (key,) in self._conn.execute("SELECT key FROM items WHERE status = ?", (DONE,))}
+
+    def record(self, key, inputs, result):
+        self._conn.execute(
+            """INSERT OR REPLACE INTO items (key, status, inputs, workspace, trip_id, error, seconds, finished_at)
+               VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
+            (
+                key,
+                FAILED if result.get("error") else DONE,
+                json.dumps(inputs, ensure_ascii=False),
+                result.get("workspace"),
+                result.get("trip_id"),
+                result.get("error"),
+                result.get("seconds"),
+                time.time(),
+            ),
+        )
+        self._conn.commit()
+
+    def counts(self):
+        return dict(self._conn.execute("SELECT status, COUNT(*) FROM items GROUP BY status").fetchall())
+
+
+def run_trip(key, inputs, log_dir, use_history=True):
+    """Runs one trip in a worker process; errors are returned, not raised.
+
+    Uses the same job function as the app (workspace, PDFs, history store),
+    at batch priority and with the output going to ``log_dir/<key>.log``.
+    """
+    # Imports pesados só nos processos de trabalho
+    from trip_crew import TripCrew, generate_trip
+    from trip_jobs import JobContext
+    from trip_ratelimit import BATCH, request_priority
+    from trip_utils import LogFileOutput, redirect_output
+
+    files = {md_file: md_file[:-3] + ".pdf" for md_file in TripCrew.REPORT_FILES.values()}
+    job = JobContext(key, os.path.join(log_dir, f"{key}.log"))
+    start = time.perf_counter()
+    try:
+        with request_priority(BATCH), redirect_output(LogFileOutput(job.log_path)):
+            result = generate_trip(job, **inputs, files=files, use_history=use_history)
+    except Exception as e:
+        return {"error": f"{type(e).__name__}: {e}", "seconds": time.perf_counter() - start}
+    return {
+        "workspace": result["workspace"],
+        "trip_id": result["trip_id"],
+        "from_history": result["from_history"],
+        "seconds": time.perf_counter() - start,
+    }
+
+
+def format_duration(seconds):
+    seconds = int(seconds)
+    return f"{seconds // 3600:02d}:{seconds % 3600 // 60:02d}:{seconds % 60:02d}"
+
+
+def run_batch(trips, checkpoint, workers=BATCH_WORKERS, log_dir=None, use_history=True):
+    """Runs the pending trips on a process pool, printing throughput and ETA as they finish."""
+    done = checkpoint.done_keys()
+    pending = [(key, inputs) for key, inputs in trips if key not in done]
+    print(f"{len(trips)} viagens, {len(trips) - len(pending)} já concluídas, {len(pending)} a processar com {workers} processos")
+    if not pending:
+        return 0
+
+    log_dir = log_dir or os.path.join(CACHE_DIR, "batch_logs")
+    os.makedirs(log_dir, exist_ok=True)
+    gc_logs(log_dir)
+    failures = 0
+    start = time.monotonic()
+    # spawn: cada processo inicia limpo e lê a configuração do ambiente
+    executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+    try:
+        futures = {
+            executor.submit(run_trip, key, inputs, log_dir, use_history): (key, inputs)
+            for key, inputs in pending
+        }
+        for finished, future in enumerate(as_completed(futures), start=1):
+            key, inputs = futures[future]
+            result = future.result()
+            checkpoint.record(key, inputs, result)
+
+            elapsed = time.monotonic() - start
+            rate = finished / elapsed
+            eta = (len(pending) - finished) / rate
+            if result.get("error"):
+                failures += 1
+                status = f"ERRO: {result['error']}"
+            else:
+                status = "do histórico" if result["from_history"] else f"pasta {result['workspace']}"
+            print(
+                f"[{finished}/{len(pending)}] {inputs['destination_city']} ({key}) em {result['seconds']:.0f}s, {status} | "
+                f"{rate * 60:.1f} viagens/min | ETA {format_duration(eta)}",
+                flush=True,
+            )
+    except KeyboardInterrupt:
+        print("\nInterrompido: rode o mesmo comando para continuar de onde parou", file=sys.stderr)
+        executor.shutdown(wait=False, cancel_futures=True)
+        raise
+    executor.shutdown()
+    print(f"Concluído em {format_duration(time.monotonic() - start)}: {len(pending) - failures} ok, {failures} com erro")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("input", help="arquivo .jsonl ou .csv com as viagens")
+    parser.add_argument("--workers", type=int, default=BATCH_WORKERS, help="viagens processadas ao mesmo tempo")
+    parser.add_argument("--checkpoint", help="arquivo SQLite do progresso (padrão: <input>.checkpoint.sqlite)")
+    parser.add_argument("--output-dir", help="pasta das gerações (padrão: TRIP_WORKSPACES_DIR)")
+    parser.add_argument("--regenerate", action="store_true", help="gera de novo viagens que já estão no histórico, sem reaproveitar tarefas nem respostas do LLM")
+    args = parser.parse_args()
+
+    # Os processos de trabalho herdam o ambiente: limites de taxa compartilhados e PDFs no próprio processo
+    os.environ.setdefault("TRIP_PDF_WORKERS", "1")
+    if args.output_dir:
+        os.environ["TRIP_WORKSPACES_DIR"] = os.path.abspath(args.output_dir)
+
+    trips = read_trips(args.input)
+    checkpoint = Checkpoint(args.checkpoint or f"{args.input}.checkpoint.sqlite")
+    try:
+        failures = run_batch(trips, checkpoint, args.workers, use_history=not args.regenerate)
+    except KeyboardInterrupt:
+        sys.exit(130)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,226 @@
+import ast
+import functools
+import json
+import math
+import operator
+import os
+
+import numpy as np
+
+# Tabela local de câmbio: quanto vale 1 unidade de cada moeda em reais (valores aproximados).
+# Substitua com TRIP_CURRENCY_RATES='{"EUR": 6.1, ...}' ou com o caminho de um arquivo JSON.
+DEFAULT_RATES = {
+    "BRL": 1.0,
+    "USD": 5.4,
+    "EUR": 6.0,
+    "GBP": 7.0,
+    "ARS": 0.005,
+    "CLP": 0.0058,
+    "UYU": 0.13,
+    "MXN": 0.29,
+    "JPY": 0.036,
+    "CHF": 6.5,
+    "CAD": 3.9,
+}
+EXPRESSION_CACHE_SIZE = int(os.getenv("TRIP_CALC_CACHE_SIZE", 1024))
+# Limites que impedem expressões caras demais (ex.: 9**9**9)
+MAX_EXPONENT = 100
+MAX_EXPRESSION_LENGTH = 500
+# Dias de uma viagem (o cálculo de custos cria uma coluna por dia)
+MAX_DAYS = 366
+
+_BINARY_OPERATORS = {
+    ast.Add: operator.add,
+    ast.Sub: operator.sub,
+    ast.Mult: operator.mul,
+    ast.Div: operator.truediv,
+    ast.FloorDiv: operator.floordiv,
+    ast.Mod: operator.mod,
+}
+_UNARY_OPERATORS = {
+    ast.UAdd: operator.pos,
+    ast.USub: operator.neg,
+}
+_FUNCTIONS = {
+    "abs": abs,
+    "round": round,
+    "min": min,
+    "max": max,
+    "sum": lambda *values: sum(values[0]) if len(values) == 1 and isinstance(values[0], (list, tuple)) else sum(values),
+    "sqrt": math.sqrt,
+    "ceil": math.ceil,
+    "floor": math.floor,
+}
+# Funções que aceitam uma lista de valores, ex.: sum([10, 20, 30])
+_SEQUENCE_FUNCTIONS = frozenset({"min", "max", "sum"})
+_CONSTANTS = {"pi": math.pi, "e": math.e}
+
+
+class CalculationError(ValueError):
+    """Raised for expressions that are invalid or use anything but arithmetic."""
+
+
+def _power(base, exponent):
+    if abs(exponent) > MAX_EXPONENT:
+        raise CalculationError(f"Expoente maior que {MAX_EXPONENT}")
+    if isinstance(base, int) and isinstance(exponent, int) and base.bit_length() * abs(exponent) > 4096:
+        raise CalculationError("Resultado grande demais")
+    return operator.pow(base, exponent)
+
+
+def _number(value):
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        raise CalculationError(f"Valor não numérico: {type(value).__name__}")
+    return value
+
+
+def _compile(node, sequence_allowed=False):
+    """Turns a whitelisted AST node into a closure; anything else is rejected.
+
+    List and tuple literals are only accepted as direct arguments of
+    min/max/sum (``sequence_allowed``), and operators only ever see numbers,
+    so an expression cannot build large sequences (``[0] * 10**9``).
+    """
+    if isinstance(node, ast.Expression):
+        return _compile(node.body)
+    if isinstance(node, ast.Constant):
+        if isinstance(node.value, bool) or not isinstance(node.value, (int, float)):
+            raise CalculationError(f"Valor não numérico: {node.value!r}")
+        value = node.value
+        return lambda: value
+    if isinstance(node, ast.BinOp):
+        if isinstance(node.op, ast.Pow):
+            op = _power
+        elif type(node.op) in _BINARY_OPERATORS:
+            op = _BINARY_OPERATORS[type(node.op)]
+        else:
+            raise CalculationError(f"Operador não permitido: {type(node.op).__name__}")
+        left, right = _compile(node.left), _compile(node.right)
+        return lambda: op(_number(left()), _number(right()))
+    if isinstance(node, ast.UnaryOp) and type(node.op) in _UNARY_OPERATORS:
+        op, operand = _UNARY_OPERATORS[type(node.op)], _compile(node.operand)
+        return lambda: op(_number(operand()))
+    if isinstance(node, (ast.List, ast.Tuple)) and sequence_allowed:
+        elements = [_compile(element) for element in node.elts]
+        return lambda: [element() for element in elements]
+    if isinstance(node, ast.Name) and node.id in _CONSTANTS:
+        value = _CONSTANTS[node.id]
+        return lambda: value
+    if isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and node.func.id in _FUNCTIONS and not node.keywords:
+        function = _FUNCTIONS[node.func.id]
+        sequences = node.func.id in _SEQUENCE_FUNCTIONS and len(node.args) == 1
+        args = [_compile(arg, sequence_allowed=sequences) for arg in node.args]
+        return lambda: function(*(arg() for arg in args))
+    raise CalculationError(f"Expressão não permitida: {ast.dump(node)[:80]}")
+
+
+@functools.lru_cache(maxsize=EXPRESSION_CACHE_SIZE)
+def compile_expression(expression):
+    """Parses and validates an arithmetic expression once; returns a callable that evaluates it."""
+    if len(expression) > MAX_EXPRESSION_LENGTH:
+        raise CalculationError(f"Expressão maior que {MAX_EXPRESSION_LENGTH} caracteres")
+    try:
+        tree = ast.parse(expression.strip(), mode="eval")
+    except SyntaxError as e:
+        raise CalculationError("Sintaxe inválida") from e
+    return _compile(tree)
+
+
+def evaluate(expression):
+    """Evaluates an arithmetic expression (numbers, + - * / // % **, a few math functions)."""
+    try:
+        # Resultados complexos, como (-8) ** 0.5, não são valores de custo
+        return _number(compile_expression(str(expression))())
+    except CalculationError:
+        raise
+    except (ArithmeticError, TypeError, ValueError) as e:
+        raise CalculationError(str(e)) from e
+
+
+@functools.lru_cache(maxsize=1)
+def load_rates():
+    """Local exchange-rate table (value of one unit in BRL), with TRIP_CURRENCY_RATES overrides."""
+    rates = dict(DEFAULT_RATES)
+    override = os.getenv("TRIP_CURRENCY_RATES", "").strip()
+    if override:
+        if not override.startswith("{"):
+            with open(override, "r", encoding="utf-8") as f:
+                override = f.read()
+        rates.update({code.upper(): float(value) for code, value in json.loads(override).items()})
+    return rates
+
+
+def _days_of(row):
+    """Days a cost applies to: ``days`` as a list of day numbers or a count (days 1..n), or ``day``.
+
+    Day numbers and counts are limited to ``MAX_DAYS``.
+    """
+    days = row.get("days", row.get("day", 1))
+    if isinstance(days, (list, tuple)):
+        if len(days) > MAX_DAYS:
+            raise CalculationError(f"Mais de {MAX_DAYS} dias em um item")
+        days = [int(day) for day in days]
+    elif "days" in row:
+        if int(days) > MAX_DAYS:
+            raise CalculationError(f"Mais de {MAX_DAYS} dias em um item")
+        days = list(range(1, int(days) + 1))
+    else:
+        days = [int(days)]
+    if any(day < 1 or day > MAX_DAYS for day in days):
+        raise CalculationError(f"Os dias vão de 1 a {MAX_DAYS}")
+    return days
+
+
+def aggregate_costs(items, currency="BRL", rates=None):
+    """Totals a table of costs in one vectorized pass.
+
+    Each item has ``item`` (name), ``unit_cost``, optional ``quantity`` (per
+    day, default 1), ``currency`` (default ``currency``) and the days it
+    applies to (``days``: count or list of day numbers, or ``day``). Amounts
+    are converted with the local rate table, optionally overridden by
+    ``rates``. Returns the total and the per-day and per-item totals.
+    """
+    if not items:
+        raise CalculationError("Nenhum item informado")
+    table = load_rates()
+    if rates:
+        table = dict(table, **{code.upper(): float(value) for code, value in rates.items()})
+    currency = currency.upper()
+    if currency not in table:
+        raise CalculationError(f"Moeda sem cotação: {currency}")
+
+    names = [str(row.get("item", f"item {i + 1}")) for i, row in enumerate(items)]
+    currencies = [str(row.get("currency", currency)).upper() for row in items]
+    missing = sorted({code for code in currencies if code not in table})
+    if missing:
+        raise CalculationError(f"Moedas sem cotação: {', '.join(missing)}")
+    try:
+        unit_costs = np.array([float(row["unit_cost"]) for row in items])
+        quantities = np.array([float(row.get("quantity", 1)) for row in items])
+        item_days = [_days_of(row) for row in items]
+    except (KeyError, TypeError, ValueError) as e:
+        raise CalculationError(f"Item inválido: {e}") from e
+
+    # Custo diário de cada item já convertido para a moeda pedida
+    factors = np.array([table[code] / table[currency] for code in currencies])
+    daily = unit_costs * quantities * factors
+
+    # Matriz itens x dias: 1 quando o item se aplica ao dia
+    all_days = sorted({day for days in item_days for day in days})
+    column = {day: i for i, day in enumerate(all_days)}
+    applies = np.zeros((len(items), len(all_days)))
+    for row, days in enumerate(item_days):
+        applies[row, [column[day] for day in days]] = 1
+
+    per_item = applies.sum(axis=1) * daily
+    per_day = daily @ applies
+    per_item_totals = {}
+    for name, total in zip(names, per_item):
+        per_item_totals[name] = round(per_item_totals.get(name, 0.0) + float(total), 2)
+    return {
+        "currency": currency,
+        "total": round(float(per_item.sum()), 2),
+        "per_day": {str(day): round(float(total), 2) for day, total in zip(all_days, per_day)},
+        "per_item": per_item_totals,
+        "average_per_day": round(float(per_day.mean()), 2) if len(all_days) else 0.0,
+    }
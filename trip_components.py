@@ -1,16 +1,36 @@
-from crewai import Agent, Task, LLM
+from crewai import Agent, Task
+from trip_llm import CachedLLM
 from trip_tools import SearchTools, CalculatorTools
 from textwrap import dedent
 import os
+import threading
 from dotenv import load_dotenv
 load_dotenv()
 
+_llm = None
+_llm_lock = threading.Lock()
+
+
+def get_llm():
+    """Returns the process-wide Gemini client, shared by the agents of every run.
+
+    The agents themselves are cheap to build but keep per-run state in
+    crewai, so each run still gets its own.
+    """
+    global _llm
+    with _llm_lock:
+        if _llm is None:
+            _llm = CachedLLM(
+                model="gemini/gemini-2.0-flash",
+                api_key=os.getenv("GOOGLE_API_KEY"),
+            )
+    return _llm
+
+
 class TripAgents:
-    def __init__(self):
-        self.gemini = LLM(
-            model="gemini/gemini-2.0-flash",
-            api_key=os.getenv("GOOGLE_API_KEY"),
-        )
+    def __init__(self, llm=None):
+        # llm: substitui o Gemini (ex.: o LLM falso dos benchmarks)
+        self.gemini = llm or get_llm()
 
     def city_info_agent(self):
         return Agent(
@@ -28,7 +48,7 @@ class TripAgents:
                 """
             ),
             llm=self.gemini,
-            tools=[SearchTools.search_tavily],
+            tools=[SearchTools.search_previous, SearchTools.search_tavily, SearchTools.search_tavily_batch],
             verbose=True,
             max_iter=10,
             allow_delegation=False,
@@ -46,8 +66,11 @@ class TripAgents:
             ),
             llm=self.gemini,
             tools=[
+                SearchTools.search_previous,
                 SearchTools.search_tavily,
-                CalculatorTools.calculate
+                SearchTools.search_tavily_batch,
+                CalculatorTools.calculate,
+                CalculatorTools.calculate_costs,
             ],
             verbose=True,
             max_iter=10,
@@ -65,7 +88,13 @@ class TripAgents:
                 """
             ),
             llm=self.gemini,
-            tools=[SearchTools.search_tavily],
+            tools=[
+                SearchTools.search_previous,
+                SearchTools.search_tavily,
+                SearchTools.search_tavily_batch,
+                CalculatorTools.calculate,
+                CalculatorTools.calculate_costs,
+            ],
             verbose=True,
             max_iter=10,
             allow_delegation=False,
@@ -84,7 +113,7 @@ class TripAgents:
                 """
             ),
             llm=self.gemini,
-            tools=[SearchTools.search_tavily],
+            tools=[SearchTools.search_previous, SearchTools.search_tavily],
             verbose=True,
             max_iter=5,
             allow_delegation=False,
@@ -122,7 +151,6 @@ class TripTasks:
                 """
             ),
             agent=agent,
-            output_file='relatorio_local.md',
         )
 
     def plan_logistics_task(self, context, agent, destination_city, interests, date_from, date_to):
@@ -152,7 +180,6 @@ class TripTasks:
             ),
             context=context,
             agent=agent,
-            output_file='relatorio_logistica.md',
         )
 
     def build_itinerary_task(self, context, agent, destination_city, interests, date_from, date_to):
@@ -183,10 +210,31 @@ class TripTasks:
                 """),
             context=context,
             agent=agent,
-            output_file='roteiro_viagem.md',
         )
 
 
+    def language_research_task(self, agent, destination_city):
+        return Task(
+            description=dedent(
+                f"""
+                Pesquisar o idioma falado em {destination_city} e os costumes que um turista precisa conhecer.
+                Levante expressões comuns para restaurantes, transporte, compras, pedidos de ajuda, saudações e agradecimentos,
+                com a pronúncia aproximada, e as regras de etiqueta local (gestos, gorjetas, horários, hábitos sociais).
+                Use as ferramentas disponíveis para buscar fontes atualizadas e confiáveis.
+                Retorne em português.
+                """
+            ),
+            expected_output=dedent(
+                """
+                Notas de pesquisa (em formato markdown) em português com:
+                - Idioma(s) usados no destino e se o inglês é bem aceito;
+                - Expressões úteis por situação, com tradução e pronúncia aproximada;
+                - Costumes e regras de etiqueta local.
+                """
+            ),
+            agent=agent,
+        )
+
     def language_guide_task(self, context, agent, destination_city):
         return Task(
             description=dedent(
@@ -201,9 +249,7 @@ class TripTasks:
                 - Dicas de etiqueta local que o turista deve saber (gestos, hábitos, regras sociais).
 
                 Use linguagem clara e educativa.
-
-                Considere o seguinte roteiro de viagem:
-                '{context}'
+                Considere as atividades do roteiro de viagem e a pesquisa de idioma e etiqueta recebidos como contexto.
                 """
             ),
             expected_output=dedent(
@@ -215,7 +261,7 @@ class TripTasks:
                 - Recomendações práticas para comunicação eficaz no destino.
                 """
             ),
+            context=context,
             agent=agent,
-            output_file='guia_comunicacao.md',
         )
 
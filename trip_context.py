@@ -0,0 +1,175 @@
+import os
+import re
+
+from trip_cache import env_flag
+
+# Compactação do contexto entre tarefas (desative com TRIP_CONTEXT_COMPACTION=0)
+CONTEXT_COMPACTION = env_flag("TRIP_CONTEXT_COMPACTION")
+# Tokens (estimados) do contexto que cada tarefa recebe dos relatórios anteriores
+CONTEXT_TOKEN_BUDGET = int(os.getenv("TRIP_CONTEXT_TOKEN_BUDGET", 2500))
+
+# Characters per token, a rough average for Portuguese/English text
+CHARS_PER_TOKEN = 4
+
+# Facts the downstream tasks need from the upstream reports
+FACT_PATTERNS = {
+    "costs": re.compile(
+        r"R\$|US\$|€|£|¥|\$\s?\d|\d\s?(reais|euros?|d[óo]lares|libras|ienes|pesos)\b|"
+        r"\b(custo|pre[çc]o|tarifa|di[áa]ria|ingresso|gasto|or[çc]amento|gratuit|passagem)",
+        re.IGNORECASE,
+    ),
+    "dates": re.compile(
+        r"\b\d{1,2}/\d{1,2}\b|\b\d{1,2} de [a-zç]+\b|\bdia \d+\b|\b\d{1,2}h(\d{2})?\b|\b\d{1,2}:\d{2}\b|"
+        r"\b(segunda|ter[çc]a|quarta|quinta|sexta|s[áa]bado|domingo|manh[ãa]|tarde|noite|hor[áa]rio|"
+        r"temporada|esta[çc][ãa]o|clima|temperatura|chuva)",
+        re.IGNORECASE,
+    ),
+    "attractions": re.compile(
+        r"\b(museu|parque|pra[çc]a|igreja|catedral|bas[íi]lica|mercado|mirante|praia|castelo|pal[áa]cio|torre|"
+        r"monumento|restaurante|caf[ée]|bar|festival|evento|show|feira|passeio|tour|galeria|teatro|jardim|"
+        r"ponte|rua|avenida|atra[çc][ãa]o|ponto tur[íi]stico)",
+        re.IGNORECASE,
+    ),
+    "neighbourhoods": re.compile(
+        r"\b(bairro|regi[ãa]o|zona|centro|distrito|hist[óo]rico|pr[óo]ximo a|perto de|hotel|hostel|pousada|"
+        r"hospedagem|metr[ôo]|esta[çc][ãa]o|aeroporto|[ôo]nibus|trem|t[áa]xi|uber|voo)",
+        re.IGNORECASE,
+    ),
+}
+
+_HEADING = re.compile(r"^\s*#{1,6}\s")
+_TABLE_ROW = re.compile(r"^\s*\|")
+_TABLE_SEPARATOR = re.compile(r"^\s*\|?\s*:?-{2,}")
+_LIST_ITEM = re.compile(r"^\s*([-*+]|\d+[.)])\s")
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+(?=[A-ZÀ-Ú0-9*])")
+
+
+def estimate_tokens(text):
+    """Approximate token count, good enough for budgeting prompts."""
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def fact_score(text):
+    """Number of fact categories (costs, dates, attractions, neighbourhoods) the text mentions."""
+    return sum(1 for pattern in FACT_PATTERNS.values() if pattern.search(text))
+
+
+def _heading_level(line):
+    return len(line.strip()) - len(line.strip().lstrip("#"))
+
+
+def _units(text):
+    """Splits a report into ``(line, position, kind, text)`` units; paragraphs become sentences."""
+    units = []
+    for number, line in enumerate(text.splitlines()):
+        stripped = line.strip()
+        if not stripped or stripped.startswith("```"):
+            continue
+        if _HEADING.match(line):
+            units.append((number, 0, "heading", stripped))
+        elif _TABLE_ROW.match(line):
+            kind = "separator" if _TABLE_SEPARATOR.match(line) else "row"
+            units.append((number, 0, kind, line.rstrip()))
+        elif _LIST_ITEM.match(line):
+            units.append((number, 0, "item", line.rstrip()))
+        else:
+            for position, sentence in enumerate(_SENTENCE_END.split(stripped)):
+                units.append((number, position, "sentence", sentence))
+    return units
+
+
+def compact_report(text, budget):
+    """Keeps the fact-bearing parts of a markdown report within ``budget`` tokens.
+
+    Headings give the structure; list items, table rows and paragraph
+    sentences are ranked by how many kinds of facts they mention (costs,
+    dates, attractions, neighbourhoods) and kept in that order while the
+    budget lasts. The result keeps the original order and drops headings
+    left without content. A report that already fits is returned unchanged.
+    """
+    if estimate_tokens(text) <= budget:
+        return text
+    units = _units(text)
+    kept = set()
+    used = 0
+
+    def keep(index):
+        nonlocal used
+        cost = estimate_tokens(units[index][3]) + 1
+        if used + cost > budget:
+            return False
+        kept.add(index)
+        used += cost
+        return True
+
+    # Títulos primeiro: são curtos e dão a estrutura do relatório (dias, seções)
+    for index, unit in enumerate(units):
+        if unit[2] == "heading":
+            keep(index)
+    ranked = sorted(
+        (index for index, unit in enumerate(units) if unit[2] in ("row", "item", "sentence")),
+        key=lambda index: (-fact_score(units[index][3]), index),
+    )
+    # O cabeçalho de uma tabela vai junto com a primeira linha mantida
+    table_header = {}
+    for index, unit in enumerate(units):
+        if unit[2] == "row":
+            previous = units[index - 1] if index else None
+            if previous is None or previous[2] not in ("row", "separator"):
+                header = index
+            table_header[index] = header
+    for index in ranked:
+        header = table_header.get(index)
+        if header is not None and header != index and header not in kept:
+            if not keep(header):
+                continue
+            if header + 1 < len(units) and units[header + 1][2] == "separator":
+                keep(header + 1)
+        keep(index)
+
+    # Títulos sem nenhum conteúdo mantido abaixo deles saem
+    for index, unit in enumerate(units):
+        if unit[2] != "heading" or index not in kept:
+            continue
+        level = _heading_level(unit[3])
+        following = index + 1
+        has_content = False
+        while following < len(units):
+            other = units[following]
+            if other[2] == "heading" and _heading_level(other[3]) <= level:
+                break
+            if other[2] != "heading" and following in kept:
+                has_content = True
+                break
+            following += 1
+        if not has_content:
+            kept.discard(index)
+
+    lines = []
+    last_line = None
+    for index in sorted(kept):
+        number, position, kind, content = units[index]
+        if kind == "sentence" and last_line == number:
+            lines[-1] += " " + content
+        else:
+            lines.append(content)
+        last_line = number
+    return "\n".join(lines)
+
+
+def compact_context(outputs, budget=None):
+    """Compacts the upstream reports a task receives so together they fit ``budget`` tokens.
+
+    The budget is shared evenly; a report smaller than its share is kept
+    whole and leaves the rest to the larger ones. Returns the compacted
+    outputs in the same order.
+    """
+    budget = CONTEXT_TOKEN_BUDGET if budget is None else budget
+    compacted = list(outputs)
+    remaining = budget
+    pending = sorted(range(len(outputs)), key=lambda i: estimate_tokens(outputs[i]))
+    for position, i in enumerate(pending):
+        share = remaining // (len(pending) - position)
+        compacted[i] = compact_report(outputs[i], share)
+        remaining -= estimate_tokens(compacted[i])
+    return compacted
@@ -0,0 +1,503 @@
+import contextvars
+import functools
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager, nullcontext
+
+from crewai import Crew, Process
+from crewai.tasks.task_output import TaskOutput
+
+try:
+    from crewai.events import LLMStreamChunkEvent, crewai_event_bus
+except ImportError:  # crewai sem barramento de eventos: sem rascunhos ao vivo
+    LLMStreamChunkEvent = crewai_event_bus = None
+
+from trip_cache import CACHE_DIR, DiskCache, env_flag, is_regenerating, make_key, regenerating
+from trip_components import TripAgents, TripTasks
+from trip_context import CONTEXT_COMPACTION, CONTEXT_TOKEN_BUDGET, compact_context, estimate_tokens
+from trip_evidence import evidence_run
+from trip_llm import STREAM_TOKENS
+from trip_pdf import build_pdfs
+from trip_scheduler import TaskScheduler, split_phases, task_dependencies
+from trip_store import get_trip_store
+from trip_tracing import TRACE_FILE, record_span, span, trace_run
+from trip_workspace import Workspace, draft_file, gc_workspaces
+
+# Memoização das tarefas (desative com TRIP_TASK_MEMO=0)
+TASK_MEMO_ENABLED = env_flag("TRIP_TASK_MEMO")
+TASK_MEMO_TTL = int(os.getenv("TRIP_TASK_MEMO_TTL", 7 * 24 * 3600))
+TASK_MEMO_MAX_ENTRIES = int(os.getenv("TRIP_TASK_MEMO_MAX_ENTRIES", 2000))
+
+# Execução concorrente das tarefas
+TASK_MAX_CONCURRENCY = int(os.getenv("TRIP_TASK_MAX_CONCURRENCY", 2))
+# Fase de pesquisa em paralelo antes da síntese (TRIP_SPLIT_PHASES=1)
+SPLIT_PHASES = env_flag("TRIP_SPLIT_PHASES", "0")
+
+_task_memo = None
+
+# Rascunhos das tarefas em andamento, por id da tarefa
+_drafts = {}
+_drafts_lock = threading.Lock()
+_draft_listener_installed = False
+
+
+def get_task_memo():
+    """Returns the process-wide task output store, or None when memoization is disabled."""
+    global _task_memo
+    if not TASK_MEMO_ENABLED:
+        return None
+    if _task_memo is None:
+        _task_memo = DiskCache(
+            os.path.join(CACHE_DIR, "tasks.sqlite"),
+            max_entries=TASK_MEMO_MAX_ENTRIES,
+            default_ttl=TASK_MEMO_TTL,
+        )
+    return _task_memo
+
+
+def task_fingerprint(task, upstream_outputs):
+    """Fingerprint of everything that determines a task's output.
+
+    Covers the task prompt, the agent definition (role, goal, backstory,
+    tools, model) and the upstream context the task sees (compacted or not),
+    so a task is recomputed only when its own inputs or an upstream report
+    changed.
+    """
+    agent = task.agent
+    return make_key(
+        "task",
+        task.description,
+        task.expected_output,
+        agent.role,
+        agent.goal,
+        agent.backstory,
+        sorted(tool.name for tool in agent.tools or []),
+        getattr(agent.llm, "model", str(agent.llm)),
+        upstream_outputs,
+    )
+
+
+class CrewCancelled(Exception):
+    """Raised between tasks when the run was cancelled."""
+
+
+def usage_dict(crew_output):
+    """Token usage of a crew run as a plain dict."""
+    usage = getattr(crew_output, "token_usage", None)
+    if hasattr(usage, "model_dump"):
+        return usage.model_dump()
+    return dict(usage) if isinstance(usage, dict) else None
+
+
+def context_tasks(task):
+    """Upstream tasks listed in ``task.context`` (crewai may use a sentinel for "not set")."""
+    return task.context if isinstance(task.context, list) else []
+
+
+class CompactedContext:
+    """Stands in for an upstream task in ``task.context``, holding its compacted output."""
+
+    def __init__(self, task, raw):
+        self.description = task.description
+        self.output = TaskOutput(description=task.description, raw=raw, agent=task.output.agent)
+
+
+@contextmanager
+def compacted_context(task, outputs):
+    """Makes ``task`` see ``outputs`` instead of its upstream tasks' full outputs while it runs."""
+    upstream = task.context
+    task.context = [CompactedContext(t, raw) for t, raw in zip(context_tasks(task), outputs)]
+    try:
+        yield
+    finally:
+        task.context = upstream
+
+
+def agent_step_recorder(role):
+    """Crew step callback recording each agent iteration as a span (time since the previous step)."""
+    last = [time.time()]
+
+    def on_step(step):
+        now = time.time()
+        record_span(role, "agent_step", now - last[0], end=now,
+                    step=type(step).__name__, tool=getattr(step, "tool", None))
+        last[0] = now
+
+    return on_step
+
+
+class TaskDraft:
+    """Writes the chunks the LLM streams for one task to its draft file.
+
+    Only the current LLM call is kept: the next ReAct step starts the draft over.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.call_id = None
+
+    def add(self, call_id, chunk):
+        mode = "a" if call_id == self.call_id else "w"
+        self.call_id = call_id
+        with open(self.path, mode, encoding="utf-8") as f:
+            f.write(chunk)
+
+
+def _on_stream_chunk(source, event):
+    draft = _drafts.get(getattr(event, "task_id", None))
+    if draft is not None and event.chunk:
+        draft.add(event.call_id, event.chunk)
+
+
+@contextmanager
+def stream_draft(task, path):
+    """Streams the task's LLM output to ``path`` while it runs and removes the draft afterwards."""
+    global _draft_listener_installed
+    if crewai_event_bus is None:
+        yield
+        return
+    with _drafts_lock:
+        if not _draft_listener_installed:
+            crewai_event_bus.on(LLMStreamChunkEvent)(_on_stream_chunk)
+            _draft_listener_installed = True
+        _drafts[str(task.id)] = TaskDraft(path)
+    try:
+        yield
+    finally:
+        with _drafts_lock:
+            _drafts.pop(str(task.id), None)
+        if os.path.exists(path):
+            os.remove(path)
+
+
+class TripCrew:
+    TASK_NAMES = ["city_info", "plan_logistics", "language_research", "build_itinerary", "language_guide"]
+    # Markdown file written to the workspace for each task (language_research only feeds the guide)
+    REPORT_FILES = {
+        "city_info": "relatorio_local.md",
+        "plan_logistics": "relatorio_logistica.md",
+        "build_itinerary": "roteiro_viagem.md",
+        "language_guide": "guia_comunicacao.md",
+    }
+    # Research tasks only gather facts. language_research never depends on
+    # the others, so it runs alongside city_info; with split_phases all of
+    # them start in parallel
+    PHASES = {
+        "city_info": "research",
+        "plan_logistics": "research",
+        "language_research": "research",
+        "build_itinerary": "synthesis",
+        "language_guide": "synthesis",
+    }
+
+    def __init__(self, from_city, destination_city, date_from, date_to, interests, memo=None,
+                 max_concurrency=None, split_phases=None, thread_initializer=None, cancel_event=None,
+                 workspace=None, on_task_done=None, llm=None, context_budget=None):
+        self.from_city = from_city
+        self.destination_city = destination_city
+        self.date_from = date_from
+        self.date_to = date_to
+        self.interests = interests
+        self.memo = memo if memo is not None else get_task_memo()
+        self.max_concurrency = max_concurrency or TASK_MAX_CONCURRENCY
+        self.split_phases = SPLIT_PHASES if split_phases is None else split_phases
+        self.thread_initializer = thread_initializer
+        self.cancel_event = cancel_event
+        self.workspace = workspace
+        self.on_task_done = on_task_done
+        self.llm = llm
+        # Orçamento de tokens do contexto de cada tarefa (0: contexto completo)
+        if context_budget is None:
+            context_budget = CONTEXT_TOKEN_BUDGET if CONTEXT_COMPACTION else 0
+        self.context_budget = context_budget
+        self.reused = []
+        self.executed = []
+        self.token_usage = {}
+        self.context_usage = {}
+        self.report = None
+
+    def build(self):
+        """Builds the agents and tasks, in ``TASK_NAMES`` order; returns ``(agents, tasks)``."""
+        agents = TripAgents(llm=self.llm)
+        tasks = TripTasks()
+
+        city_info_agent = agents.city_info_agent()
+        logistics_expert_agent = agents.logistics_expert_agent()
+        itinerary_planner_agent = agents.itinerary_planner_agent()
+        language_research_agent = agents.language_guide_agent()
+        language_guide_agent = agents.language_guide_agent()
+
+        city_info = tasks.city_info_task(
+            city_info_agent,
+            self.from_city,
+            self.destination_city,
+            self.interests,
+            self.date_from,
+            self.date_to
+        )
+
+        plan_logistics = tasks.plan_logistics_task(
+            [city_info],
+            logistics_expert_agent,
+            self.destination_city,
+            self.interests,
+            self.date_from,
+            self.date_to
+        )
+
+        # O idioma e a etiqueta não dependem do roteiro: a pesquisa começa junto com city_info
+        language_research = tasks.language_research_task(language_research_agent, self.destination_city)
+
+        build_itinerary = tasks.build_itinerary_task(
+            [city_info, plan_logistics],
+            itinerary_planner_agent,
+            self.destination_city,
+            self.interests,
+            self.date_from,
+            self.date_to
+        )
+
+        language_guide = tasks.language_guide_task(
+            [build_itinerary, language_research],
+            language_guide_agent,
+            self.destination_city
+        )
+
+        return (
+            [city_info_agent, logistics_expert_agent, language_research_agent, itinerary_planner_agent, language_guide_agent],
+            [city_info, plan_logistics, language_research, build_itinerary, language_guide],
+        )
+
+    def run_task(self, task):
+        """Runs a single task in its own crew; its context tasks already hold outputs.
+
+        Returns the CrewOutput, which carries the token usage of the run.
+        """
+        crew = Crew(
+            agents=[task.agent],
+            tasks=[task],
+            process=Process.sequential,
+            full_output=True,
+            verbose=False,
+            step_callback=agent_step_recorder(task.agent.role),
+        )
+        return crew.kickoff()
+
+    def draft(self, name, task):
+        """Streams the task's draft into the workspace when TRIP_STREAM_TOKENS is on."""
+        if self.workspace is None or not STREAM_TOKENS or name not in self.REPORT_FILES:
+            return nullcontext()
+        return stream_draft(task, self.workspace.file(draft_file(self.REPORT_FILES[name])))
+
+    def resolve_task(self, name, task):
+        """Restores a memoized output for the task or runs it; returns the markdown output.
+
+        ``on_task_done(name, markdown)`` is called as soon as the report is
+        written, so callers can show it before the other tasks finish.
+        """
+        if self.cancel_event is not None and self.cancel_event.is_set():
+            raise CrewCancelled("Geração cancelada")
+
+        with span(name, "task", agent=task.agent.role) as task_span:
+            markdown = self._resolve_task(name, task, task_span)
+        if self.on_task_done is not None:
+            self.on_task_done(name, markdown)
+        return markdown
+
+    def task_context(self, name, task, task_span):
+        """Upstream outputs the task will see, compacted to the context budget.
+
+        Logs and records the estimated tokens before and after compaction.
+        """
+        upstream = [t.output.raw for t in context_tasks(task)]
+        if not upstream or not self.context_budget:
+            return upstream
+        compacted = compact_context(upstream, self.context_budget)
+        full_tokens = sum(estimate_tokens(raw) for raw in upstream)
+        context_tokens = sum(estimate_tokens(raw) for raw in compacted)
+        self.context_usage[name] = {"context_tokens_full": full_tokens, "context_tokens": context_tokens}
+        task_span.set(context_tokens_full=full_tokens, context_tokens=context_tokens)
+        print(f"Contexto de {name}: {full_tokens} -> {context_tokens} tokens (estimados, orçamento {self.context_budget})")
+        return compacted
+
+    def _resolve_task(self, name, task, task_span):
+        upstream = self.task_context(name, task, task_span)
+        fingerprint = task_fingerprint(task, upstream)
+        # Ao gerar de novo, a tarefa roda mesmo com um resultado memorizado (que é substituído)
+        cached = self.memo.get(fingerprint) if self.memo is not None and not is_regenerating() else None
+
+        if cached is not None:
+            task.output = TaskOutput(description=task.description, raw=cached, agent=task.agent.role)
+            self.reused.append(name)
+            task_span.set(cache_hits=1)
+        else:
+            with self.draft(name, task), compacted_context(task, upstream) if upstream and self.context_budget else nullcontext():
+                usage = usage_dict(self.run_task(task)) or {}
+            # Os tokens do contexto ficam junto com o uso da tarefa no histórico
+            self.token_usage[name] = dict(usage, **self.context_usage.get(name, {}))
+            task_span.set(tokens=usage.get("total_tokens", 0),
+                          prompt_tokens=usage.get("prompt_tokens", 0),
+                          completion_tokens=usage.get("completion_tokens", 0))
+            if self.memo is not None and task.output.raw:
+                self.memo.set(fingerprint, task.output.raw)
+            self.executed.append(name)
+
+        if self.workspace is not None and name in self.REPORT_FILES:
+            self.workspace.write_text(self.REPORT_FILES[name], task.output.raw)
+        return task.output.raw
+
+    def run(self):
+        """Runs the tasks as a dependency graph, concurrently where the graph allows.
+
+        Tasks whose inputs did not change are restored from the memo. Returns a
+        dict mapping task names to their markdown output; ``self.report`` holds
+        the timings and critical path of the run.
+        """
+        _, tasks = self.build()
+        named_tasks = dict(zip(self.TASK_NAMES, tasks))
+        deps = task_dependencies(named_tasks)
+        if self.split_phases:
+            deps = split_phases(deps, self.PHASES)
+            for name, task in named_tasks.items():
+                if self.PHASES.get(name) == "research":
+                    task.context = []
+
+        self.reused = []
+        self.executed = []
+        self.token_usage = {}
+        self.context_usage = {}
+        scheduler = TaskScheduler(deps, self.max_concurrency, self.thread_initializer)
+        # Os resultados das pesquisas ficam num índice local que todos os agentes consultam
+        with evidence_run(), span("crew", "crew", tasks=len(named_tasks), max_concurrency=self.max_concurrency):
+            outputs = scheduler.run(lambda name: self.resolve_task(name, named_tasks[name]))
+        self.report = scheduler.report()
+        return outputs
+
+
+def trip_inputs(from_city, destination_city, date_from, date_to, interests):
+    return {
+        "from_city": from_city,
+        "destination_city": destination_city,
+        "date_from": date_from,
+        "date_to": date_to,
+        "interests": interests,
+    }
+
+
+def restore_trip(trip_id, files, store=None):
+    """Writes a stored trip back into a workspace (rebuilding missing PDFs) and returns it.
+
+    A workspace that a generation is still writing is left alone; the trip
+    goes to a free sibling instead.
+    """
+    store = store or get_trip_store()
+    trip = store.get(trip_id)
+    inputs = trip_inputs(trip["from_city"], trip["destination_city"], trip["date_from"], trip["date_to"], trip["interests"])
+    with Workspace.claim(inputs) as workspace:
+        for md_file, (markdown, _) in store.reports(trip_id).items():
+            workspace.write_text(md_file, markdown)
+        build_pdfs(workspace.path, files)
+    return workspace
+
+
+def generate_trip(job, from_city, destination_city, date_from, date_to, interests, files, use_history=True):
+    """Background job: runs the crew in the trip's own workspace and builds the PDFs there.
+
+    ``files`` maps each markdown report to its PDF name. With ``use_history``
+    an identical trip already in the history store is restored instead of
+    running the crew; without it the trip is regenerated: no task output or
+    LLM completion is reused, so the new trip is not a copy of the old one.
+    The run claims its own workspace, so identical runs at the same time
+    never write into the same directory. Each report's PDF is built in the
+    background as soon as its task finishes, and the job progress lists
+    the reports and PDFs ready so far. A report whose PDF fails is listed in the progress and
+    in the result under ``pdf_errors``; the trip is still stored. Returns
+    the workspace id, the trip id in the store and the run report.
+    """
+    store = get_trip_store()
+    inputs = trip_inputs(from_city, destination_city, date_from, date_to, interests)
+    previous = store.find_identical(inputs) if use_history else None
+    if previous is not None:
+        workspace = restore_trip(previous["id"], files, store)
+        return {"workspace": workspace.id, "trip_id": previous["id"], "from_history": True, "report": None}
+
+    with Workspace.claim(inputs) as workspace:
+        job.report_progress(workspace=workspace.id, reports=[], pdfs=[])
+        trace = None
+        try:
+            with trace_run("generate_trip", destination=destination_city) as trace, \
+                    nullcontext() if use_history else regenerating():
+                return _generate_in_workspace(job, workspace, inputs, files, store)
+        finally:
+            # O trace fica na pasta da geração, mesmo quando ela falha
+            if trace is not None:
+                workspace.write_text(TRACE_FILE, trace.to_jsonl())
+
+
+def _generate_in_workspace(job, workspace, inputs, files, store):
+    """Runs the crew and the PDF builds of ``generate_trip`` in ``workspace``."""
+    def build_report_pdf(md_file):
+        pdf = build_pdfs(workspace.path, {md_file: files[md_file]})
+        job.append_progress("pdfs", md_file)
+        return pdf
+
+    pdfs = {}
+    pdf_errors = {}
+
+    def collect_pdf(md_file, build):
+        # Um PDF que falha não derruba a geração: o roteiro é guardado sem ele
+        try:
+            pdfs.update(build())
+        except Exception as e:
+            pdf_errors[md_file] = f"{type(e).__name__}: {e}"
+            job.append_progress("pdf_errors", md_file)
+            print(f"Erro ao gerar o PDF de {md_file}: {pdf_errors[md_file]}")
+
+    with ThreadPoolExecutor(max_workers=len(files), thread_name_prefix="trip-pdf") as pdf_executor:
+        pdf_futures = {}
+
+        def on_task_done(name, markdown):
+            md_file = TripCrew.REPORT_FILES.get(name)
+            if md_file is None:
+                return
+            job.append_progress("reports", md_file)
+            # Converter o markdown para PDF enquanto as outras tarefas seguem
+            if md_file in files:
+                pdf_futures[md_file] = pdf_executor.submit(contextvars.copy_context().run, build_report_pdf, md_file)
+
+        trip_crew = TripCrew(
+            inputs["from_city"], inputs["destination_city"], inputs["date_from"], inputs["date_to"], inputs["interests"],
+            cancel_event=job.cancel_event,
+            workspace=workspace,
+            on_task_done=on_task_done,
+        )
+        outputs = trip_crew.run()
+
+        for md_file, future in pdf_futures.items():
+            collect_pdf(md_file, future.result)
+        for md_file, pdf_file in files.items():
+            if md_file not in pdfs and md_file not in pdf_errors:
+                collect_pdf(md_file, functools.partial(build_pdfs, workspace.path, {md_file: pdf_file}))
+
+    reports = {TripCrew.REPORT_FILES[name]: markdown for name, markdown in outputs.items() if name in TripCrew.REPORT_FILES}
+    trip_id = store.add(
+        inputs,
+        reports,
+        pdf_paths={md_file: pdf["pdf"] for md_file, pdf in pdfs.items()},
+        workspace=workspace.id,
+        timings={"crew": trip_crew.report, "pdf": {md_file: pdf["seconds"] for md_file, pdf in pdfs.items()}},
+        token_usage=trip_crew.token_usage,
+    )
+    gc_workspaces(keep=[workspace.path])
+    return {
+        "workspace": workspace.id,
+        "trip_id": trip_id,
+        "from_history": False,
+        "report": trip_crew.report,
+        "pdfs": pdfs,
+        "pdf_errors": pdf_errors,
+        "reused": trip_crew.reused,
+        "executed": trip_crew.executed,
+    }
@@ -0,0 +1,167 @@
+import contextvars
+import hashlib
+import math
+import os
+import re
+import threading
+import unicodedata
+from collections import Counter
+from contextlib import contextmanager
+from urllib.parse import urldefrag
+
+# Resultados devolvidos por consulta às pesquisas anteriores
+EVIDENCE_MAX_RESULTS = int(os.getenv("TRIP_EVIDENCE_MAX_RESULTS", 5))
+# Tamanho máximo do trecho de cada resultado devolvido ao agente
+EVIDENCE_SNIPPET_CHARS = int(os.getenv("TRIP_EVIDENCE_SNIPPET_CHARS", 600))
+# Parte mínima da consulta (ponderada pelo IDF) que um resultado precisa cobrir;
+# termos presentes em tudo, como o nome do destino, quase não contam
+EVIDENCE_MIN_COVERAGE = float(os.getenv("TRIP_EVIDENCE_MIN_COVERAGE", 0.5))
+
+# BM25 parameters
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+_WORD = re.compile(r"\w+")
+_STOPWORDS = frozenset(
+    "a o as os um uma uns umas de do da dos das em no na nos nas por para com sem e ou que se ao aos "
+    "mais muito como qual quais onde quando sobre entre ate the of in on at to for and or is are with from".split()
+)
+
+_current_store = contextvars.ContextVar("trip_evidence_store", default=None)
+
+
+def terms(text):
+    """Lowercased, accent-free words of ``text`` without stopwords or single letters."""
+    text = unicodedata.normalize("NFKD", str(text).lower()).encode("ascii", "ignore").decode()
+    return [word for word in _WORD.findall(text) if len(word) > 1 and word not in _STOPWORDS]
+
+
+def _content_key(text):
+    return hashlib.sha1(" ".join(terms(text)).encode("utf-8")).hexdigest()
+
+
+class EvidenceStore:
+    """Search results fetched during one run, indexed for local BM25 retrieval.
+
+    Results are deduplicated by URL (without fragment or trailing slash) and
+    by normalized content, so the same page found by several agents or
+    mirrored under another address is indexed once. Safe to use from the
+    task and search pool threads.
+    """
+
+    def __init__(self):
+        self.documents = []
+        self._by_url = {}
+        self._by_content = {}
+        self._postings = {}
+        self._lengths = []
+        self._total_length = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.documents)
+
+    def add(self, query, results):
+        """Indexes the results of one search; returns how many documents were new."""
+        added = 0
+        with self._lock:
+            for item in results:
+                content = str(item.get("content") or "").strip()
+                url = urldefrag(str(item.get("url") or ""))[0].rstrip("/")
+                if not content:
+                    continue
+                content_key = _content_key(content)
+                doc_id = self._by_url.get(url) if url else None
+                if doc_id is None:
+                    doc_id = self._by_content.get(content_key)
+                if doc_id is not None:
+                    if query not in self.documents[doc_id]["queries"]:
+                        self.documents[doc_id]["queries"].append(query)
+                    continue
+
+                doc_id = len(self.documents)
+                title = str(item.get("title") or "")
+                self.documents.append({"url": url, "title": title, "content": content, "queries": [query]})
+                if url:
+                    self._by_url[url] = doc_id
+                self._by_content[content_key] = doc_id
+                words = terms(f"{title} {content}")
+                for term, frequency in Counter(words).items():
+                    self._postings.setdefault(term, {})[doc_id] = frequency
+                self._lengths.append(len(words))
+                self._total_length += len(words)
+                added += 1
+        return added
+
+    def search(self, query, limit=EVIDENCE_MAX_RESULTS, min_coverage=EVIDENCE_MIN_COVERAGE):
+        """Best matching documents for ``query`` by BM25, as ``(score, document)`` pairs.
+
+        Only documents covering at least ``min_coverage`` of the query's
+        terms, weighted by IDF, are returned: a term found in every document
+        (or a common one) adds little, and a term missing from the index
+        weighs the most, so a page that only shares the destination name
+        with the query is not a match.
+        """
+        with self._lock:
+            count = len(self.documents)
+            query_terms = set(terms(query))
+            if not count or not query_terms:
+                return []
+            average = self._total_length / count
+            scores = {}
+            matched = {}
+            total_idf = 0.0
+            for term in query_terms:
+                postings = self._postings.get(term) or {}
+                idf = math.log(1 + (count - len(postings) + 0.5) / (len(postings) + 0.5))
+                total_idf += idf
+                for doc_id, frequency in postings.items():
+                    norm = BM25_K1 * (1 - BM25_B + BM25_B * self._lengths[doc_id] / average)
+                    scores[doc_id] = scores.get(doc_id, 0.0) + idf * frequency * (BM25_K1 + 1) / (frequency + norm)
+                    matched[doc_id] = matched.get(doc_id, 0.0) + idf
+            relevant = [(doc_id, score) for doc_id, score in scores.items() if matched[doc_id] >= min_coverage * total_idf]
+            best = sorted(relevant, key=lambda item: item[1], reverse=True)[:limit]
+            return [(score, self.documents[doc_id]) for doc_id, score in best]
+
+
+@contextmanager
+def evidence_run():
+    """Gives the block (and threads started with a copy of its context) a fresh evidence store."""
+    store = EvidenceStore()
+    token = _current_store.set(store)
+    try:
+        yield store
+    finally:
+        _current_store.reset(token)
+
+
+def get_evidence_store():
+    """The evidence store of the current run, or None outside ``evidence_run``."""
+    return _current_store.get()
+
+
+def record_evidence(query, response):
+    """Adds a search response (Tavily shape) to the current run's store, if any."""
+    store = _current_store.get()
+    if store is None or not isinstance(response, dict):
+        return 0
+    return store.add(query, response.get("results") or [])
+
+
+def search_evidence(query, limit=EVIDENCE_MAX_RESULTS):
+    """Searches the current run's store; returns a Tavily-shaped response."""
+    store = _current_store.get()
+    hits = store.search(query, limit) if store is not None else []
+    return {
+        "query": query,
+        "indexed": len(store) if store is not None else 0,
+        "results": [
+            {
+                "title": document["title"],
+                "url": document["url"],
+                "content": document["content"][:EVIDENCE_SNIPPET_CHARS],
+                "score": round(score, 3),
+            }
+            for score, document in hits
+        ],
+    }
@@ -0,0 +1,209 @@
+import contextvars
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from trip_ratelimit import is_rate_limit_error, retry_after_seconds
+from trip_tracing import count
+
+# Intervalo em que a busca confere se as chamadas que esperavam o limite já começaram
+START_POLL_SECONDS = 0.05
+
+
+class LatencyTracker:
+    """Keeps a rolling window of call latencies and failures for one provider."""
+
+    def __init__(self, window=200):
+        self.samples = deque(maxlen=window)
+        self.failures = 0
+        self.timeouts = 0
+        self._lock = threading.Lock()
+
+    def record(self, seconds):
+        with self._lock:
+            self.samples.append(seconds)
+
+    def record_failure(self, timeout=False):
+        with self._lock:
+            if timeout:
+                self.timeouts += 1
+            else:
+                self.failures += 1
+
+    def percentile(self, p):
+        """Returns the ``p`` percentile (0-100) of recorded latencies, or None."""
+        with self._lock:
+            data = sorted(self.samples)
+        if not data:
+            return None
+        index = min(len(data) - 1, max(0, round(p / 100 * (len(data) - 1))))
+        return data[index]
+
+    def stats(self):
+        return {
+            "count": len(self.samples),
+            "failures": self.failures,
+            "timeouts": self.timeouts,
+            "p50": self.percentile(50),
+            "p95": self.percentile(95),
+            "p99": self.percentile(99),
+        }
+
+
+class SearchProvider:
+    """A named search backend: ``search(query)`` plus its own timeout and rate limiter.
+
+    ``search`` should be the raw fetch (no cache): the hedge delay is learned
+    from its latency. With a ``limiter`` (TokenBucket) each call first waits
+    for a token; that wait is not counted as latency nor toward the timeout.
+    """
+
+    def __init__(self, name, search, timeout=10.0, limiter=None):
+        self.name = name
+        self.search = search
+        self.timeout = timeout
+        self.limiter = limiter
+
+
+class _Call:
+    """One provider call in flight; ``started`` is set once it got past the rate limiter."""
+
+    def __init__(self, provider):
+        self.provider = provider
+        self.started = None
+
+    def deadline(self):
+        return None if self.started is None else self.started + self.provider.timeout
+
+
+class HedgedSearch:
+    """Sends a query to the primary provider and hedges to the next ones.
+
+    If the primary has not answered after the hedge delay (or failed), the
+    same query is fired at the next provider, and so on; the first good
+    answer wins. ``hedge_delay=None`` adapts the delay to the primary's
+    ``hedge_percentile`` latency once ``min_samples`` calls were observed;
+    ``hedge_delay=0`` fires every provider right away.
+
+    The delay and each provider's timeout count from the moment the call
+    gets its rate-limit token. Every call that completes is sampled, the
+    losing and timed-out ones included, so the percentile is not biased
+    towards the fast answers. Losing calls are cancelled if they have not
+    started yet; calls already running in a worker thread cannot be
+    interrupted and are simply ignored.
+    """
+
+    def __init__(self, providers, hedge_delay=None, initial_delay=2.0, min_delay=0.2,
+                 max_delay=5.0, hedge_percentile=95, min_samples=10, is_good=None, max_workers=8):
+        if not providers:
+            raise ValueError("HedgedSearch precisa de pelo menos um provedor")
+        self.providers = list(providers)
+        self.hedge_delay = hedge_delay
+        self.initial_delay = initial_delay
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.hedge_percentile = hedge_percentile
+        self.min_samples = min_samples
+        self.is_good = is_good or bool
+        self.latency = {p.name: LatencyTracker() for p in self.providers}
+        self.wins = {p.name: 0 for p in self.providers}
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="trip-hedge")
+
+    def current_delay(self):
+        """Delay before hedging to the next provider."""
+        if self.hedge_delay is not None:
+            return self.hedge_delay
+        tracker = self.latency[self.providers[0].name]
+        if len(tracker.samples) < self.min_samples:
+            return self.initial_delay
+        delay = tracker.percentile(self.hedge_percentile)
+        return min(self.max_delay, max(self.min_delay, delay))
+
+    def _call(self, call, query):
+        provider = call.provider
+        if provider.limiter is not None:
+            count("rate_limit_wait_seconds", provider.limiter.acquire())
+        call.started = time.monotonic()
+        start = time.perf_counter()
+        # A amostra é registrada aqui, na thread da chamada, antes de o resultado ser
+        # publicado: chamadas perdedoras ou que passaram do prazo também contam
+        try:
+            result = provider.search(query)
+        except Exception as e:
+            self.latency[provider.name].record_failure()
+            if provider.limiter is not None and is_rate_limit_error(e):
+                provider.limiter.penalize(retry_after_seconds(e))
+            raise
+        elapsed = time.perf_counter() - start
+        self.latency[provider.name].record(elapsed)
+        if provider.limiter is not None:
+            provider.limiter.reward()
+        return result, elapsed
+
+    def search(self, query):
+        """Returns ``(provider_name, result)`` for the first good answer.
+
+        Raises the last provider error (or TimeoutError) if none succeeds.
+        """
+        delay = self.current_delay()
+        pending = {}
+        remaining = list(self.providers)
+        last_error = None
+        latest = None
+
+        def launch():
+            nonlocal latest
+            latest = _Call(remaining.pop(0))
+            future = self._executor.submit(contextvars.copy_context().run, self._call, latest, query)
+            pending[future] = latest
+
+        def next_hedge():
+            return None if latest.started is None else latest.started + delay
+
+        launch()
+        while pending:
+            now = time.monotonic()
+            deadlines = [call.deadline() for call in pending.values() if call.started is not None]
+            if remaining and next_hedge() is not None:
+                deadlines.append(next_hedge())
+            timeout = min(deadlines) - now if deadlines else None
+            # Chamadas ainda na fila do limite: confere de tempos em tempos se já começaram
+            if any(call.started is None for call in pending.values()):
+                timeout = START_POLL_SECONDS if timeout is None else min(timeout, START_POLL_SECONDS)
+            done, _ = wait(list(pending), timeout=None if timeout is None else max(0.0, timeout),
+                           return_when=FIRST_COMPLETED)
+
+            for future in done:
+                provider = pending.pop(future).provider
+                try:
+                    result, _ = future.result()
+                except Exception as e:
+                    last_error = e
+                    continue
+                if self.is_good(result):
+                    for loser in pending:
+                        loser.cancel()
+                    self.wins[provider.name] += 1
+                    return provider.name, result
+                last_error = ValueError(f"Resposta vazia de {provider.name}")
+
+            now = time.monotonic()
+            for future, call in list(pending.items()):
+                if call.started is not None and now >= call.deadline():
+                    future.cancel()
+                    del pending[future]
+                    self.latency[call.provider.name].record_failure(timeout=True)
+                    last_error = TimeoutError(f"{call.provider.name} excedeu {call.provider.timeout}s")
+
+            # Hedge when the delay elapsed or nothing is in flight anymore
+            if remaining and (not pending or (next_hedge() is not None and now >= next_hedge())):
+                launch()
+
+        raise last_error or TimeoutError("Nenhum provedor respondeu")
+
+    def stats(self):
+        return {
+            "hedge_delay": self.current_delay(),
+            "providers": {name: dict(t.stats(), wins=self.wins[name]) for name, t in self.latency.items()},
+        }
@@ -0,0 +1,246 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import traceback
+import uuid
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from trip_cache import CACHE_DIR, make_key, process_alive
+from trip_utils import LogFileOutput, gc_logs, redirect_output
+
+# Fila de gerações em segundo plano
+JOBS_DIR = os.getenv("TRIP_JOBS_DIR", os.path.join(CACHE_DIR, "jobs"))
+JOB_WORKERS = int(os.getenv("TRIP_JOB_WORKERS", 2))
+JOB_MAX_PENDING = int(os.getenv("TRIP_JOB_MAX_PENDING", 20))
+# Bytes lidos do fim do log por linha pedida em log_tail
+LOG_TAIL_LINE_BYTES = 512
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+INTERRUPTED = "interrupted"
+
+ACTIVE_STATES = (QUEUED, RUNNING)
+
+
+class QueueFullError(RuntimeError):
+    """Raised when the job queue already holds the maximum number of pending jobs."""
+
+
+class JobContext:
+    """Handle passed to a running job: its id, log file and cancellation flag."""
+
+    def __init__(self, job_id, log_path, store=None):
+        self.id = job_id
+        self.log_path = log_path
+        self.store = store
+        self.cancel_event = threading.Event()
+        self.progress = {}
+        self._lock = threading.Lock()
+
+    @property
+    def cancelled(self):
+        return self.cancel_event.is_set()
+
+    def report_progress(self, **fields):
+        """Merges ``fields`` into the job's progress, which the UI can poll while it runs."""
+        with self._lock:
+            self.progress.update(fields)
+            self._save_progress()
+
+    def append_progress(self, key, item):
+        """Appends ``item`` to the progress list ``key``."""
+        with self._lock:
+            self.progress[key] = self.progress.get(key, []) + [item]
+            self._save_progress()
+
+    def _save_progress(self):
+        if self.store is not None:
+            self.store.update(self.id, progress=self.progress)
+
+
+class JobStore:
+    """Persists job status, parameters and results in SQLite."""
+
+    def __init__(self, path):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                status TEXT NOT NULL,
+                params TEXT NOT NULL,
+                result TEXT,
+                error TEXT,
+                log_path TEXT,
+                created_at REAL NOT NULL,
+                started_at REAL,
+                finished_at REAL,
+                progress TEXT,
+                owner_pid INTEGER
+            )"""
+        )
+        # Databases created before progress reporting or job owners lack the columns
+        for column in ("progress TEXT", "owner_pid INTEGER"):
+            try:
+                self._conn.execute(f"ALTER TABLE jobs ADD COLUMN {column}")
+            except sqlite3.OperationalError:
+                pass
+        self._conn.commit()
+        self._lock = threading.Lock()
+
+    def create(self, job_id, params, log_path):
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO jobs (id, status, params, log_path, created_at, owner_pid) VALUES (?, ?, ?, ?, ?, ?)",
+                (job_id, QUEUED, json.dumps(params, ensure_ascii=False, default=str), log_path, time.time(), os.getpid()),
+            )
+            self._conn.commit()
+
+    def update(self, job_id, **fields):
+        for field in ("result", "progress"):
+            if field in fields:
+                fields[field] = json.dumps(fields[field], ensure_ascii=False, default=str)
+        columns = ", ".join(f"{name} = ?" for name in fields)
+        with self._lock:
+            self._conn.execute(f"UPDATE jobs SET {columns} WHERE id = ?", (*fields.values(), job_id))
+            self._conn.commit()
+
+    def get(self, job_id):
+        with self._lock:
+            cursor = self._conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,))
+            row = cursor.fetchone()
+            names = [c[0] for c in cursor.description]
+        if row is None:
+            return None
+        job = dict(zip(names, row))
+        job["params"] = json.loads(job["params"])
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        job["progress"] = json.loads(job["progress"]) if job["progress"] else None
+        return job
+
+    def mark_interrupted(self):
+        """Jobs left active by a process that has exited can no longer finish.
+
+        The database is shared by every app process on the same JOBS_DIR, so
+        jobs whose owner is still running are left alone.
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, owner_pid FROM jobs WHERE status IN (?, ?)", ACTIVE_STATES
+            ).fetchall()
+            now = time.time()
+            self._conn.executemany(
+                "UPDATE jobs SET status = ?, finished_at = ? WHERE id = ? AND status IN (?, ?)",
+                [
+                    (INTERRUPTED, now, job_id, *ACTIVE_STATES)
+                    for job_id, pid in rows
+                    if pid is None or not process_alive(pid)
+                ],
+            )
+            self._conn.commit()
+
+
+class JobManager:
+    """Runs jobs on a bounded thread pool and keeps their status in a JobStore.
+
+    ``submit(fn, params)`` schedules ``fn(job, **params)``, where ``job`` is a
+    JobContext, and returns the job id. Everything the job prints goes to its
+    own log file, and what it passes to ``job.report_progress`` is persisted
+    so the UI can show partial results. Cancellation is cooperative: queued jobs never start and
+    running jobs should check ``job.cancelled`` between steps.
+    """
+
+    def __init__(self, jobs_dir=JOBS_DIR, max_workers=JOB_WORKERS, max_pending=JOB_MAX_PENDING):
+        self.jobs_dir = jobs_dir
+        self.max_pending = max_pending
+        os.makedirs(jobs_dir, exist_ok=True)
+        self.store = JobStore(os.path.join(jobs_dir, "jobs.sqlite"))
+        self.store.mark_interrupted()
+        gc_logs(jobs_dir)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="trip-job")
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def pending_count(self):
+        with self._lock:
+            return self._pending_count()
+
+    def _pending_count(self):
+        return sum(1 for _, future, _ in self._jobs.values() if not future.done())
+
+    def submit(self, fn, params):
+        """Schedules ``fn`` and returns the job id.
+
+        An identical job (same ``fn`` and ``params``) still pending in this
+        manager is reused instead of starting a second one, e.g. when the
+        form is submitted twice.
+        """
+        key = make_key(getattr(fn, "__qualname__", repr(fn)), params)
+        # Contagem, busca do job idêntico e registro sob o mesmo lock: dois envios ao mesmo tempo não passam os dois
+        with self._lock:
+            for job_id, (job, future, job_key) in self._jobs.items():
+                if job_key == key and not future.done() and not job.cancelled:
+                    return job_id
+            if self._pending_count() >= self.max_pending:
+                raise QueueFullError("Muitas gerações em andamento, tente novamente em instantes")
+
+            job_id = uuid.uuid4().hex[:12]
+            job = JobContext(job_id, os.path.join(self.jobs_dir, f"{job_id}.log"), self.store)
+            self.store.create(job_id, params, job.log_path)
+            future = self._executor.submit(self._run, job, fn, params)
+            self._jobs[job_id] = (job, future, key)
+        return job_id
+
+    def _run(self, job, fn, params):
+        if job.cancelled:
+            self.store.update(job.id, status=CANCELLED, finished_at=time.time())
+            return
+        self.store.update(job.id, status=RUNNING, started_at=time.time())
+        try:
+            with redirect_output(LogFileOutput(job.log_path)):
+                result = fn(job, **params)
+        except Exception as e:
+            status = CANCELLED if job.cancelled else FAILED
+            self.store.update(job.id, status=status, error=str(e), finished_at=time.time())
+            with open(job.log_path, "a", encoding="utf-8") as f:
+                f.write(traceback.format_exc())
+        else:
+            status = CANCELLED if job.cancelled else DONE
+            self.store.update(job.id, status=status, result=result, finished_at=time.time())
+        finally:
+            with self._lock:
+                self._jobs.pop(job.id, None)
+
+    def status(self, job_id):
+        """Returns the persisted job record (status, params, result, error), or None."""
+        return self.store.get(job_id)
+
+    def cancel(self, job_id):
+        with self._lock:
+            entry = self._jobs.get(job_id)
+        if entry is None:
+            return False
+        job, future, _ = entry
+        job.cancel_event.set()
+        if future.cancel():
+            self.store.update(job_id, status=CANCELLED, finished_at=time.time())
+            with self._lock:
+                self._jobs.pop(job_id, None)
+        return True
+
+    def log_tail(self, job_id, max_lines=200):
+        job = self.store.get(job_id)
+        if job is None or not job["log_path"] or not os.path.exists(job["log_path"]):
+            return ""
+        # Reads only the end of the file, so polling costs the same however long the log is
+        with open(job["log_path"], "rb") as f:
+            f.seek(max(0, os.path.getsize(job["log_path"]) - max_lines * LOG_TAIL_LINE_BYTES))
+            tail = f.read().decode("utf-8", errors="replace")
+        return "".join(deque(tail.splitlines(keepends=True), maxlen=max_lines))
@@ -0,0 +1,254 @@
+import json
+import os
+import threading
+from typing import Any
+
+from crewai import LLM
+from crewai.llms.base_llm import BaseLLM, call_stop_override, call_stream_override
+
+from trip_cache import CACHE_DIR, DiskCache, MemoryCache, TieredCache, env_flag, is_regenerating, make_key
+from trip_ratelimit import get_limiter
+from trip_tracing import count, span
+
+# Cache de completions do LLM (desative com TRIP_LLM_CACHE=0)
+LLM_CACHE_ENABLED = env_flag("TRIP_LLM_CACHE")
+LLM_CACHE_TTL = int(os.getenv("TRIP_LLM_CACHE_TTL", 7 * 24 * 3600))
+LLM_CACHE_MEMORY_ENTRIES = int(os.getenv("TRIP_LLM_CACHE_MEMORY_ENTRIES", 256))
+LLM_CACHE_DISK_ENTRIES = int(os.getenv("TRIP_LLM_CACHE_DISK_ENTRIES", 5000))
+# Above this temperature completions are not cached (unset: always cache)
+_max_temperature = os.getenv("TRIP_LLM_CACHE_MAX_TEMPERATURE")
+LLM_CACHE_MAX_TEMPERATURE = float(_max_temperature) if _max_temperature else None
+
+# Transmite a resposta do LLM em pedaços, para mostrar o rascunho de cada tarefa (TRIP_STREAM_TOKENS=1)
+STREAM_TOKENS = env_flag("TRIP_STREAM_TOKENS", "0")
+
+# Temperature Gemini uses when none is set
+DEFAULT_TEMPERATURE = 1.0
+
+_lock = threading.Lock()
+_completion_cache = None
+
+
+def replayable_tool_calls(calls, seed):
+    """Native tool calls as plain ``{"id", "type", "function"}`` dicts, or None if one is unknown.
+
+    Providers answer a tool-using turn with their own objects (Gemini parts,
+    OpenAI tool calls, Anthropic blocks); crewai's executor accepts this dict
+    form for all of them, and it can be stored and replayed from the cache.
+    Call ids are derived from ``seed`` (the prompt) instead of the
+    provider's random ones, so the follow-up prompts, which quote them, are
+    identical from one run to the next and hit the cache as well.
+    """
+    payload = []
+    for index, call in enumerate(calls):
+        if isinstance(call, dict):
+            function = call.get("function") or {}
+            name = function.get("name") or call.get("name")
+            args = function.get("arguments", call.get("input", {}))
+        elif getattr(call, "function", None) is not None:
+            name, args = call.function.name, call.function.arguments
+        elif getattr(call, "function_call", None):
+            name, args = call.function_call.name, dict(call.function_call.args or {})
+        elif hasattr(call, "name") and hasattr(call, "input"):
+            name, args = call.name, call.input
+        else:
+            return None
+        if not name:
+            return None
+        try:
+            args = args if isinstance(args, str) else json.loads(json.dumps(args))
+        except (TypeError, ValueError):
+            return None
+        payload.append({
+            "id": f"call_{make_key(seed, index)[:16]}",
+            "type": "function",
+            "function": {"name": name, "arguments": args},
+        })
+    return payload
+
+
+def _replayable(result):
+    """Plain text answers and tool-call payloads in the ``replayable_tool_calls`` form."""
+    if isinstance(result, str):
+        return bool(result)
+    return isinstance(result, list) and bool(result) and all(isinstance(item, dict) for item in result)
+
+
+class CompletionCache:
+    """Caches LLM completions keyed on model, messages, tool schema and call params.
+
+    ``store`` is any cache with ``get``/``set`` (MemoryCache, DiskCache or
+    TieredCache). Calls whose temperature is above ``max_temperature`` bypass
+    the cache, since their output is not meant to be repeatable.
+    """
+
+    def __init__(self, store, max_temperature=None, ttl=None):
+        self.store = store
+        self.max_temperature = max_temperature
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.bypasses = 0
+        self._lock = threading.Lock()
+
+    def key(self, model, messages, tools=None, params=None):
+        return make_key("completion", model, messages, tools or [], params or {})
+
+    def cacheable(self, temperature):
+        if self.max_temperature is None:
+            return True
+        temperature = DEFAULT_TEMPERATURE if temperature is None else temperature
+        return temperature <= self.max_temperature
+
+    def _count(self, counter):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def get_or_call(self, model, messages, call, tools=None, temperature=None, params=None):
+        """Returns the cached completion or runs ``call()`` and caches its result.
+
+        Inside ``regenerating()`` the cached completion is ignored and replaced.
+        """
+        if not self.cacheable(temperature):
+            self._count("bypasses")
+            return call()
+
+        key = self.key(model, messages, tools, params)
+        cached = None if is_regenerating() else self.store.get(key)
+        if cached is not None:
+            self._count("hits")
+            count("cache_hits")
+            return cached
+
+        self._count("misses")
+        result = call()
+        # Text answers and tool calls already in plain form; provider objects are not stored
+        if _replayable(result):
+            self.store.set(key, result, ttl=self.ttl)
+        return result
+
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "bypasses": self.bypasses,
+            "store": self.store.stats(),
+        }
+
+
+def get_completion_cache():
+    """Returns the process-wide completion cache, or None when caching is disabled."""
+    global _completion_cache
+    if not LLM_CACHE_ENABLED:
+        return None
+    with _lock:
+        if _completion_cache is None:
+            _completion_cache = CompletionCache(
+                TieredCache(
+                    MemoryCache(max_entries=LLM_CACHE_MEMORY_ENTRIES, default_ttl=LLM_CACHE_TTL),
+                    DiskCache(
+                        os.path.join(CACHE_DIR, "llm.sqlite"),
+                        max_entries=LLM_CACHE_DISK_ENTRIES,
+                        default_ttl=LLM_CACHE_TTL,
+                    ),
+                ),
+                max_temperature=LLM_CACHE_MAX_TEMPERATURE,
+                ttl=LLM_CACHE_TTL,
+            )
+    return _completion_cache
+
+
+class CachedLLM(BaseLLM):
+    """crewai LLM that serves repeated prompts from a CompletionCache.
+
+    Wraps the client ``LLM(model=...)`` builds instead of subclassing it:
+    crewai's ``LLM`` is a factory that returns its native provider class
+    (e.g. the Gemini one) even for subclasses, which would drop the cache,
+    the rate limit and the spans. Native tool calls the model answers with
+    are converted by ``replayable_tool_calls`` and cached like text, so the
+    tool-using turns of an agent are served from the cache too. Calls that
+    execute the tools themselves (``available_functions``) or ask for a
+    structured ``response_model`` are never cached. Requests that reach the provider go through the
+    process-wide "llm" token bucket, so crews running concurrently share one
+    quota and back off together on 429s; cache hits do not count. Streaming
+    follows TRIP_STREAM_TOKENS unless ``stream`` is passed.
+    """
+
+    llm: Any = None
+    completion_cache: Any = None
+    rate_limiter: Any = None
+
+    def __init__(self, model, completion_cache=None, rate_limiter=None, llm=None, **kwargs):
+        kwargs.setdefault("stream", STREAM_TOKENS)
+        inner = llm if llm is not None else LLM(model=model, **kwargs)
+        super().__init__(
+            model=model,
+            llm=inner,
+            temperature=getattr(inner, "temperature", None),
+            stream=kwargs["stream"],
+            provider=getattr(inner, "provider", None) or "openai",
+        )
+        self.completion_cache = completion_cache if completion_cache is not None else get_completion_cache()
+        self.rate_limiter = rate_limiter if rate_limiter is not None else get_limiter("llm")
+
+    def call(self, messages, tools=None, callbacks=None, available_functions=None,
+             from_task=None, from_agent=None, response_model=None):
+        prompt = messages if isinstance(messages, str) else "".join(str(m.get("content", "")) for m in messages)
+        with span(self.model, "llm", prompt_chars=len(prompt)) as llm_span:
+            result = self._call(messages, tools, callbacks, available_functions, from_task, from_agent, response_model)
+            llm_span.set(response_chars=len(result) if isinstance(result, str) else None)
+        return result
+
+    def _call(self, messages, tools, callbacks, available_functions, from_task, from_agent, response_model):
+        def provider_call():
+            # Stop words and streaming set by crewai for this call apply to the wrapped client
+            with call_stop_override(self.llm, self.stop_sequences), \
+                    call_stream_override(self.llm, bool(self._effective_stream())):
+                return self.llm.call(
+                    messages,
+                    tools=tools,
+                    callbacks=callbacks,
+                    available_functions=available_functions,
+                    from_task=from_task,
+                    from_agent=from_agent,
+                    response_model=response_model,
+                )
+
+        def call_llm():
+            result = provider_call() if self.rate_limiter is None else self.rate_limiter.call(provider_call)
+            if isinstance(result, list) and result:
+                payload = replayable_tool_calls(result, make_key(self.model, messages))
+                return result if payload is None else payload
+            return result
+
+        if self.completion_cache is None or available_functions or response_model is not None:
+            return call_llm()
+
+        return self.completion_cache.get_or_call(
+            self.model,
+            messages,
+            call_llm,
+            tools=tools,
+            temperature=getattr(self.llm, "temperature", None),
+            params={
+                "stop": self.stop_sequences,
+                "max_tokens": getattr(self.llm, "max_tokens", None),
+                "response_format": str(getattr(self.llm, "response_format", None)),
+            },
+        )
+
+    # Capabilities and token usage come from the wrapped client
+    def supports_function_calling(self):
+        return self.llm.supports_function_calling()
+
+    def supports_stop_words(self):
+        return self.llm.supports_stop_words()
+
+    def supports_multimodal(self):
+        return self.llm.supports_multimodal()
+
+    def get_context_window_size(self):
+        return self.llm.get_context_window_size()
+
+    def get_token_usage_summary(self):
+        return self.llm.get_token_usage_summary()
@@ -0,0 +1,291 @@
+import functools
+import re
+
+# O reportlab só é importado ao compilar os flowables: o app lê e limpa os
+# relatórios (strip_outer_fence) sem pagar o import dele
+
+# Padrões de bloco
+_HEADING = re.compile(r'^(#{1,6})\s*(.*?)\s*#*\s*$')
+_BULLET = re.compile(r'^(\s*)[-*+]\s+(.*)$')
+_ORDERED = re.compile(r'^(\s*)(\d+)[.)]\s+(.*)$')
+_FENCE = re.compile(r'^\s*(```|~~~)\s*([\w+-]*)\s*$')
+_TABLE_SEPARATOR = re.compile(r'^\s*\|?\s*:?-{2,}:?\s*(\|\s*:?-{2,}:?\s*)*\|?\s*$')
+_RULE = re.compile(r'^\s*([-*_])(\s*\1){2,}\s*$')
+
+# Padrões de formatação inline (aplicados depois do escape de &, < e >)
+_INLINE = [
+    (re.compile(r'`([^`]+)`'), r'<font face="Courier">\1</font>'),
+    (re.compile(r'\[([^\]]+)\]\(([^)\s]+)\)'), r'<link href="\2" color="#004080"><u>\1</u></link>'),
+    (re.compile(r'(\*\*\*|___)(?=\S)(.+?)(?<=\S)\1'), r'<b><i>\2</i></b>'),
+    (re.compile(r'(\*\*|__)(?=\S)(.+?)(?<=\S)\1'), r'<b>\2</b>'),
+    (re.compile(r'(?<![\w*])\*(?=\S)(.+?)(?<=\S)\*(?!\*)'), r'<i>\1</i>'),
+    (re.compile(r'(?<![\w_])_(?=\S)(.+?)(?<=\S)_(?![\w_])'), r'<i>\1</i>'),
+]
+_TAG = re.compile(r'<(/?)(\w+)[^>]*>')
+_EMPTY_TAG = re.compile(r'<(b|i)></\1>')
+
+
+@functools.lru_cache(maxsize=1)
+def table_style():
+    """Estilo das tabelas do PDF, montado uma única vez por processo"""
+    from reportlab.lib import colors
+    from reportlab.platypus import TableStyle
+
+    return TableStyle([
+        ('BACKGROUND', (0,0), (-1,0), colors.HexColor('#004080')),
+        ('TEXTCOLOR',(0,0),(-1,0),colors.white),
+        ('ALIGN',(0,0),(-1,-1),'LEFT'),
+        ('VALIGN',(0,0),(-1,-1),'TOP'),
+        ('FONTNAME', (0,0), (-1,0), 'Helvetica-Bold'),
+        ('BOTTOMPADDING', (0,0), (-1,0), 6),
+        ('BACKGROUND',(0,1),(-1,-1),colors.HexColor('#e6f0ff')),
+        ('GRID', (0,0), (-1,-1), 0.5, colors.grey),
+    ])
+
+
+def strip_outer_fence(text):
+    """Remove a cerca ```markdown que o LLM às vezes coloca em volta do relatório inteiro"""
+    stripped = text.strip()
+    if not (stripped.startswith('```markdown') or stripped.startswith('```md')):
+        return text
+    stripped = stripped.split('\n', 1)[1] if '\n' in stripped else ''
+    if stripped.rstrip().endswith('```'):
+        stripped = stripped.rstrip()[:-3]
+    return stripped
+
+
+def load_markdown(file_path):
+    """Carrega o markdown de um arquivo"""
+    try:
+        with open(file_path, 'r', encoding='utf-8') as f:
+            content = strip_outer_fence(f.read())
+            return content
+    except Exception as e:
+        print(f"Erro ao carregar arquivo: {str(e)}")
+        return None
+
+
+def _escape(text):
+    return text.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
+
+
+def _nest_tags(markup):
+    """Aninha corretamente as tags que se cruzam, como em ``*a **b* c**``.
+
+    Quando uma tag fecha antes das que foram abertas dentro dela, essas são
+    fechadas antes e reabertas depois; fechamentos sem abertura são
+    descartados e tags que ficaram abertas são fechadas no fim.
+    """
+    out = []
+    stack = []
+    position = 0
+    for match in _TAG.finditer(markup):
+        out.append(markup[position:match.start()])
+        position = match.end()
+        closing, name = match.group(1), match.group(2)
+        if not closing:
+            stack.append((name, match.group(0)))
+            out.append(match.group(0))
+            continue
+        if all(open_name != name for open_name, _ in stack):
+            continue
+        reopen = []
+        while stack[-1][0] != name:
+            reopen.append(stack.pop())
+            out.append(f'</{reopen[-1][0]}>')
+        stack.pop()
+        out.append(match.group(0))
+        for tag in reversed(reopen):
+            stack.append(tag)
+            out.append(tag[1])
+    out.append(markup[position:])
+    out.extend(f'</{name}>' for name, _ in reversed(stack))
+    return _EMPTY_TAG.sub('', ''.join(out))
+
+
+def format_inline(text):
+    """Converte negrito, itálico, código e links para a marcação de Paragraph do reportlab"""
+    text = _escape(text)
+    for pattern, replacement in _INLINE:
+        text = pattern.sub(replacement, text)
+    return _nest_tags(text)
+
+
+def _paragraph(text, style, **kwargs):
+    """Paragraph com a formatação inline; se a marcação não for aceita, usa o texto puro"""
+    from reportlab.platypus import Paragraph
+
+    try:
+        return Paragraph(format_inline(text), style, **kwargs)
+    except ValueError:
+        return Paragraph(_escape(text), style, **kwargs)
+
+
+def _split_row(line):
+    line = line.strip()
+    if line.startswith('|'):
+        line = line[1:]
+    if line.endswith('|'):
+        line = line[:-1]
+    return [cell.strip() for cell in line.split('|')]
+
+
+def tokenize(text):
+    """Percorre o markdown uma única vez e gera os blocos encontrados.
+
+    Cada bloco é uma tupla ``(tipo, ...)``: heading, paragraph, bullet,
+    ordered, table, code, quote, rule ou blank.
+    """
+    paragraph = []
+    table = []
+    code = None
+    code_lang = ''
+
+    def flush():
+        if paragraph:
+            yield ('paragraph', ' '.join(paragraph))
+            paragraph.clear()
+        if table:
+            yield ('table', [row for row in table])
+            table.clear()
+
+    for raw in text.split('\n'):
+        line = raw.rstrip()
+
+        # Dentro de um bloco de código tudo é literal até a cerca de fechamento
+        if code is not None:
+            if _FENCE.match(line):
+                yield ('code', code_lang, '\n'.join(code))
+                code = None
+            else:
+                code.append(raw)
+            continue
+
+        fence = _FENCE.match(line)
+        if fence:
+            yield from flush()
+            code, code_lang = [], fence.group(2)
+            continue
+
+        stripped = line.strip()
+        if '|' in stripped and _TABLE_SEPARATOR.match(stripped):
+            # Tabela sem | no início: o cabeçalho ficou na última linha do parágrafo
+            if not table and paragraph and '|' in paragraph[-1]:
+                header = paragraph.pop()
+                yield from flush()
+                table.append(_split_row(header))
+            continue
+        if stripped.startswith('|') or (table and '|' in stripped):
+            if paragraph:
+                yield ('paragraph', ' '.join(paragraph))
+                paragraph.clear()
+            table.append(_split_row(stripped))
+            continue
+
+        if not stripped:
+            yield from flush()
+            yield ('blank',)
+            continue
+
+        heading = _HEADING.match(stripped)
+        if heading:
+            yield from flush()
+            yield ('heading', len(heading.group(1)), heading.group(2))
+            continue
+
+        if _RULE.match(stripped):
+            yield from flush()
+            yield ('rule',)
+            continue
+
+        bullet = _BULLET.match(line)
+        if bullet:
+            yield from flush()
+            yield ('bullet', len(bullet.group(1).expandtabs(4)) // 2, bullet.group(2))
+            continue
+
+        ordered = _ORDERED.match(line)
+        if ordered:
+            yield from flush()
+            yield ('ordered', len(ordered.group(1).expandtabs(4)) // 2, ordered.group(2), ordered.group(3))
+            continue
+
+        if stripped.startswith('>'):
+            yield from flush()
+            yield ('quote', stripped.lstrip('>').strip())
+            continue
+
+        if table:
+            yield from flush()
+        paragraph.append(stripped)
+
+    if code is not None:
+        yield ('code', code_lang, '\n'.join(code))
+    yield from flush()
+
+
+@functools.lru_cache(maxsize=16)
+def _list_style(base, depth):
+    """Estilo de item de lista recuado conforme o nível, criado uma vez por nível"""
+    from reportlab.lib.styles import ParagraphStyle
+
+    return ParagraphStyle(name=f'{base.name}{depth}', parent=base,
+                          leftIndent=base.leftIndent + 15 * depth,
+                          bulletIndent=base.bulletIndent + 15 * depth)
+
+
+def _table(rows, styles, width):
+    from reportlab.platypus import Table
+
+    columns = max(len(row) for row in rows)
+    cell_style = styles['CustomTableCell']
+    header_style = styles['CustomTableHeader']
+    data = [
+        [_paragraph(cell, header_style if i == 0 else cell_style) for cell in row]
+        + [''] * (columns - len(row))
+        for i, row in enumerate(rows)
+    ]
+    return Table(data, colWidths=[width / columns] * columns, style=table_style(), hAlign='LEFT', repeatRows=1)
+
+
+def compile_markdown(text, styles, width):
+    """Compila o markdown em flowables do reportlab numa única passada.
+
+    ``styles`` é a folha de estilos do PDF e ``width`` a largura útil da
+    página, usada para dividir as colunas das tabelas.
+    """
+    from reportlab.lib import colors
+    from reportlab.platypus import HRFlowable, Preformatted, Spacer
+
+    elements = []
+    for token in tokenize(strip_outer_fence(text)):
+        kind = token[0]
+        if kind == 'blank':
+            elements.append(Spacer(1,6))
+        elif kind == 'paragraph':
+            elements.append(_paragraph(token[1], styles['CustomBodyText']))
+        elif kind == 'heading':
+            level, content = token[1], token[2]
+            if level == 1:
+                elements.append(_paragraph(content, styles['CustomTitle']))
+            elif level <= 3:
+                elements.append(_paragraph(content, styles['CustomHeading2']))
+            else:
+                elements.append(_paragraph(content, styles['CustomHeading3']))
+        elif kind == 'bullet':
+            style = _list_style(styles['CustomBullet'], token[1])
+            elements.append(_paragraph(token[2], style, bulletText='•'))
+        elif kind == 'ordered':
+            style = _list_style(styles['CustomBullet'], token[1])
+            elements.append(_paragraph(token[3], style, bulletText=f'{token[2]}.'))
+        elif kind == 'table':
+            elements.append(Spacer(1,6))
+            elements.append(_table(token[1], styles, width))
+            elements.append(Spacer(1,6))
+        elif kind == 'code':
+            elements.append(Preformatted(token[2], styles['CustomCode']))
+        elif kind == 'quote':
+            elements.append(_paragraph(token[1], styles['CustomBox']))
+        elif kind == 'rule':
+            elements.append(HRFlowable(width='100%', thickness=0.5, color=colors.grey, spaceBefore=6, spaceAfter=6))
+    return elements
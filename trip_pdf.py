@@ -0,0 +1,298 @@
+import functools
+import hashlib
+import html
+import json
+import multiprocessing
+import os
+import tempfile
+import threading
+import time
+from string import Template
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer
+from reportlab.lib import colors
+from reportlab.lib.units import cm
+
+from trip_markdown import compile_markdown, load_markdown, strip_outer_fence
+from trip_tracing import record_span, span
+
+# Processos para gerar os PDFs em paralelo (1: gera na própria thread)
+PDF_WORKERS = int(os.getenv("TRIP_PDF_WORKERS", 4))
+PDF_MANIFEST = ".pdf_manifest.json"
+
+# Backend padrão e backends por documento, ex.: "roteiro_viagem.md=weasyprint,guia_comunicacao.md=reportlab"
+PDF_BACKEND = os.getenv("TRIP_PDF_BACKEND", "reportlab")
+PDF_BACKENDS = dict(
+    item.split("=", 1) for item in os.getenv("TRIP_PDF_BACKENDS", "").replace(" ", "").split(",") if "=" in item
+)
+
+_pool_lock = threading.Lock()
+_manifest_lock = threading.Lock()
+_pdf_pool = None
+_fallback_warned = set()
+
+REPORT_CSS = """
+@page { size: A4; margin: 2cm; }
+body { font-family: Helvetica, Arial, sans-serif; font-size: 12pt; line-height: 1.35; }
+h1 { font-size: 20pt; color: #004080; margin: 0 0 16pt; }
+h2, h3 { font-size: 16pt; color: #004080; margin: 12pt 0 8pt; }
+h4, h5, h6 { font-size: 13pt; color: #004080; margin: 10pt 0 6pt; }
+p { margin: 0 0 8pt; }
+a { color: #004080; }
+blockquote { background: #e6f0ff; margin: 0 0 10pt; padding: 6pt; }
+pre, code { font-family: Courier, monospace; font-size: 9pt; }
+pre { background: #f4f4f4; padding: 4pt; white-space: pre-wrap; }
+table { border-collapse: collapse; width: 100%; margin: 6pt 0; font-size: 10pt; page-break-inside: auto; }
+th { background: #004080; color: white; text-align: left; }
+td { background: #e6f0ff; }
+th, td { border: 0.5pt solid grey; padding: 3pt 5pt; vertical-align: top; }
+tr { page-break-inside: avoid; }
+"""
+
+HTML_TEMPLATE = Template("""<!DOCTYPE html>
+<html lang="pt-BR"><head><meta charset="utf-8"><title>$title</title></head>
+<body><h1>$title</h1>
+$body
+</body></html>""")
+
+@functools.lru_cache(maxsize=1)
+def get_stylesheet():
+    """Folha de estilos do PDF, montada uma única vez por processo"""
+    styles = getSampleStyleSheet()
+    styles.add(ParagraphStyle(name='CustomTitle', fontSize=20, leading=24, spaceAfter=16, textColor=colors.HexColor('#004080')))
+    styles.add(ParagraphStyle(name='CustomHeading2', fontSize=16, leading=20, spaceAfter=12, textColor=colors.HexColor('#004080')))
+    styles.add(ParagraphStyle(name='CustomBodyText', fontSize=12, leading=16, spaceAfter=8))
+    styles.add(ParagraphStyle(name='CustomBullet', fontSize=12, leading=16, leftIndent=20, bulletIndent=10))
+    styles.add(ParagraphStyle(name='CustomBox', fontSize=12, leading=16, backColor=colors.HexColor('#e6f0ff'), borderPadding=6, spaceAfter=10))
+    styles.add(ParagraphStyle(name='CustomHeading3', fontName='Helvetica-Bold', fontSize=13, leading=17, spaceAfter=8, textColor=colors.HexColor('#004080')))
+    styles.add(ParagraphStyle(name='CustomCode', fontName='Courier', fontSize=9, leading=12, backColor=colors.HexColor('#f4f4f4'), borderPadding=4, spaceAfter=8))
+    styles.add(ParagraphStyle(name='CustomTableCell', fontSize=10, leading=13))
+    styles.add(ParagraphStyle(name='CustomTableHeader', fontName='Helvetica-Bold', fontSize=10, leading=13, textColor=colors.white))
+    return styles
+
+# --------------------- BACKENDS ---------------------
+class ReportlabRenderer:
+    """Gera o PDF direto com o reportlab, a partir dos flowables do trip_markdown"""
+
+    name = "reportlab"
+
+    def available(self):
+        return True
+
+    def render(self, text_md, file_pdf, title):
+        # Cria documento
+        doc = SimpleDocTemplate(file_pdf, pagesize=A4,
+                                rightMargin=2*cm, leftMargin=2*cm,
+                                topMargin=2*cm, bottomMargin=2*cm)
+
+        elements = []
+
+        # Estilos customizados
+        styles = get_stylesheet()
+
+        # Adiciona título principal
+        elements.append(Paragraph(title, styles['CustomTitle']))
+        elements.append(Spacer(1,12))
+
+        # Compila o markdown (títulos, listas, tabelas, código, negrito/itálico/links)
+        elements.extend(compile_markdown(text_md, styles, doc.width))
+
+        # Gera PDF
+        doc.build(elements)
+
+
+@functools.lru_cache(maxsize=1)
+def get_html_resources():
+    """CSS do relatório compilado pelo WeasyPrint e sua configuração de fontes, uma vez por processo"""
+    from weasyprint import CSS
+    from weasyprint.text.fonts import FontConfiguration
+
+    font_config = FontConfiguration()
+    return CSS(string=REPORT_CSS, font_config=font_config), font_config
+
+
+class WeasyPrintRenderer:
+    """Converte markdown -> HTML (markdown2) -> PDF (WeasyPrint)"""
+
+    name = "weasyprint"
+    extras = ["tables", "fenced-code-blocks", "cuddled-lists", "strike"]
+
+    _available = None
+
+    def available(self):
+        # O WeasyPrint precisa das libs do sistema (Pango); sem elas o import falha com OSError
+        if self._available is None:
+            try:
+                get_html_resources()
+                self._available = True
+            except (ImportError, OSError):
+                self._available = False
+        return self._available
+
+    def to_html(self, text_md, title):
+        import markdown2
+
+        body = markdown2.markdown(strip_outer_fence(text_md), extras=self.extras)
+        return HTML_TEMPLATE.substitute(title=html.escape(title), body=body)
+
+    def render(self, text_md, file_pdf, title):
+        from weasyprint import HTML
+
+        css, font_config = get_html_resources()
+        HTML(string=self.to_html(text_md, title)).write_pdf(file_pdf, stylesheets=[css], font_config=font_config)
+
+
+RENDERERS = {renderer.name: renderer for renderer in (ReportlabRenderer(), WeasyPrintRenderer())}
+
+
+def backend_for(file_md):
+    """Backend configurado para um documento (pelo nome do arquivo), ou o padrão"""
+    return PDF_BACKENDS.get(os.path.basename(file_md), PDF_BACKEND)
+
+
+def get_renderer(backend=None):
+    """Renderer do backend pedido; volta ao reportlab se ele não existir ou não estiver disponível"""
+    backend = backend or PDF_BACKEND
+    renderer = RENDERERS.get(backend)
+    if renderer is not None and renderer.available():
+        return renderer
+    if backend not in _fallback_warned:
+        _fallback_warned.add(backend)
+        print(f"Backend de PDF '{backend}' indisponível, usando reportlab")
+    return RENDERERS["reportlab"]
+
+
+def convert_md_to_pdf(file_md, file_pdf, title="Guia de Viagem", backend=None):
+    # Carrega markdown
+    text_md = load_markdown(file_md)
+    if text_md is None:
+        # Sem isso o PDF temporário vazio seria instalado como se fosse o documento
+        raise OSError(f"Não foi possível carregar o markdown {file_md}")
+
+    get_renderer(backend or backend_for(file_md)).render(text_md, file_pdf, title)
+
+# --------------------- GERAÇÃO EM LOTE ---------------------
+def get_pdf_pool():
+    """Pool de processos compartilhado para gerar PDFs (None quando desativado)"""
+    global _pdf_pool
+    if PDF_WORKERS <= 1:
+        return None
+    with _pool_lock:
+        if _pdf_pool is None:
+            # spawn: o processo do app tem várias threads, e fork com threads não é seguro
+            _pdf_pool = ProcessPoolExecutor(max_workers=PDF_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+    return _pdf_pool
+
+def discard_pdf_pool(pool):
+    """Descarta um pool quebrado (um processo filho morreu); o próximo uso cria outro"""
+    global _pdf_pool
+    if pool is None:
+        return
+    with _pool_lock:
+        if _pdf_pool is pool:
+            _pdf_pool = None
+    pool.shutdown(wait=False)
+
+def markdown_hash(file_md):
+    with open(file_md, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+def render_pdf(file_md, file_pdf, title="Guia de Viagem", backend=None):
+    """Gera um PDF de forma atômica e retorna o tempo gasto em segundos"""
+    start = time.perf_counter()
+    fd, tmp_pdf = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(file_pdf)), suffix=".pdf.tmp")
+    os.close(fd)
+    try:
+        convert_md_to_pdf(file_md, tmp_pdf, title, backend)
+        os.replace(tmp_pdf, file_pdf)
+    finally:
+        if os.path.exists(tmp_pdf):
+            os.remove(tmp_pdf)
+    return time.perf_counter() - start
+
+def read_manifest(directory):
+    try:
+        with open(os.path.join(directory, PDF_MANIFEST), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def build_pdfs(directory, files, force=False):
+    """Converte os markdowns de uma pasta para PDF, em paralelo e de forma incremental.
+
+    ``files`` mapeia cada markdown ao nome do PDF. Documentos cujo markdown
+    e backend não mudaram desde a última geração (manifesto da pasta) são
+    pulados. Pode ser chamada para um documento de cada vez, em paralelo: o
+    manifesto é atualizado, não substituído. Se algum documento falhar, os
+    demais são registrados e o primeiro erro é relançado no final.
+    Retorna ``{md: {"pdf", "hash", "backend", "seconds", "skipped"}}``.
+    """
+    with span("build_pdfs", "pdf", documents=len(files)):
+        return _build_pdfs(directory, files, force)
+
+def _build_pdfs(directory, files, force):
+    manifest = read_manifest(directory)
+
+    results = {}
+    pending = {}
+    errors = {}
+    pool = get_pdf_pool()
+    for md_file, pdf_file in files.items():
+        file_md = os.path.join(directory, md_file)
+        file_pdf = os.path.join(directory, pdf_file)
+        if not os.path.exists(file_md):
+            continue
+        digest = markdown_hash(file_md)
+        backend = get_renderer(backend_for(md_file)).name
+        entry = {"hash": digest, "backend": backend}
+        results[md_file] = {"pdf": file_pdf, **entry, "seconds": 0.0, "skipped": True}
+        if not force and manifest.get(pdf_file) == entry and os.path.exists(file_pdf):
+            continue
+        results[md_file]["skipped"] = False
+        if pool is not None:
+            try:
+                pending[md_file] = pool.submit(render_pdf, file_md, file_pdf, backend=backend)
+                continue
+            except BrokenProcessPool:
+                discard_pdf_pool(pool)
+                pool = None
+        try:
+            results[md_file]["seconds"] = render_pdf(file_md, file_pdf, backend=backend)
+        except Exception as e:
+            errors[md_file] = e
+
+    for md_file, future in pending.items():
+        try:
+            try:
+                results[md_file]["seconds"] = future.result()
+            except BrokenProcessPool:
+                discard_pdf_pool(pool)
+                file_md = os.path.join(directory, md_file)
+                results[md_file]["seconds"] = render_pdf(file_md, results[md_file]["pdf"], backend=results[md_file]["backend"])
+        except Exception as e:
+            errors[md_file] = e
+
+    # Documento que falhou não entra no manifesto: será gerado de novo na próxima vez
+    for md_file in errors:
+        del results[md_file]
+
+    # O PDF pode ter sido gerado em outro processo: registra o tempo medido lá
+    for md_file, result in results.items():
+        if not result["skipped"]:
+            record_span("convert_md_to_pdf", "pdf", result["seconds"], document=md_file, backend=result["backend"])
+
+    with _manifest_lock:
+        manifest = read_manifest(directory)
+        manifest.update({files[md]: {"hash": r["hash"], "backend": r["backend"]} for md, r in results.items()})
+        fd, tmp_manifest = tempfile.mkstemp(dir=directory, suffix=".json.tmp")
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f)
+        os.replace(tmp_manifest, os.path.join(directory, PDF_MANIFEST))
+    if errors:
+        raise next(iter(errors.values()))
+    return results
+
@@ -0,0 +1,348 @@
+import contextvars
+import heapq
+import itertools
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+from trip_cache import CACHE_DIR
+from trip_tracing import count
+
+# Prioridades: pedidos interativos (app) passam na frente dos de lote
+INTERACTIVE = 0
+BATCH = 1
+
+# Limites por minuto de cada balde (0 desativa o limite)
+BUCKET_LIMITS = {
+    "llm": int(os.getenv("TRIP_LLM_MAX_RPM", 15)),
+    "search": int(os.getenv("TRIP_SEARCH_MAX_RPM", 60)),
+    # O DuckDuckGo tem seu próprio balde: o hedge não gasta a cota do Tavily
+    "duckduckgo": int(os.getenv("TRIP_DUCKDUCKGO_MAX_RPM", 30)),
+}
+# Arquivo SQLite para compartilhar os baldes (e as prioridades) entre o app e os
+# processos de lote (vazio: cada processo tem os seus baldes)
+RATE_LIMIT_DB = os.getenv("TRIP_RATE_LIMIT_DB", os.path.join(CACHE_DIR, "ratelimit.sqlite"))
+# Segundos sem renovar o registro depois dos quais um pedido em espera é ignorado
+# (processo que terminou sem conseguir limpar)
+WAITER_TTL = 5.0
+# Intervalo em que um pedido de lote volta a olhar o balde enquanto há interativos esperando
+DEFER_SECONDS = 0.25
+
+RATE_LIMIT_RETRIES = int(os.getenv("TRIP_RATE_LIMIT_RETRIES", 3))
+
+_priority = contextvars.ContextVar("trip_request_priority", default=INTERACTIVE)
+_lock = threading.Lock()
+_limiters = {}
+
+_RETRY_AFTER = re.compile(r"retry[- ]after\D{0,5}(\d+(?:\.\d+)?)", re.IGNORECASE)
+# Exceções de limite de taxa dos clientes (LiteLLM/OpenAI, Google, Tavily, DuckDuckGo),
+# pelo nome: nem todas trazem o status HTTP e os pacotes são opcionais
+RATE_LIMIT_ERRORS = frozenset(
+    {"RateLimitError", "TooManyRequests", "ResourceExhausted", "UsageLimitExceededError", "RatelimitException"}
+)
+
+
+@contextmanager
+def request_priority(priority):
+    """Sets the priority of rate-limited calls made in this context (and its tasks)."""
+    token = _priority.set(priority)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def current_priority():
+    return _priority.get()
+
+
+def is_rate_limit_error(error):
+    """True for HTTP 429 / quota errors, by status code or exception type (also of the cause)."""
+    response = getattr(error, "response", None)
+    # ``code`` é onde os erros do Google guardam o status HTTP
+    statuses = (getattr(error, "status_code", None), getattr(error, "code", None), getattr(response, "status_code", None))
+    if 429 in statuses:
+        return True
+    if any(cls.__name__ in RATE_LIMIT_ERRORS for cls in type(error).__mro__):
+        return True
+    return error.__cause__ is not None and is_rate_limit_error(error.__cause__)
+
+
+def retry_after_seconds(error):
+    """Reads Retry-After from the error's response headers or message, if any."""
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    value = headers.get("retry-after") or headers.get("Retry-After")
+    if value is None:
+        match = _RETRY_AFTER.search(str(error))
+        value = match.group(1) if match else None
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+class LocalBucketState:
+    """Token bucket state kept in process memory."""
+
+    def __init__(self, capacity):
+        self.tokens = float(capacity)
+        self.updated_at = time.time()
+        self.blocked_until = 0.0
+        self._lock = threading.Lock()
+
+    def take(self, rate, capacity, priority=INTERACTIVE, waiter=None):
+        """Takes one token; returns 0 on success or the seconds to wait for the next one.
+
+        Priorities only matter between processes; in one process the
+        TokenBucket queue already orders the callers.
+        """
+        with self._lock:
+            now = time.time()
+            if now < self.blocked_until:
+                return self.blocked_until - now
+            self.tokens = min(capacity, self.tokens + (now - self.updated_at) * rate)
+            self.updated_at = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0.0
+            return (1 - self.tokens) / rate
+
+    def block(self, until):
+        with self._lock:
+            self.blocked_until = max(self.blocked_until, until)
+            self.tokens = 0.0
+
+    def leave(self, waiter):
+        pass
+
+
+class SqliteBucketState:
+    """Token bucket state in a SQLite file, shared by every process using it.
+
+    Callers that have to wait are registered in a ``waiters`` table with
+    their priority, and a caller never takes a token while a higher-priority
+    one (from any process) is waiting, so the app's requests go ahead of
+    the batch workers'. Registrations not renewed within ``WAITER_TTL``
+    seconds are ignored.
+    """
+
+    def __init__(self, path, name, capacity):
+        self.name = name
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS buckets (
+                name TEXT PRIMARY KEY,
+                tokens REAL NOT NULL,
+                updated_at REAL NOT NULL,
+                blocked_until REAL NOT NULL
+            )"""
+        )
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS waiters (
+                name TEXT NOT NULL,
+                waiter TEXT NOT NULL,
+                priority INTEGER NOT NULL,
+                seen_at REAL NOT NULL,
+                PRIMARY KEY (name, waiter)
+            )"""
+        )
+        self._conn.execute(
+            "INSERT OR IGNORE INTO buckets VALUES (?, ?, ?, 0)", (name, float(capacity), time.time())
+        )
+        self._lock = threading.Lock()
+
+    def _transaction(self, update):
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                tokens, updated_at, blocked_until = self._conn.execute(
+                    "SELECT tokens, updated_at, blocked_until FROM buckets WHERE name = ?", (self.name,)
+                ).fetchone()
+                result, state = update(tokens, updated_at, blocked_until, time.time())
+                self._conn.execute(
+                    "UPDATE buckets SET tokens = ?, updated_at = ?, blocked_until = ? WHERE name = ?",
+                    state + (self.name,),
+                )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return result
+
+    def take(self, rate, capacity, priority=INTERACTIVE, waiter=None):
+        def update(tokens, updated_at, blocked_until, now):
+            ahead = self._conn.execute(
+                "SELECT 1 FROM waiters WHERE name = ? AND priority < ? AND seen_at > ? LIMIT 1",
+                (self.name, priority, now - WAITER_TTL),
+            ).fetchone()
+            if now < blocked_until:
+                delay = blocked_until - now
+            elif ahead:
+                delay = DEFER_SECONDS
+            else:
+                tokens = min(capacity, tokens + (now - updated_at) * rate)
+                updated_at = now
+                delay = 0.0 if tokens >= 1 else (1 - tokens) / rate
+            if delay <= 0:
+                if waiter is not None:
+                    self._conn.execute("DELETE FROM waiters WHERE name = ? AND waiter = ?", (self.name, waiter))
+                return 0.0, (tokens - 1, updated_at, blocked_until)
+            if waiter is not None:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO waiters VALUES (?, ?, ?, ?)", (self.name, waiter, priority, now)
+                )
+            return delay, (tokens, updated_at, blocked_until)
+
+        return self._transaction(update)
+
+    def leave(self, waiter):
+        """Removes a waiter that gave up (error or cancellation) before getting its token."""
+        with self._lock:
+            self._conn.execute("DELETE FROM waiters WHERE name = ? AND waiter = ?", (self.name, waiter))
+
+    def block(self, until):
+        def update(tokens, updated_at, blocked_until, now):
+            return None, (0.0, now, max(blocked_until, until))
+
+        self._transaction(update)
+
+
+class TokenBucket:
+    """Priority-aware token bucket with adaptive backoff on rate-limit errors.
+
+    Waiting callers are served by priority (INTERACTIVE before BATCH), then
+    in arrival order; with a shared (SQLite) state the priority also holds
+    across processes. After a 429 the bucket is blocked for the Retry-After
+    time (or an exponential backoff) and its refill rate is halved; each
+    success recovers part of the configured rate.
+    """
+
+    def __init__(self, name, per_minute, burst=None, state=None, min_rate_factor=0.1, max_backoff=60.0):
+        self.name = name
+        self.per_minute = per_minute
+        self.capacity = burst or max(1, per_minute // 4)
+        self.state = state or LocalBucketState(self.capacity)
+        self.min_rate_factor = min_rate_factor
+        self.max_backoff = max_backoff
+        self.rate_factor = 1.0
+        self.backoff = 0.0
+        self._waiters = []
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        # Metrics
+        self.acquired = 0
+        self.throttled = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self._recent_waits = deque(maxlen=500)
+
+    @property
+    def rate(self):
+        """Current refill rate in tokens per second."""
+        return self.per_minute / 60 * self.rate_factor
+
+    def acquire(self, priority=None):
+        """Blocks until a token is available; returns the seconds spent waiting."""
+        priority = current_priority() if priority is None else priority
+        start = time.monotonic()
+        entry = (priority, next(self._seq))
+        waiter = f"{os.getpid()}:{id(self)}:{entry[1]}"
+        acquired = False
+        with self._cond:
+            heapq.heappush(self._waiters, entry)
+            try:
+                while True:
+                    if self._waiters[0] == entry:
+                        delay = self.state.take(self.rate, self.capacity, priority, waiter)
+                        if delay <= 0:
+                            acquired = True
+                            break
+                        self._cond.wait(min(delay, 1.0))
+                    else:
+                        self._cond.wait(1.0)
+            finally:
+                if not acquired:
+                    self.state.leave(waiter)
+                self._waiters.remove(entry)
+                heapq.heapify(self._waiters)
+                self._cond.notify_all()
+
+        waited = time.monotonic() - start
+        with self._cond:
+            self.acquired += 1
+            self.total_wait += waited
+            self.max_wait = max(self.max_wait, waited)
+            self._recent_waits.append(waited)
+        return waited
+
+    def penalize(self, retry_after=None):
+        """Backs off after a rate-limit error."""
+        with self._cond:
+            self.throttled += 1
+            self.backoff = min(self.max_backoff, self.backoff * 2 if self.backoff else 1.0)
+            self.rate_factor = max(self.min_rate_factor, self.rate_factor / 2)
+            # Um Retry-After absurdo não pode travar o balde por mais que o backoff máximo
+            delay = min(retry_after, self.max_backoff) if retry_after is not None else self.backoff
+        self.state.block(time.time() + delay)
+
+    def reward(self):
+        """Recovers the rate after a successful call."""
+        with self._cond:
+            self.backoff = 0.0
+            self.rate_factor = min(1.0, self.rate_factor + 0.05)
+
+    def call(self, fn, *args, retries=None, **kwargs):
+        """Calls ``fn`` under the limiter, retrying rate-limit errors with backoff."""
+        retries = RATE_LIMIT_RETRIES if retries is None else retries
+        for attempt in range(retries + 1):
+            count("rate_limit_wait_seconds", self.acquire())
+            try:
+                result = fn(*args, **kwargs)
+            except Exception as e:
+                if attempt == retries or not is_rate_limit_error(e):
+                    raise
+                self.penalize(retry_after_seconds(e))
+                count("retries")
+                continue
+            self.reward()
+            return result
+
+    def metrics(self):
+        waits = sorted(self._recent_waits)
+        return {
+            "bucket": self.name,
+            "per_minute": self.per_minute,
+            "rate_factor": self.rate_factor,
+            "queued": len(self._waiters),
+            "acquired": self.acquired,
+            "throttled": self.throttled,
+            "total_wait_seconds": self.total_wait,
+            "max_wait_seconds": self.max_wait,
+            "p95_wait_seconds": waits[int(0.95 * (len(waits) - 1))] if waits else 0.0,
+        }
+
+
+def get_limiter(name):
+    """Returns the process-wide bucket ``name`` ("llm", "search" or "duckduckgo"), or None if unlimited."""
+    per_minute = BUCKET_LIMITS.get(name, 0)
+    if per_minute <= 0:
+        return None
+    with _lock:
+        if name not in _limiters:
+            bucket = TokenBucket(name, per_minute)
+            if RATE_LIMIT_DB:
+                bucket.state = SqliteBucketState(RATE_LIMIT_DB, name, bucket.capacity)
+            _limiters[name] = bucket
+    return _limiters[name]
+
+
+def limiter_metrics():
+    """Queue-wait metrics of every bucket created so far."""
+    with _lock:
+        return {name: bucket.metrics() for name, bucket in _limiters.items()}
@@ -0,0 +1,136 @@
+import asyncio
+import contextvars
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+def task_dependencies(named_tasks):
+    """Builds the dependency graph ``{name: [upstream names]}`` from each Task's context list."""
+    names = {id(task): name for name, task in named_tasks.items()}
+    deps = {}
+    for name, task in named_tasks.items():
+        context = task.context if isinstance(task.context, list) else []
+        deps[name] = [names[id(t)] for t in context if id(t) in names]
+    return deps
+
+
+def split_phases(deps, phases, research="research"):
+    """Splits the graph into a parallel research phase and a synthesis phase.
+
+    Tasks in the ``research`` phase drop their dependencies and start right
+    away; every other task waits for its own dependencies plus all research
+    tasks.
+    """
+    research_tasks = [name for name in deps if phases.get(name) == research]
+    split = {}
+    for name, upstream in deps.items():
+        if name in research_tasks:
+            split[name] = []
+        else:
+            split[name] = list(dict.fromkeys(upstream + research_tasks))
+    return split
+
+
+def topological_order(deps):
+    """Returns the task names in dependency order; raises ValueError on cycles or unknown tasks."""
+    order = []
+    state = {}
+
+    def visit(name, path):
+        if name not in deps:
+            raise ValueError(f"Tarefa desconhecida no grafo: {name}")
+        if state.get(name) == "done":
+            return
+        if state.get(name) == "visiting":
+            raise ValueError(f"Dependência circular entre tarefas: {' -> '.join(path + [name])}")
+        state[name] = "visiting"
+        for upstream in deps[name]:
+            visit(upstream, path + [name])
+        state[name] = "done"
+        order.append(name)
+
+    for name in deps:
+        visit(name, [])
+    return order
+
+
+class TaskScheduler:
+    """Runs a DAG of blocking jobs, starting each one as soon as its dependencies finish.
+
+    ``run(job)`` calls ``job(name)`` for every task in a worker thread, at most
+    ``max_concurrency`` at a time, and returns ``{name: result}``. Timings are
+    kept so ``report()`` can show the critical path of the run.
+    """
+
+    def __init__(self, deps, max_concurrency=4, thread_initializer=None):
+        self.deps = deps
+        self.order = topological_order(deps)
+        self.max_concurrency = max_concurrency
+        self.thread_initializer = thread_initializer
+        self.timings = {}
+        self._started = None
+
+    def run(self, job):
+        return asyncio.run(self.run_async(job))
+
+    async def run_async(self, job):
+        loop = asyncio.get_running_loop()
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        executor = ThreadPoolExecutor(
+            max_workers=self.max_concurrency,
+            thread_name_prefix="trip-task",
+            initializer=self.thread_initializer,
+        )
+        self.timings = {}
+        self._started = time.perf_counter()
+        futures = {}
+
+        async def node(name):
+            for upstream in self.deps[name]:
+                await futures[upstream]
+            async with semaphore:
+                start = time.perf_counter()
+                context = contextvars.copy_context()
+                try:
+                    return await loop.run_in_executor(executor, context.run, job, name)
+                finally:
+                    self.timings[name] = (start - self._started, time.perf_counter() - self._started)
+
+        for name in self.order:
+            futures[name] = asyncio.ensure_future(node(name))
+        try:
+            await asyncio.gather(*futures.values())
+        except BaseException:
+            for future in futures.values():
+                future.cancel()
+            raise
+        finally:
+            executor.shutdown(wait=False)
+
+        return {name: futures[name].result() for name in self.deps}
+
+    def critical_path(self):
+        """Chain of tasks that determined the total duration, first to last."""
+        if not self.timings:
+            return []
+        name = max(self.timings, key=lambda n: self.timings[n][1])
+        path = [name]
+        while self.deps.get(name):
+            name = max(self.deps[name], key=lambda n: self.timings.get(n, (0, 0))[1])
+            path.append(name)
+        return path[::-1]
+
+    def report(self):
+        """Per-task timings, total wall time, serial time and critical path (seconds)."""
+        durations = {name: end - start for name, (start, end) in self.timings.items()}
+        path = self.critical_path()
+        return {
+            "wall_seconds": max((end for _, end in self.timings.values()), default=0.0),
+            "serial_seconds": sum(durations.values()),
+            "tasks": {
+                name: {"start": start, "end": end, "duration": durations[name]}
+                for name, (start, end) in self.timings.items()
+            },
+            "critical_path": path,
+            "critical_path_seconds": sum(durations[name] for name in path),
+        }
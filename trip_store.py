@@ -0,0 +1,161 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+
+from trip_cache import CACHE_DIR, normalize_query
+
+# Histórico de viagens geradas
+TRIP_STORE_PATH = os.getenv("TRIP_STORE_PATH", os.path.join(CACHE_DIR, "trips.sqlite"))
+
+_lock = threading.Lock()
+_trip_store = None
+
+
+def interests_hash(interests):
+    """Hash of the normalized interests, so rewording case/spacing still matches."""
+    return hashlib.sha256(normalize_query(interests).encode("utf-8")).hexdigest()[:16]
+
+
+class TripStore:
+    """SQLite (WAL) history of generated trips.
+
+    Each trip keeps its inputs, timings and token usage, plus one row per
+    report with the zlib-compressed markdown and the PDF path. Trips are
+    indexed by destination, dates and interests hash, so identical
+    requests can be served without running the crew.
+    """
+
+    def __init__(self, path=TRIP_STORE_PATH):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS trips (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                from_city TEXT NOT NULL,
+                destination_city TEXT NOT NULL,
+                destination_key TEXT NOT NULL,
+                date_from TEXT NOT NULL,
+                date_to TEXT NOT NULL,
+                interests TEXT NOT NULL,
+                interests_hash TEXT NOT NULL,
+                workspace TEXT,
+                timings TEXT,
+                token_usage TEXT,
+                created_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_trips_destination ON trips(destination_key, created_at);
+            CREATE INDEX IF NOT EXISTS idx_trips_dates ON trips(date_from, date_to);
+            CREATE INDEX IF NOT EXISTS idx_trips_lookup
+                ON trips(destination_key, date_from, date_to, interests_hash);
+            CREATE TABLE IF NOT EXISTS reports (
+                trip_id INTEGER NOT NULL REFERENCES trips(id) ON DELETE CASCADE,
+                name TEXT NOT NULL,
+                markdown BLOB NOT NULL,
+                pdf_path TEXT,
+                PRIMARY KEY (trip_id, name)
+            );
+            """
+        )
+        self._conn.commit()
+        self._lock = threading.Lock()
+
+    def add(self, inputs, reports, pdf_paths=None, workspace=None, timings=None, token_usage=None):
+        """Stores a trip; ``reports`` maps report names to markdown. Returns the trip id."""
+        pdf_paths = pdf_paths or {}
+        with self._lock:
+            cursor = self._conn.execute(
+                """INSERT INTO trips (from_city, destination_city, destination_key, date_from, date_to,
+                                      interests, interests_hash, workspace, timings, token_usage, created_at)
+                   VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+                (
+                    inputs["from_city"],
+                    inputs["destination_city"],
+                    normalize_query(inputs["destination_city"]),
+                    inputs["date_from"],
+                    inputs["date_to"],
+                    inputs["interests"],
+                    interests_hash(inputs["interests"]),
+                    workspace,
+                    json.dumps(timings, default=str) if timings else None,
+                    json.dumps(token_usage, default=str) if token_usage else None,
+                    time.time(),
+                ),
+            )
+            trip_id = cursor.lastrowid
+            self._conn.executemany(
+                "INSERT INTO reports (trip_id, name, markdown, pdf_path) VALUES (?, ?, ?, ?)",
+                [
+                    (trip_id, name, zlib.compress(markdown.encode("utf-8"), 6), pdf_paths.get(name))
+                    for name, markdown in reports.items()
+                ],
+            )
+            self._conn.commit()
+        return trip_id
+
+    def _trip_rows(self, query, params):
+        with self._lock:
+            cursor = self._conn.execute(query, params)
+            names = [c[0] for c in cursor.description]
+            rows = cursor.fetchall()
+        trips = []
+        for row in rows:
+            trip = dict(zip(names, row))
+            for field in ("timings", "token_usage"):
+                if field in trip:
+                    trip[field] = json.loads(trip[field]) if trip[field] else None
+            trips.append(trip)
+        return trips
+
+    def find_identical(self, inputs):
+        """Most recent trip with the same origin, destination, dates and interests, or None."""
+        trips = self._trip_rows(
+            """SELECT * FROM trips
+               WHERE destination_key = ? AND date_from = ? AND date_to = ? AND interests_hash = ?
+               ORDER BY created_at DESC""",
+            (
+                normalize_query(inputs["destination_city"]),
+                inputs["date_from"],
+                inputs["date_to"],
+                interests_hash(inputs["interests"]),
+            ),
+        )
+        origin = normalize_query(inputs["from_city"])
+        return next((t for t in trips if normalize_query(t["from_city"]) == origin), None)
+
+    def recent(self, limit=20, destination=None):
+        """Latest trips (without reports), optionally filtered by destination."""
+        columns = "id, from_city, destination_city, date_from, date_to, interests, workspace, created_at"
+        if destination:
+            return self._trip_rows(
+                f"SELECT {columns} FROM trips WHERE destination_key = ? ORDER BY created_at DESC LIMIT ?",
+                (normalize_query(destination), limit),
+            )
+        return self._trip_rows(f"SELECT {columns} FROM trips ORDER BY created_at DESC LIMIT ?", (limit,))
+
+    def get(self, trip_id):
+        trips = self._trip_rows("SELECT * FROM trips WHERE id = ?", (trip_id,))
+        return trips[0] if trips else None
+
+    def reports(self, trip_id):
+        """Returns ``{name: (markdown, pdf_path)}`` for a trip."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT name, markdown, pdf_path FROM reports WHERE trip_id = ?", (trip_id,)
+            ).fetchall()
+        return {name: (zlib.decompress(blob).decode("utf-8"), pdf_path) for name, blob, pdf_path in rows}
+
+
+def get_trip_store():
+    """Returns the process-wide trip history store."""
+    global _trip_store
+    with _lock:
+        if _trip_store is None:
+            _trip_store = TripStore()
+    return _trip_store
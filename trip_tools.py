@@ -1,17 +1,333 @@
+import contextvars
+import json
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urldefrag
+
 from crewai.tools import tool
 from langchain_tavily import TavilySearch
-from langchain_community.tools import DuckDuckGoSearchResults
+from langchain_community.utilities import DuckDuckGoSearchAPIWrapper
+
+from trip_cache import CACHE_DIR, DiskCache, env_flag, make_key, normalize_query
+from trip_calc import CalculationError, aggregate_costs, evaluate
+from trip_evidence import record_evidence, search_evidence
+from trip_hedge import HedgedSearch, SearchProvider
+from trip_ratelimit import get_limiter
+from trip_tracing import annotate, count, span
+
+# Cache de pesquisas (desative com TRIP_SEARCH_CACHE=0)
+SEARCH_CACHE_ENABLED = env_flag("TRIP_SEARCH_CACHE")
+SEARCH_CACHE_TTL = int(os.getenv("TRIP_SEARCH_CACHE_TTL", 24 * 3600))
+SEARCH_CACHE_VOLATILE_TTL = int(os.getenv("TRIP_SEARCH_CACHE_VOLATILE_TTL", 3600))
+SEARCH_CACHE_MAX_ENTRIES = int(os.getenv("TRIP_SEARCH_CACHE_MAX_ENTRIES", 5000))
+
+TAVILY_MAX_RESULTS = 4
+
+# Pesquisas em lote
+SEARCH_BATCH_MAX_QUERIES = int(os.getenv("TRIP_SEARCH_BATCH_MAX_QUERIES", 6))
+SEARCH_POOL_WORKERS = int(os.getenv("TRIP_SEARCH_POOL_WORKERS", 4))
+
+# Pesquisa com hedge Tavily -> DuckDuckGo (desative com TRIP_SEARCH_HEDGE=0).
+# Sem TRIP_SEARCH_HEDGE_DELAY o atraso se adapta ao p95 de latência do Tavily.
+SEARCH_HEDGE_ENABLED = env_flag("TRIP_SEARCH_HEDGE")
+SEARCH_HEDGE_DELAY = os.getenv("TRIP_SEARCH_HEDGE_DELAY")
+TAVILY_TIMEOUT = float(os.getenv("TRIP_TAVILY_TIMEOUT", 15))
+DUCKDUCKGO_TIMEOUT = float(os.getenv("TRIP_DUCKDUCKGO_TIMEOUT", 10))
+
+# Queries whose answers go stale quickly get a shorter TTL
+_VOLATILE_QUERY = re.compile(
+    r"\b(clima|previsao|tempo|weather|forecast|evento|eventos|event|events|hoje|today|agora|noticia|noticias|news)\b"
+)
+
+_lock = threading.Lock()
+_search_cache = None
+_tavily_client = None
+_duckduckgo_client = None
+_search_pool = None
+_hedged_search = None
+
+
+def get_search_cache():
+    """Returns the process-wide search cache, or None when caching is disabled."""
+    global _search_cache
+    if not SEARCH_CACHE_ENABLED:
+        return None
+    with _lock:
+        if _search_cache is None:
+            _search_cache = DiskCache(
+                os.path.join(CACHE_DIR, "search.sqlite"),
+                max_entries=SEARCH_CACHE_MAX_ENTRIES,
+                default_ttl=SEARCH_CACHE_TTL,
+            )
+    return _search_cache
+
+
+def get_tavily_client():
+    """Returns a long-lived TavilySearch client shared by every agent."""
+    global _tavily_client
+    with _lock:
+        if _tavily_client is None:
+            _tavily_client = TavilySearch(max_results=TAVILY_MAX_RESULTS)
+    return _tavily_client
+
+
+def get_duckduckgo_client():
+    """Returns a long-lived DuckDuckGo wrapper shared by every agent."""
+    global _duckduckgo_client
+    with _lock:
+        if _duckduckgo_client is None:
+            _duckduckgo_client = DuckDuckGoSearchAPIWrapper()
+    return _duckduckgo_client
+
+
+def get_search_pool():
+    """Returns the long-lived thread pool used to fan out search queries."""
+    global _search_pool
+    with _lock:
+        if _search_pool is None:
+            _search_pool = ThreadPoolExecutor(
+                max_workers=SEARCH_POOL_WORKERS, thread_name_prefix="trip-search"
+            )
+    return _search_pool
+
+
+def search_ttl(query):
+    """TTL for a query: weather, events and news expire sooner than evergreen facts."""
+    if _VOLATILE_QUERY.search(normalize_query(query)):
+        return SEARCH_CACHE_VOLATILE_TTL
+    return SEARCH_CACHE_TTL
+
+
+def fetch_tavily(query):
+    """Uncached Tavily request over the shared client."""
+    with span("tavily", "search"):
+        return get_tavily_client().invoke(query)
+
+
+def fetch_duckduckgo(query):
+    """Uncached DuckDuckGo request, normalized to the Tavily response shape."""
+    with span("duckduckgo", "search"):
+        items = get_duckduckgo_client().results(query, max_results=4)
+    return {
+        "query": query,
+        "results": [
+            {"title": i.get("title"), "url": i.get("link"), "content": i.get("snippet")}
+            for i in items
+        ],
+    }
+
+
+# Each provider's raw fetch, rate-limit bucket and the settings its cached answers depend on
+SEARCH_PROVIDERS = {
+    "tavily": (fetch_tavily, "search", {"max_results": TAVILY_MAX_RESULTS}),
+    "duckduckgo": (fetch_duckduckgo, "duckduckgo", {"num_results": 4, "format": "results"}),
+}
+
+
+def search_cache_key(provider, query):
+    return make_key(provider, SEARCH_PROVIDERS[provider][2], normalize_query(query))
+
+
+def cached_result(provider, query):
+    """The cached answer of ``provider`` for ``query``, or None."""
+    cache = get_search_cache()
+    result = cache.get(search_cache_key(provider, query)) if cache is not None else None
+    if result is not None:
+        count("cache_hits")
+    return result
+
+
+def cache_result(provider, query, result):
+    cache = get_search_cache()
+    if cache is not None and result:
+        cache.set(search_cache_key(provider, query), result, ttl=search_ttl(query))
+
+
+def limited_fetch(provider, query):
+    """Calls a search provider under its rate-limit bucket."""
+    fetch, bucket, _ = SEARCH_PROVIDERS[provider]
+    limiter = get_limiter(bucket)
+    if limiter is None:
+        return fetch(query)
+    return limiter.call(fetch, query)
+
+
+def cached_search(provider, query):
+    """Answers ``query`` from the search cache or fetches it from ``provider``."""
+    result = cached_result(provider, query)
+    if result is None:
+        result = limited_fetch(provider, query)
+        cache_result(provider, query, result)
+    return result
+
+
+def tavily_search(query):
+    """Cached Tavily search over the shared client."""
+    return cached_search("tavily", query)
+
+
+def duckduckgo_search(query):
+    """Cached DuckDuckGo search, normalized to the Tavily response shape."""
+    return cached_search("duckduckgo", query)
+
+
+def _has_results(response):
+    return isinstance(response, dict) and bool(response.get("results"))
+
+
+def get_hedged_search():
+    """Returns the process-wide Tavily -> DuckDuckGo hedged search.
+
+    The hedge runs below the search cache, over the raw fetches, so its
+    delay follows the providers' real latency and not that of cache hits.
+    """
+    global _hedged_search
+    with _lock:
+        if _hedged_search is None:
+            _hedged_search = HedgedSearch(
+                [
+                    SearchProvider("tavily", fetch_tavily, timeout=TAVILY_TIMEOUT, limiter=get_limiter("search")),
+                    SearchProvider("duckduckgo", fetch_duckduckgo, timeout=DUCKDUCKGO_TIMEOUT,
+                                   limiter=get_limiter("duckduckgo")),
+                ],
+                hedge_delay=float(SEARCH_HEDGE_DELAY) if SEARCH_HEDGE_DELAY else None,
+                is_good=_has_results,
+            )
+    return _hedged_search
+
+
+def hedged_search(query):
+    """Cached answer of any provider, or a hedged Tavily -> DuckDuckGo fetch; returns ``(provider, result)``."""
+    for provider in SEARCH_PROVIDERS:
+        result = cached_result(provider, query)
+        if result is not None:
+            return provider, result
+    provider, result = get_hedged_search().search(query)
+    cache_result(provider, query, result)
+    return provider, result
+
+
+def web_search(query):
+    """Default search used by the agents: hedged when enabled, plain Tavily otherwise.
+
+    Results are also added to the run's evidence store, so later agents can
+    find them with ``search_previous`` without searching the web again.
+    """
+    if not SEARCH_HEDGE_ENABLED:
+        result = tavily_search(query)
+    else:
+        provider, result = hedged_search(query)
+        annotate(provider=provider)
+    record_evidence(query, result)
+    return result
+
+
+def _split_queries(queries):
+    if isinstance(queries, str):
+        queries = re.split(r"[\n;]+", queries)
+    seen = set()
+    unique = []
+    for query in queries:
+        query = str(query).strip()
+        if query and normalize_query(query) not in seen:
+            seen.add(normalize_query(query))
+            unique.append(query)
+    return unique
+
+
+def merge_search_results(responses):
+    """Merges Tavily responses into one result list, deduplicated by URL.
+
+    ``responses`` maps each query to its Tavily response. When the same page
+    shows up for several queries it is kept once, with its best score and the
+    list of queries that found it.
+    """
+    merged = {}
+    for query, response in responses.items():
+        results = response.get("results", []) if isinstance(response, dict) else []
+        for item in results:
+            url = urldefrag(item.get("url", ""))[0].rstrip("/")
+            if not url:
+                continue
+            entry = merged.get(url)
+            if entry is None:
+                merged[url] = dict(item, url=url, queries=[query])
+            else:
+                entry["queries"].append(query)
+                if item.get("score", 0) > entry.get("score", 0):
+                    entry.update(title=item.get("title"), content=item.get("content"), score=item.get("score"))
+    return sorted(merged.values(), key=lambda r: r.get("score", 0), reverse=True)
+
+
+def batch_search(queries, search=web_search):
+    """Runs several queries concurrently and returns merged, deduplicated results.
+
+    Only the first SEARCH_BATCH_MAX_QUERIES queries are searched; the rest
+    come back under ``skipped`` with a note, so the agent can send them again.
+    """
+    queries = _split_queries(queries)
+    queries, skipped = queries[:SEARCH_BATCH_MAX_QUERIES], queries[SEARCH_BATCH_MAX_QUERIES:]
+    futures = {
+        query: get_search_pool().submit(contextvars.copy_context().run, search, query)
+        for query in queries
+    }
+
+    responses = {}
+    errors = {}
+    for query, future in futures.items():
+        try:
+            responses[query] = future.result()
+        except Exception as e:
+            errors[query] = str(e)
+
+    result = {"queries": queries, "results": merge_search_results(responses)}
+    if errors:
+        result["errors"] = errors
+    if skipped:
+        result["skipped"] = skipped
+        result["note"] = (
+            f"Limite de {SEARCH_BATCH_MAX_QUERIES} consultas por chamada: as de 'skipped' não foram pesquisadas. "
+            "Faça outra chamada com elas se ainda forem necessárias."
+        )
+    return result
+
 
 class SearchTools:
+    @tool("Consultar pesquisas anteriores")
+    def search_previous(query: str = "") -> str:
+        """
+        Search the results the agents already fetched from the web for this
+        trip. Answers instantly and uses no search quota: try it first, and
+        only search the internet if nothing relevant comes back.
+        """
+        with span("search_previous", "tool", query=query) as tool_span:
+            result = search_evidence(query)
+            tool_span.set(hits=len(result["results"]), cache_hits=1 if result["results"] else 0)
+        if not result["results"]:
+            return f"Nada encontrado nas pesquisas anteriores ({result['indexed']} resultados guardados). Use a pesquisa na internet."
+        return result
+
     @tool("Pesquisa na internet")
     def search_tavily(query: str = "") -> str:
         """
         Search the web using Tavily API.
         Recommended for more structured and recent information.
         """
-        search_tavily = TavilySearch(max_results=4)
-        search_res = search_tavily.invoke(query)
-        return search_res
+        with span("search_tavily", "tool", query=query):
+            return web_search(query)
+
+    @tool("Pesquisa na internet em lote")
+    def search_tavily_batch(queries: list[str]) -> str:
+        """
+        Search the web for several queries at once using Tavily API.
+        The input is a list of independent queries (e.g. weather, safety and
+        events for the same city). Returns the merged, deduplicated results
+        in a single response. Prefer this over several separate searches.
+        """
+        with span("search_tavily_batch", "tool", queries=len(queries)):
+            return batch_search(queries)
 
     @tool("Pesquisa na internet com DuckDuckGo")
     def search_duckduckgo(query: str):
@@ -19,8 +335,8 @@ class SearchTools:
         Search the web using DuckDuckGo.
         Returns a list of search results.
         """
-        search_tool = DuckDuckGoSearchResults(num_results=4, verbose=True)
-        return search_tool.run(query)
+        with span("search_duckduckgo", "tool", query=query):
+            return duckduckgo_search(query)
 
 class CalculatorTools:
     @tool("Faça um cálculo")
@@ -30,7 +346,28 @@ class CalculatorTools:
         The input to this tool should be a mathematical
         expression, a couple examples are `200*7` or `5000/2*10`
         """
-        try:
-            return eval(operation)
-        except SyntaxError:
-            return "Erro: Sintaxe inválida"
+        with span("calculate", "tool", operation=str(operation)[:200]):
+            try:
+                return evaluate(operation)
+            except CalculationError as e:
+                return f"Erro: {e}"
+
+    @tool("Calcular custos da viagem")
+    def calculate_costs(items: list[dict], currency: str = "BRL", rates: dict | None = None) -> str:
+        """Totals every cost of the trip in a single call, instead of one
+        calculation per item and day.
+        `items` is a list of objects with: `item` (name), `unit_cost`,
+        `quantity` per day (optional, default 1), `currency` of the cost
+        (optional, e.g. "EUR") and the days it applies to, either `days`
+        (number of days or list of day numbers) or `day` (a single day).
+        Example: [{"item": "Hotel", "unit_cost": 120, "currency": "EUR", "days": 7},
+        {"item": "Museu", "unit_cost": 15, "currency": "EUR", "day": 2}].
+        Costs are converted to `currency` with a local rate table; pass
+        `rates` (value of one unit in BRL, e.g. {"EUR": 6.1}) to override it.
+        Returns the total, the total per day and the total per item.
+        """
+        with span("calculate_costs", "tool", items=len(items or [])):
+            try:
+                return json.dumps(aggregate_costs(items, currency, rates), ensure_ascii=False)
+            except CalculationError as e:
+                return f"Erro: {e}"
@@ -0,0 +1,273 @@
+import contextvars
+import json
+import os
+import tempfile
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+from trip_cache import env_flag
+
+# Rastreamento das gerações (desative com TRIP_TRACING=0)
+TRACING_ENABLED = env_flag("TRIP_TRACING")
+# Arquivo com as métricas acumuladas no formato texto do Prometheus (vazio: não grava)
+METRICS_FILE = os.getenv("TRIP_METRICS_FILE", "")
+
+# Spans of a run, saved in its workspace
+TRACE_FILE = "trace.jsonl"
+
+_current_trace = contextvars.ContextVar("trip_current_trace", default=None)
+_current_span = contextvars.ContextVar("trip_current_span", default=None)
+_totals_lock = threading.Lock()
+_totals = {}
+
+# Numeric attributes summed into the Prometheus counters
+COUNTERS = ("tokens", "retries", "cache_hits", "rate_limit_wait_seconds")
+
+
+class Span:
+    """One timed operation of a run (crew, task, agent step, tool, LLM call, PDF)."""
+
+    def __init__(self, name, kind, trace_id, parent_id=None, attributes=None, start=None):
+        self.name = name
+        self.kind = kind
+        self.trace_id = trace_id
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent_id
+        self.attributes = dict(attributes or {})
+        self.start = time.time() if start is None else start
+        self.end = None
+        self.error = None
+
+    @property
+    def duration(self):
+        return (self.end if self.end is not None else time.time()) - self.start
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def add(self, key, amount=1):
+        self.attributes[key] = self.attributes.get(key, 0) + amount
+
+    def to_dict(self):
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "kind": self.kind,
+            "start": self.start,
+            "duration": self.duration,
+            "error": self.error,
+            "attributes": self.attributes,
+        }
+
+
+class _NullSpan:
+    """Stands in for a span when nothing is being traced."""
+
+    def set(self, **attributes):
+        pass
+
+    def add(self, key, amount=1):
+        pass
+
+
+NULL_SPAN = _NullSpan()
+
+
+class Trace:
+    """Collects the finished spans of one run; safe to use from several threads."""
+
+    def __init__(self, name):
+        self.id = uuid.uuid4().hex[:16]
+        self.name = name
+        self.spans = []
+        self._lock = threading.Lock()
+
+    def add(self, span):
+        with self._lock:
+            self.spans.append(span)
+
+    def to_dicts(self):
+        with self._lock:
+            return sorted((span.to_dict() for span in self.spans), key=lambda s: s["start"])
+
+    def to_jsonl(self):
+        return "".join(json.dumps(span, ensure_ascii=False, default=str) + "\n" for span in self.to_dicts())
+
+
+@contextmanager
+def trace_run(name, **attributes):
+    """Collects the spans of a run under a root span ``name``; yields the Trace.
+
+    Worker threads started with a copy of the context (task scheduler, search
+    pool, PDF builds) add their spans to the same trace. On exit the run is
+    added to the process-wide totals exported by ``prometheus_text``.
+    """
+    if not TRACING_ENABLED:
+        yield None
+        return
+    trace = Trace(name)
+    token = _current_trace.set(trace)
+    try:
+        with span(name, "run", **attributes):
+            yield trace
+    finally:
+        _current_trace.reset(token)
+        add_totals(trace.to_dicts())
+
+
+@contextmanager
+def span(name, kind, **attributes):
+    """Times the block as a child of the current span; a no-op outside ``trace_run``."""
+    trace = _current_trace.get()
+    if trace is None:
+        yield NULL_SPAN
+        return
+    parent = _current_span.get()
+    current = Span(name, kind, trace.id, parent.span_id if parent else None, attributes)
+    token = _current_span.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        current.end = time.time()
+        _current_span.reset(token)
+        trace.add(current)
+
+
+def record_span(name, kind, duration, end=None, **attributes):
+    """Adds an already finished span, e.g. work timed in another process."""
+    trace = _current_trace.get()
+    if trace is None:
+        return
+    parent = _current_span.get()
+    end = time.time() if end is None else end
+    finished = Span(name, kind, trace.id, parent.span_id if parent else None, attributes, start=end - duration)
+    finished.end = end
+    trace.add(finished)
+
+
+def current_span():
+    return _current_span.get() or NULL_SPAN
+
+
+def annotate(**attributes):
+    """Sets attributes on the current span (no-op when not tracing)."""
+    current_span().set(**attributes)
+
+
+def count(key, amount=1):
+    """Adds to a numeric attribute of the current span (no-op when not tracing)."""
+    current_span().add(key, amount)
+
+
+def read_jsonl(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+# --------------------- AGREGAÇÃO E EXPORTAÇÃO ---------------------
+def aggregate(spans):
+    """Totals per ``(kind, name)``: count, seconds, errors and the COUNTERS attributes."""
+    totals = {}
+    for s in spans:
+        entry = totals.setdefault((s["kind"], s["name"]), dict.fromkeys(("count", "seconds", "errors") + COUNTERS, 0))
+        entry["count"] += 1
+        entry["seconds"] += s["duration"]
+        entry["errors"] += 1 if s["error"] else 0
+        for key in COUNTERS:
+            value = s["attributes"].get(key)
+            if isinstance(value, bool):
+                value = int(value)
+            if isinstance(value, (int, float)):
+                entry[key] += value
+    return totals
+
+
+def add_totals(spans):
+    """Adds a finished run to the process-wide totals (and TRIP_METRICS_FILE, if set)."""
+    with _totals_lock:
+        for key, values in aggregate(spans).items():
+            entry = _totals.setdefault(key, dict.fromkeys(values, 0))
+            for field, value in values.items():
+                entry[field] += value
+        text = prometheus_text(_totals) if METRICS_FILE else None
+    if text is not None:
+        directory = os.path.dirname(os.path.abspath(METRICS_FILE))
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".prom.tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(text)
+        os.replace(tmp_path, METRICS_FILE)
+
+
+def process_totals():
+    with _totals_lock:
+        return {key: dict(values) for key, values in _totals.items()}
+
+
+def _label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", " ")
+
+
+def prometheus_text(totals=None):
+    """Totals in the Prometheus text format; defaults to every run of this process."""
+    totals = process_totals() if totals is None else totals
+    metrics = [
+        ("trip_span_seconds", "summary", "Time spent in spans", None),
+        ("trip_span_errors_total", "counter", "Spans that raised", "errors"),
+        ("trip_span_tokens_total", "counter", "LLM tokens used", "tokens"),
+        ("trip_span_retries_total", "counter", "Calls retried after rate-limit errors", "retries"),
+        ("trip_span_cache_hits_total", "counter", "Results served from a cache", "cache_hits"),
+        ("trip_span_rate_limit_wait_seconds_total", "counter", "Time waiting for rate limiter tokens", "rate_limit_wait_seconds"),
+    ]
+    lines = []
+    for metric, metric_type, help_text, field in metrics:
+        lines.append(f"# HELP {metric} {help_text}")
+        lines.append(f"# TYPE {metric} {metric_type}")
+        for (kind, name), values in sorted(totals.items()):
+            labels = f'kind="{_label(kind)}",name="{_label(name)}"'
+            if field is None:
+                lines.append(f"{metric}_count{{{labels}}} {values['count']}")
+                lines.append(f"{metric}_sum{{{labels}}} {values['seconds']:.6f}")
+            else:
+                lines.append(f"{metric}{{{labels}}} {values[field]}")
+    return "\n".join(lines) + "\n"
+
+
+def waterfall(spans, kinds=None, limit=300):
+    """Rows for a waterfall chart: label indented by depth, start/end offsets from the run start."""
+    if not spans:
+        return []
+    by_id = {s["span_id"]: s for s in spans}
+    origin = min(s["start"] for s in spans)
+
+    def depth(s):
+        level = 0
+        while s["parent_id"] in by_id:
+            s = by_id[s["parent_id"]]
+            level += 1
+        return level
+
+    rows = []
+    seen = {}
+    for s in sorted(spans, key=lambda s: s["start"]):
+        if kinds is not None and s["kind"] not in kinds:
+            continue
+        # Repeated names (several searches, LLM calls...) get a number so each one is its own row
+        label = f"{'  ' * depth(s)}{s['name']}"
+        seen[label] = seen.get(label, 0) + 1
+        rows.append({
+            "label": label if seen[label] == 1 else f"{label} #{seen[label]}",
+            "kind": s["kind"],
+            "start": s["start"] - origin,
+            "end": s["start"] - origin + s["duration"],
+            "seconds": round(s["duration"], 3),
+            "error": s["error"] or "",
+        })
+    return rows[:limit]
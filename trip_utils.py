@@ -1,65 +1,170 @@
-import streamlit as st
 import sys
+import os
+import contextvars
+import glob
+import threading
+import time
+from collections import OrderedDict
 from contextlib import contextmanager
-from io import StringIO
 import re
 
-class StreamlitProcessOutput:
-    def __init__(self, container):
-        self.container = container
-        self.output_text = ""
-        self.seen_lines = set()
+# Memória da deduplicação, ritmo de gravação do log e por quantos dias os logs são mantidos
+LOG_DEDUP_ENTRIES = int(os.getenv("TRIP_LOG_DEDUP_ENTRIES", 5000))
+LOG_FLUSH_SECONDS = float(os.getenv("TRIP_LOG_FLUSH_SECONDS", 0.5))
+LOG_RETENTION_DAYS = float(os.getenv("TRIP_LOG_RETENTION_DAYS", 7))
+
+# ANSI escape codes and LiteLLM debug messages
+_ANSI_ESCAPE = re.compile(r'\x1B(?:[@-Z\\-_]|\[[0-?]*[ -/]*[@-~])')
+_NOISE_PREFIXES = ('LiteLLM.Info:', 'Provider List:')
+
+# Where the current context's prints go (None: the real stdout)
+_output_target = contextvars.ContextVar("trip_output_target", default=None)
+
+class LogFileOutput:
+    """Appends cleaned, deduplicated log lines to a file.
+
+    Writes cost the same per line however long the run is: duplicates are
+    detected with a bounded LRU of line hashes, and the file is flushed at
+    most every ``flush_interval`` seconds, so readers polling its tail
+    (``JobManager.log_tail``) see the lines shortly after they are printed.
+    """
+
+    def __init__(self, path, dedup_entries=LOG_DEDUP_ENTRIES, flush_interval=LOG_FLUSH_SECONDS):
+        self.path = path
+        self.dedup_entries = dedup_entries
+        self.flush_interval = flush_interval
+        self._seen = OrderedDict()
+        self._partial = ''
+        self._last_flush = time.monotonic()
+        self._file = None
+        self._lock = threading.Lock()
 
     def clean_text(self, text):
         # Remove ANSI escape codes
-        ansi_escape = re.compile(r'\x1B(?:[@-Z\\-_]|\[[0-?]*[ -/]*[@-~])')
-        text = ansi_escape.sub('', text)
+        text = _ANSI_ESCAPE.sub('', text)
 
         # Remove LiteLLM debug messages
-        if text.strip().startswith('LiteLLM.Info:') or text.strip().startswith('Provider List:'):
+        if text.strip().startswith(_NOISE_PREFIXES):
             return None
-
-        # Clean up the formatting
-        #text = text.replace('[1m', '').replace('[95m', '').replace('[92m', '').replace('[00m', '')
         return text
 
-    def write(self, text):
-        cleaned_text = self.clean_text(text)
-        if cleaned_text is None:
-            return
+    def _is_new(self, line):
+        key = hash(line)
+        if key in self._seen:
+            self._seen.move_to_end(key)
+            return False
+        self._seen[key] = None
+        if len(self._seen) > self.dedup_entries:
+            self._seen.popitem(last=False)
+        return True
 
-        # Split into lines and process each line
-        lines = cleaned_text.split('\n')
-        new_lines = []
+    def new_lines(self, text, final=False):
+        """Returns the cleaned lines of ``text`` that were not seen recently.
 
+        A trailing partial line is kept until the rest of it arrives (or
+        ``final`` is set), so prints split over several writes stay whole.
+        """
+        lines = (self._partial + text).split('\n')
+        self._partial = '' if final else lines.pop()
+
+        new_lines = []
         for line in lines:
+            line = self.clean_text(line)
+            if line is None:
+                continue
             line = line.strip()
-            if line and line not in self.seen_lines:
-                self.seen_lines.add(line)
+            if line and self._is_new(line):
                 new_lines.append(line)
+        return new_lines
 
-        if new_lines:
-            # Add the new lines to the output
-            new_content = '\n'.join(new_lines)
-            self.output_text = f"{self.output_text}\n{new_content}" if self.output_text else new_content
+    def _append(self, lines):
+        if not lines:
+            return
+        if self._file is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            self._file = open(self.path, 'a', encoding='utf-8')
+        self._file.write('\n'.join(lines) + '\n')
+        if time.monotonic() - self._last_flush >= self.flush_interval:
+            self._flush_file()
+
+    def _flush_file(self):
+        self._last_flush = time.monotonic()
+        if self._file is not None:
+            self._file.flush()
 
-            # Update the display
-            self.container.text(self.output_text)
+    def write(self, text):
+        with self._lock:
+            self._append(self.new_lines(text))
 
     def flush(self):
-        pass
+        with self._lock:
+            self._flush_file()
+
+    def close(self):
+        """Writes the pending partial line and closes the file."""
+        with self._lock:
+            self._append(self.new_lines('', final=True))
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+class OutputRouter:
+    """Installed once as sys.stdout; sends each write to the current context's target.
+
+    Concurrent sessions and background jobs each get their own output, and
+    worker threads that copy the context (task scheduler, search pool) follow
+    the job that started them.
+    """
+
+    def __init__(self, fallback):
+        self.fallback = fallback
+
+    def write(self, text):
+        target = _output_target.get()
+        return (target or self.fallback).write(text)
+
+    def flush(self):
+        target = _output_target.get()
+        (target or self.fallback).flush()
+
+    def __getattr__(self, name):
+        return getattr(self.fallback, name)
+
+def install_output_router():
+    if not isinstance(sys.stdout, OutputRouter):
+        sys.stdout = OutputRouter(sys.stdout)
 
 @contextmanager
-def capture_output(container):
-    """Capture stdout and redirect it to a Streamlit container."""
-    string_io = StringIO()
-    output_handler = StreamlitProcessOutput(container)
-    old_stdout = sys.stdout
-    sys.stdout = output_handler
+def redirect_output(target):
+    """Redirects prints made in this context (and threads that copy it) to ``target``.
+
+    The target is closed on exit, flushing any buffered output.
+    """
+    install_output_router()
+    token = _output_target.set(target)
     try:
-        yield string_io
+        yield target
     finally:
-        sys.stdout = old_stdout
+        _output_target.reset(token)
+        close = getattr(target, 'close', None)
+        if close is not None:
+            close()
+
+def gc_logs(directory, max_age_days=LOG_RETENTION_DAYS):
+    """Deletes the ``*.log`` files in ``directory`` not written to in ``max_age_days``.
+
+    Returns the paths of the removed files.
+    """
+    cutoff = time.time() - max_age_days * 86400
+    removed = []
+    for path in glob.glob(os.path.join(directory, '*.log')):
+        try:
+            if os.path.getmtime(path) < cutoff:
+                os.remove(path)
+                removed.append(path)
+        except OSError:
+            # Removido por outro processo ao mesmo tempo
+            continue
+    return removed
 
-# Export the capture_output function
-__all__ = ['capture_output']
+__all__ = ['redirect_output', 'LogFileOutput', 'gc_logs']
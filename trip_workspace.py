@@ -0,0 +1,209 @@
+import functools
+import itertools
+import json
+import os
+import shutil
+import tempfile
+import time
+import zipfile
+from contextlib import contextmanager
+
+from trip_cache import make_key, process_alive
+
+# Pasta das gerações e cota de disco (MB) para as antigas
+WORKSPACES_DIR = os.getenv("TRIP_WORKSPACES_DIR", os.path.join(os.getcwd(), "viagem"))
+WORKSPACES_QUOTA_MB = int(os.getenv("TRIP_WORKSPACES_QUOTA_MB", 500))
+# Arquivos baixados mantidos em memória, compartilhados por todas as sessões
+DOWNLOAD_CACHE_ENTRIES = int(os.getenv("TRIP_DOWNLOAD_CACHE_ENTRIES", 8))
+
+ACTIVE_MARKER = ".active"
+MANIFEST = "inputs.json"
+BUNDLE = "roteiro_completo.zip"
+# Active markers older than this (or whose process is gone) belong to a run that died
+STALE_ACTIVE_SECONDS = 6 * 3600
+
+
+def draft_file(md_file):
+    """Hidden workspace file holding the streamed draft of a report while its task runs."""
+    return f".{md_file}.draft"
+
+
+class Workspace:
+    """Directory holding the outputs of one trip generation.
+
+    The directory name is the hash of the trip inputs, so identical requests
+    map to the same workspace and different ones never share files. A run
+    takes the workspace with ``claim``, which hands out a numbered sibling
+    (``<hash>-2``, ...) while another run holds it. Every write goes to a
+    temporary file first and is moved into place atomically.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.id = os.path.basename(path)
+
+    @classmethod
+    def for_inputs(cls, inputs, root=WORKSPACES_DIR):
+        workspace = cls(os.path.join(root, make_key("workspace", inputs)[:16]))
+        os.makedirs(workspace.path, exist_ok=True)
+        if not workspace.exists(MANIFEST):
+            workspace.write_text(MANIFEST, json.dumps(inputs, ensure_ascii=False, indent=2, default=str))
+        return workspace
+
+    @classmethod
+    @contextmanager
+    def claim(cls, inputs, root=WORKSPACES_DIR):
+        """Yields a workspace for ``inputs`` that no other run is using, marked active meanwhile.
+
+        The inputs' own workspace when it is free, otherwise the first free
+        numbered sibling; the marker is created atomically, so two runs
+        never get the same directory.
+        """
+        key = make_key("workspace", inputs)[:16]
+        for number in itertools.count(1):
+            workspace = cls(os.path.join(root, key if number == 1 else f"{key}-{number}"))
+            os.makedirs(workspace.path, exist_ok=True)
+            if workspace._mark_active():
+                break
+        try:
+            if not workspace.exists(MANIFEST):
+                workspace.write_text(MANIFEST, json.dumps(inputs, ensure_ascii=False, indent=2, default=str))
+            yield workspace
+        finally:
+            os.remove(workspace.file(ACTIVE_MARKER))
+            os.utime(workspace.path)
+
+    def _mark_active(self):
+        """Creates the active marker unless a live run holds it; returns whether it did."""
+        marker = self.file(ACTIVE_MARKER)
+        for _ in range(2):
+            try:
+                fd = os.open(marker, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            except FileExistsError:
+                if self.in_use():
+                    return False
+                # Marcador de uma execução que morreu: é removido e a criação é tentada de novo
+                try:
+                    os.remove(marker)
+                except FileNotFoundError:
+                    pass
+                continue
+            with os.fdopen(fd, "w") as f:
+                f.write(str(os.getpid()))
+            return True
+        return False
+
+    def in_use(self):
+        """True while a live run holds the workspace's active marker."""
+        marker = self.file(ACTIVE_MARKER)
+        try:
+            age = time.time() - os.path.getmtime(marker)
+            with open(marker, "r") as f:
+                pid = f.read().strip()
+        except OSError:
+            return False
+        if age >= STALE_ACTIVE_SECONDS:
+            return False
+        # Marcador ainda sem pid: acabou de ser criado
+        return not pid.isdigit() or process_alive(int(pid))
+
+    def file(self, name):
+        return os.path.join(self.path, name)
+
+    def exists(self, name):
+        return os.path.exists(self.file(name))
+
+    def inputs(self):
+        return json.loads(self.read_text(MANIFEST))
+
+    def read_text(self, name):
+        with open(self.file(name), "r", encoding="utf-8") as f:
+            return f.read()
+
+    @contextmanager
+    def atomic_file(self, name):
+        """Yields a temporary path; on success it replaces ``name`` in one step."""
+        fd, tmp_path = tempfile.mkstemp(dir=self.path, prefix=f".{name}.", suffix=".tmp")
+        os.close(fd)
+        try:
+            yield tmp_path
+            os.replace(tmp_path, self.file(name))
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def write_text(self, name, text):
+        with self.atomic_file(name) as tmp_path:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(text)
+
+    def bundle(self, names, bundle_name=BUNDLE):
+        """Zip of the ``names`` that exist, rebuilt only when one of them is newer; returns its path.
+
+        Each file is compressed in chunks straight from disk, so building the
+        bundle never holds a whole report in memory.
+        """
+        sources = [name for name in names if self.exists(name)]
+        target = self.file(bundle_name)
+        if os.path.exists(target) and all(
+            os.path.getmtime(self.file(name)) <= os.path.getmtime(target) for name in sources
+        ):
+            return target
+        with self.atomic_file(bundle_name) as tmp_path:
+            with zipfile.ZipFile(tmp_path, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+                for name in sources:
+                    archive.write(self.file(name), arcname=name)
+        return target
+
+
+@functools.lru_cache(maxsize=DOWNLOAD_CACHE_ENTRIES)
+def _read_bytes(path, mtime_ns, size):
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def read_bytes(path):
+    """Contents of a file for download, cached by path, mtime and size across sessions."""
+    stat = os.stat(path)
+    return _read_bytes(path, stat.st_mtime_ns, stat.st_size)
+
+
+def list_workspaces(root=WORKSPACES_DIR):
+    """Workspaces under ``root``, most recently used first."""
+    if not os.path.isdir(root):
+        return []
+    workspaces = [
+        Workspace(entry.path) for entry in os.scandir(root)
+        if entry.is_dir() and os.path.exists(os.path.join(entry.path, MANIFEST))
+    ]
+    return sorted(workspaces, key=lambda w: os.path.getmtime(w.path), reverse=True)
+
+
+def _size(path):
+    return sum(entry.stat().st_size for entry in os.scandir(path) if entry.is_file())
+
+
+def gc_workspaces(root=WORKSPACES_DIR, quota_mb=WORKSPACES_QUOTA_MB, keep=()):
+    """Deletes the least recently used workspaces until ``root`` fits in the quota.
+
+    Workspaces in ``keep`` and those in use by a live run are never removed.
+    Returns the ids of the removed workspaces.
+    """
+    workspaces = list_workspaces(root)
+    sizes = {w.path: _size(w.path) for w in workspaces}
+    total = sum(sizes.values())
+    quota = quota_mb * 1024 * 1024
+    keep = {os.path.abspath(p) for p in keep}
+    removed = []
+
+    for workspace in reversed(workspaces):
+        if total <= quota:
+            break
+        if os.path.abspath(workspace.path) in keep:
+            continue
+        if workspace.in_use():
+            continue
+        shutil.rmtree(workspace.path, ignore_errors=True)
+        total -= sizes[workspace.path]
+        removed.append(workspace.id)
+    return removed